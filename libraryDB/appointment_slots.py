@@ -0,0 +1,83 @@
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timedelta
+
+WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+
+
+class IntervalSet:
+    """
+    Half-open [start, end) intervals sorted by start, plus the running maximum
+    of their end times. Because that maximum never decreases, both "does
+    anything overlap [a, b)?" and "where does the first interval reaching past
+    a sit?" are binary searches, even when intervals overlap each other.
+    """
+
+    def __init__(self, intervals=()):
+        self._intervals = sorted(intervals)
+        self._starts  = [s for s, _ in self._intervals]
+        self._max_end = []
+        self._rebuild_from(0)
+
+    def _rebuild_from(self, i):
+        del self._max_end[i:]
+        running = self._max_end[-1] if self._max_end else None
+        for _, end in self._intervals[i:]:
+            running = end if running is None or end > running else running
+            self._max_end.append(running)
+
+    def add(self, start, end):
+        i = bisect_right(self._starts, start)
+        insort(self._intervals, (start, end))
+        self._starts.insert(i, start)
+        self._rebuild_from(i)
+
+    def overlaps(self, start, end):
+        i = bisect_left(self._starts, end)      # intervals starting before `end`
+        return i > 0 and self._max_end[i - 1] > start
+
+    def gaps(self, start, end):
+        """Yield the (start, end) pieces of [start, end) not covered by any interval."""
+        cursor = start
+        i = bisect_right(self._max_end, start)  # first interval that reaches past `start`
+        while i < len(self._intervals) and self._intervals[i][0] < end:
+            s, e = self._intervals[i]
+            if s > cursor:
+                yield cursor, s
+            if e > cursor:
+                cursor = e
+            i += 1
+        if cursor < end:
+            yield cursor, end
+
+    def __len__(self):
+        return len(self._intervals)
+
+    def __iter__(self):
+        return iter(self._intervals)
+
+
+def opening_windows(hours, first_day, last_day):
+    """
+    hours: {weekday: (open_time, close_time)} from OperatingTime.
+    Returns the [open, close) datetimes of every open day in first_day..last_day.
+    """
+    windows = []
+    day = first_day
+    while day <= last_day:
+        times = hours.get(WEEKDAYS[day.weekday()])
+        if times and times[1] > times[0]:
+            windows.append((datetime.combine(day, times[0]), datetime.combine(day, times[1])))
+        day += timedelta(days=1)
+    return windows
+
+
+def free_windows(busy, windows, min_length=timedelta(0), not_before=None):
+    """Opening `windows` minus the `busy` IntervalSet, keeping pieces of at least `min_length`."""
+    free = []
+    for start, end in windows:
+        if not_before and start < not_before:
+            start = not_before
+        if start >= end:
+            continue
+        free.extend((s, e) for s, e in busy.gaps(start, end) if e - s >= min_length)
+    return free
@@ -0,0 +1,93 @@
+import hashlib
+import os
+import threading
+import time
+
+from cachetools import TLRUCache, TTLCache
+
+from metrics import metrics
+
+
+def _token_expiry(key, claims, now):
+    # Firebase ID tokens carry `exp` as epoch seconds; never keep one past that
+    return claims.get('exp', now)
+
+
+class AuthCache:
+    """
+    Caches verified Firebase ID token claims until the token's `exp` and keeps a
+    bounded LRU identity map of `User` rows keyed by firebase_uid.
+
+    User rows are stored detached from any session; callers merge them into the
+    current session with `db.session.merge(user, load=False)` (no SQL emitted).
+    """
+
+    def __init__(self, max_tokens=10000, max_users=5000, user_ttl=300):
+        self._lock   = threading.Lock()
+        self._tokens = TLRUCache(maxsize=max_tokens, ttu=_token_expiry, timer=time.time)
+        self._users  = TTLCache(maxsize=max_users, ttl=user_ttl)
+        self.token_hits   = 0
+        self.token_misses = 0
+        self.user_hits    = 0
+        self.user_misses  = 0
+
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    def verify_token(self, token, verifier):
+        key = self._key(token)
+        with self._lock:
+            claims = self._tokens.get(key)
+            if claims is not None:
+                self.token_hits += 1
+                return claims
+            self.token_misses += 1
+
+        # verify outside the lock, it may hit the network for public keys
+        claims = verifier(token)
+        with self._lock:
+            self._tokens[key] = claims
+        return claims
+
+    def get_user(self, firebase_uid, loader):
+        with self._lock:
+            user = self._users.get(firebase_uid)
+            if user is not None:
+                self.user_hits += 1
+                return user
+            self.user_misses += 1
+
+        user = loader(firebase_uid)
+        if user is not None:
+            with self._lock:
+                self._users[firebase_uid] = user
+        return user
+
+    def invalidate_user(self, firebase_uid):
+        with self._lock:
+            self._users.pop(firebase_uid, None)
+
+    def clear(self):
+        with self._lock:
+            self._tokens.clear()
+            self._users.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'token_hits':    self.token_hits,
+                'token_misses':  self.token_misses,
+                'tokens_cached': len(self._tokens),
+                'user_hits':     self.user_hits,
+                'user_misses':   self.user_misses,
+                'users_cached':  len(self._users),
+            }
+
+
+auth_cache = AuthCache(
+    max_tokens=int(os.environ.get('AUTH_TOKEN_CACHE_SIZE', 10000)),
+    max_users=int(os.environ.get('AUTH_USER_CACHE_SIZE', 5000)),
+    user_ttl=int(os.environ.get('AUTH_USER_CACHE_TTL', 300)),
+)
+metrics.register('auth_cache', auth_cache.stats)
@@ -0,0 +1,263 @@
+import bisect
+import heapq
+import itertools
+import re
+import threading
+import time
+
+from sqlalchemy import BigInteger, cast, func, inspect, text
+from sqlalchemy.dialects import mysql
+
+TOKEN_RE = re.compile(r"[0-9a-z]+")
+ISBN_RE  = re.compile(r"^(?:\d{9}[\dx]|\d{13})$")
+
+TITLE_WEIGHT  = 2.0
+AUTHOR_WEIGHT = 1.0
+PREFIX_FACTOR = 0.5     # a prefix hit counts half of an exact token hit
+
+
+def tokenize(value):
+    return TOKEN_RE.findall((value or '').lower())
+
+
+def normalize_isbn(value):
+    """Return the bare ISBN-10/13 if `value` looks like one, else None."""
+    candidate = re.sub(r"[\s-]", "", (value or '').lower())
+    return candidate.upper() if ISBN_RE.match(candidate) else None
+
+
+def isbn_key(value):
+    """Form used to compare ISBNs stored or requested with or without hyphens."""
+    value = (value or '').strip()
+    return normalize_isbn(value) or value
+
+
+class InvertedIndex:
+    """
+    In-process inverted index over book titles and authors, used when the
+    database has no full-text engine (SQLite). Every query token must match,
+    either exactly or as a prefix of an indexed term (typeahead).
+    """
+
+    def __init__(self):
+        self._lock     = threading.RLock()
+        self._postings = {}      # term -> {book_id: weight}
+        self._docs     = {}      # book_id -> set(terms)
+        self._vocab    = []
+        self._dirty    = False
+        self.built_at  = None
+
+    def __len__(self):
+        return len(self._docs)
+
+    def add(self, book_id, title, author):
+        weights = {}
+        for term in tokenize(title):
+            weights[term] = weights.get(term, 0.0) + TITLE_WEIGHT
+        for term in tokenize(author):
+            weights[term] = weights.get(term, 0.0) + AUTHOR_WEIGHT
+
+        with self._lock:
+            self._remove(book_id)
+            for term, weight in weights.items():
+                self._postings.setdefault(term, {})[book_id] = weight
+            self._docs[book_id] = set(weights)
+            self._dirty = True
+
+    def remove(self, book_id):
+        with self._lock:
+            self._remove(book_id)
+
+    def _remove(self, book_id):
+        for term in self._docs.pop(book_id, ()):
+            posting = self._postings.get(term)
+            if posting is not None:
+                posting.pop(book_id, None)
+                if not posting:
+                    del self._postings[term]
+                    self._dirty = True
+
+    def rebuild(self, rows):
+        """rows: iterable of (book_id, title, author)."""
+        with self._lock:
+            self._postings = {}
+            self._docs     = {}
+            for book_id, title, author in rows:
+                self.add(book_id, title, author)
+            self._refresh_vocab()
+            self.built_at = time.monotonic()
+
+    def expire(self):
+        """Force a full rebuild before the next search."""
+        self.built_at = None
+
+    def _refresh_vocab(self):
+        if self._dirty:
+            self._vocab = sorted(self._postings)
+            self._dirty = False
+
+    def _expand(self, token):
+        # every term with the prefix: capping the expansion would drop matches from the total
+        start = bisect.bisect_left(self._vocab, token)
+        for term in itertools.islice(self._vocab, start, None):
+            if not term.startswith(token):
+                break
+            yield term
+
+    def search(self, query, limit=None):
+        """Return [(book_id, score)] ranked best first, ties broken by book_id."""
+        scores = self._score(query)
+        key = lambda item: (-item[1], item[0])
+        if limit is not None:
+            return heapq.nsmallest(limit, scores.items(), key=key)
+        return sorted(scores.items(), key=key)
+
+    def search_page(self, query, offset, limit):
+        """Return (total_matches, [(book_id, score)]) for one page of results."""
+        scores = self._score(query)
+        top = heapq.nsmallest(offset + limit, scores.items(), key=lambda item: (-item[1], item[0]))
+        return len(scores), top[offset:]
+
+    def search_after(self, query, after, limit):
+        """
+        Keyset variant of search_page: results strictly after the (score, book_id)
+        pair `after` (or from the top when None). Returns (total_matches, results);
+        raises ValueError for a malformed `after`.
+        """
+        scores = self._score(query)
+        key = lambda item: (-item[1], item[0])
+        items = scores.items()
+        if after is not None:
+            if len(after) != 2 or not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in after):
+                raise ValueError('Invalid cursor')
+            bound = (-after[0], after[1])
+            items = [item for item in items if key(item) > bound]
+        return len(scores), heapq.nsmallest(limit, items, key=key)
+
+    def _score(self, query):
+        tokens = tokenize(query)
+        if not tokens:
+            return {}
+
+        with self._lock:
+            self._refresh_vocab()
+            scores = None
+            for token in tokens:
+                token_scores = {}
+                for term in self._expand(token):
+                    factor = 1.0 if term == token else PREFIX_FACTOR
+                    for book_id, weight in self._postings[term].items():
+                        score = weight * factor
+                        if score > token_scores.get(book_id, 0.0):
+                            token_scores[book_id] = score
+                if scores is None:
+                    scores = token_scores
+                else:
+                    scores = {b: s + token_scores[b] for b, s in scores.items() if b in token_scores}
+                if not scores:
+                    return {}
+        return scores
+
+
+def mysql_boolean_query(query):
+    # every token required, every token a prefix: "+data* +struct*"
+    return ' '.join(f'+{token}*' for token in tokenize(query))
+
+
+def postgres_tsquery(query):
+    return ' & '.join(f'{token}:*' for token in tokenize(query))
+
+
+def fulltext_score(dialect, title_col, author_col, query):
+    """SQL relevance expression for the dialect's full-text engine, or None."""
+    if dialect == 'mysql':
+        return mysql.match(title_col, author_col, against=mysql_boolean_query(query)).in_boolean_mode()
+    if dialect == 'postgresql':
+        document = func.to_tsvector('simple', func.coalesce(title_col, '') + ' ' + func.coalesce(author_col, ''))
+        return func.ts_rank(document, func.to_tsquery('simple', postgres_tsquery(query)))
+    return None
+
+
+def fulltext_rank(dialect, title_col, author_col, query):
+    """
+    fulltext_score scaled to an integer, or None. Ordering and seeking on it
+    is stable across pages: a float score does not survive a JSON cursor
+    exactly, so the seek could repeat or skip rows.
+    """
+    score = fulltext_score(dialect, title_col, author_col, query)
+    return None if score is None else cast(score * 1_000_000, BigInteger)
+
+
+def fulltext_match(dialect, title_col, author_col, query):
+    if dialect == 'mysql':
+        return fulltext_score(dialect, title_col, author_col, query) > 0
+    if dialect == 'postgresql':
+        document = func.to_tsvector('simple', func.coalesce(title_col, '') + ' ' + func.coalesce(author_col, ''))
+        return document.op('@@')(func.to_tsquery('simple', postgres_tsquery(query)))
+    return None
+
+
+def ensure_search_indexes(engine):
+    """Create the full-text index on book(title, author) if the engine supports one."""
+    dialect = engine.dialect.name
+    existing = {ix['name'] for ix in inspect(engine).get_indexes('book')}
+    with engine.begin() as conn:
+        if dialect == 'mysql' and 'ix_book_fulltext' not in existing:
+            conn.execute(text("CREATE FULLTEXT INDEX ix_book_fulltext ON book (title, author)"))
+        elif dialect == 'postgresql' and 'ix_book_fulltext' not in existing:
+            conn.execute(text(
+                "CREATE INDEX ix_book_fulltext ON book USING gin "
+                "(to_tsvector('simple', coalesce(title, '') || ' ' || coalesce(author, '')))"
+            ))
+
+
+if __name__ == '__main__':
+    # Benchmark: ILIKE-style triple scan vs the inverted index on a synthetic catalogue.
+    #   python book_search.py [n_books]
+    import random
+    import sqlite3
+    import sys
+
+    n_books = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    random.seed(42)
+    words = ['data', 'structures', 'algorithms', 'introduction', 'principles', 'economics', 'agriculture',
+             'soil', 'science', 'education', 'teaching', 'mathematics', 'statistics', 'business', 'management',
+             'accounting', 'biology', 'chemistry', 'physics', 'programming', 'python', 'networks', 'systems',
+             'analysis', 'design', 'modern', 'applied', 'advanced', 'south', 'african', 'history', 'law']
+    surnames = ['Mokoena', 'Nkosi', 'Dlamini', 'Smith', 'Naidoo', 'Botha', 'Khumalo', 'Sithole', 'Van Wyk',
+                'Mahlangu', 'Zulu', 'Pillay', 'Jones', 'Ndlovu', 'Mthembu', 'Brown']
+
+    conn = sqlite3.connect(':memory:')
+    conn.execute("CREATE TABLE book (book_id INTEGER PRIMARY KEY, isbn TEXT UNIQUE, title TEXT, author TEXT)")
+    rows = []
+    for i in range(1, n_books + 1):
+        title  = ' '.join(random.sample(words, random.randint(2, 5))).title()
+        author = f"{random.choice('ABCDEFGHJKLMNPRSTZ')}. {random.choice(surnames)}"
+        rows.append((i, f"978{i:010d}", title, author))
+    conn.executemany("INSERT INTO book VALUES (?, ?, ?, ?)", rows)
+    conn.commit()
+
+    start = time.perf_counter()
+    index = InvertedIndex()
+    index.rebuild(conn.execute("SELECT book_id, title, author FROM book"))
+    print(f"built index over {len(index):,} books in {time.perf_counter() - start:.2f}s")
+
+    queries = ['data', 'data struct', 'intro', 'nkosi', 'soil science', 'pyth', 'african hist', 'zzz']
+    for q in queries:
+        start = time.perf_counter()
+        like = f"%{q}%"
+        scanned = conn.execute(
+            "SELECT book_id FROM book WHERE isbn LIKE ? OR title LIKE ? OR author LIKE ? LIMIT 10",
+            (like, like, like),
+        ).fetchall()
+        counted = conn.execute(
+            "SELECT COUNT(*) FROM book WHERE isbn LIKE ? OR title LIKE ? OR author LIKE ?",
+            (like, like, like),
+        ).fetchone()[0]
+        ilike_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        total, ranked = index.search_page(q, 0, 10)
+        index_ms = (time.perf_counter() - start) * 1000
+        print(f"{q!r:16} ilike {ilike_ms:8.2f} ms ({counted:>7,} rows)   "
+              f"index {index_ms:8.2f} ms ({total:>7,} ranked)")
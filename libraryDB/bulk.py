@@ -0,0 +1,58 @@
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+
+def upsert(session, model, rows, conflict_columns, update_columns=()):
+    """
+    Multi-row INSERT that updates `update_columns` (or does nothing) when a row
+    collides on the unique key `conflict_columns`. `model` is a mapped class or
+    a Table; `rows` are dicts with the same keys.
+
+    The statement is executed with `rows` as executemany parameters, so it is
+    compiled once and cached instead of once per distinct batch size; the
+    drivers still send the rows as multi-row VALUES batches.
+
+    `update_columns` is either a list of column names to overwrite with the
+    incoming values, or a callable taking the incoming-row accessor
+    (`inserted` / `excluded`) and returning an ordered dict of
+    column -> expression. Keep the order meaningful: MySQL applies the
+    assignments left to right, so a column read by a later expression must be
+    assigned after it.
+    """
+    if not rows:
+        return None
+    table = getattr(model, '__table__', model)
+    dialect = session.get_bind().dialect.name
+
+    def assignments(new):
+        if callable(update_columns):
+            return list(update_columns(new).items())
+        return [(c, new[c]) for c in update_columns]
+
+    if dialect == 'mysql':
+        stmt = mysql.insert(table)
+        # MySQL has no DO NOTHING; assigning a key column to itself is the no-op form
+        values = assignments(stmt.inserted) or [(c, stmt.inserted[c]) for c in conflict_columns[:1]]
+        return session.execute(stmt.on_duplicate_key_update(values), rows)
+
+    if dialect in ('postgresql', 'sqlite'):
+        insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        stmt = insert(table)
+        values = assignments(stmt.excluded)
+        if values:
+            stmt = stmt.on_conflict_do_update(index_elements=list(conflict_columns), set_=dict(values))
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=list(conflict_columns))
+        return session.execute(stmt, rows)
+
+    raise NotImplementedError(f'upsert is not supported on {dialect}')
+
+
+def chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
@@ -0,0 +1,109 @@
+import csv
+import io
+import json
+import os
+import zipfile
+
+from book_search import isbn_key
+
+FORMATS = ('csv', 'jsonl')
+MAX_REPORTED_ERRORS = 1000
+
+
+def detect_format(filename, explicit=None):
+    fmt = (explicit or os.path.splitext(filename or '')[1].lstrip('.')).lower()
+    if fmt in ('ndjson', 'json'):
+        fmt = 'jsonl'
+    if fmt not in FORMATS:
+        raise ValueError(f"unsupported format {fmt!r}; use one of {FORMATS}")
+    return fmt
+
+
+def iter_records(binary_stream, fmt):
+    """
+    Stream (line_no, record_or_error) pairs out of a CSV or JSONL byte stream
+    without reading it all into memory. Malformed lines yield a ValueError
+    instead of a record so one bad row never stops the import.
+    """
+    text = io.TextIOWrapper(binary_stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for record in reader:
+            yield reader.line_num, {(k or '').strip().lower(): v for k, v in record.items()}
+    else:
+        for line_no, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield line_no, ValueError(f'invalid JSON: {e}')
+                continue
+            if not isinstance(record, dict):
+                yield line_no, ValueError('each line must be a JSON object')
+                continue
+            yield line_no, {str(k).strip().lower(): v for k, v in record.items()}
+
+
+def _text(record, key):
+    value = record.get(key)
+    return str(value).strip() if value is not None else ''
+
+
+def parse_book(record):
+    """Validate one raw record into the columns add_book would store."""
+    isbn   = _text(record, 'isbn')
+    title  = _text(record, 'title')
+    author = _text(record, 'author')
+    if not isbn:
+        raise ValueError('ISBN is required')
+    if not title:
+        raise ValueError('Title is required')
+    if not author:
+        raise ValueError('Author is required')
+
+    year = _text(record, 'year')
+    if year and not year.isdigit():
+        raise ValueError('Year must be an integer')
+
+    copies = _text(record, 'copies_total') or '1'
+    if not copies.isdigit() or int(copies) < 1:
+        raise ValueError('copies_total must be a positive integer')
+
+    return {
+        'isbn':             isbn,
+        'isbn_key':         isbn_key(isbn),
+        'title':            title,
+        'author':           author,
+        'publisher':        _text(record, 'publisher') or None,
+        'year':             int(year) if year else None,
+        'copies_total':     int(copies),
+        'copies_available': int(copies),
+    }, _text(record, 'cover') or None
+
+
+class CoverArchive:
+    """Looks up cover images in an optional zip, by explicit name or by ISBN."""
+
+    EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+    def __init__(self, path):
+        self._zip = zipfile.ZipFile(path) if path else None
+        self._names = {}
+        if self._zip:
+            for name in self._zip.namelist():
+                self._names.setdefault(os.path.basename(name).lower(), name)
+
+    def find(self, isbn, cover_name=None):
+        if not self._zip:
+            return None
+        candidates = [cover_name] if cover_name else [f'{isbn}{ext}' for ext in self.EXTENSIONS]
+        for candidate in candidates:
+            name = self._names.get(os.path.basename(candidate).lower())
+            if name:
+                return self._zip.read(name)
+        return None
+
+    def close(self):
+        if self._zip:
+            self._zip.close()
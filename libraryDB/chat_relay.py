@@ -0,0 +1,302 @@
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+
+from seat_occupancy import sse_event
+
+
+class FirebaseChatBackend:
+    """Messages under chats/<library_id>/messages/<id> in the Realtime Database."""
+
+    def __init__(self, reference):
+        self._reference = reference     # firebase_admin.db.reference
+
+    def recent(self, library_id, limit):
+        ref = self._reference(f'chats/{library_id}/messages')
+        messages = ref.order_by_child('timestamp').limit_to_last(limit).get() or {}
+        return [{'id': msg_id, **payload} for msg_id, payload in messages.items()]
+
+    def write_batch(self, messages):
+        # one multi-path update per batch instead of one set() per message
+        self._reference('chats').update({
+            f"{library_id}/messages/{msg['id']}": {k: v for k, v in msg.items() if k != 'id'}
+            for library_id, msg in messages
+        })
+
+
+class LocalChatBackend:
+    """
+    Offline stand-in for load tests and development: keeps every message in
+    memory and, when `path` is set, appends them to one JSONL file per library.
+    `write_delay` simulates the round trip of a remote store.
+    """
+
+    def __init__(self, path=None, write_delay=0.0):
+        self.path = path
+        self.write_delay = write_delay
+        self.batches = 0
+        self._lock = threading.Lock()
+        self._messages = {}
+        if path:
+            os.makedirs(path, exist_ok=True)
+
+    def _file(self, library_id):
+        return os.path.join(self.path, f'library-{library_id}.jsonl')
+
+    def recent(self, library_id, limit):
+        with self._lock:
+            if library_id not in self._messages and self.path and os.path.exists(self._file(library_id)):
+                with open(self._file(library_id), encoding='utf-8') as f:
+                    self._messages[library_id] = [json.loads(line) for line in f if line.strip()]
+            return list(self._messages.get(library_id, [])[-limit:])
+
+    def write_batch(self, messages):
+        if self.write_delay:
+            time.sleep(self.write_delay)
+        with self._lock:
+            self.batches += 1
+            for library_id, msg in messages:
+                self._messages.setdefault(library_id, []).append(msg)
+                if self.path:
+                    with open(self._file(library_id), 'a', encoding='utf-8') as f:
+                        f.write(json.dumps(msg) + '\n')
+
+
+class ChatRelay:
+    """
+    Per-library chat served from memory.
+
+    The last `size` messages of each library sit in a ring buffer; reads never
+    touch the backend except to refresh a library every `ttl` seconds (which
+    also picks up messages posted through other worker processes). Posts go
+    into the buffer, out to Server-Sent Events subscribers, and onto a queue
+    that a background thread writes to the backend in batches.
+    """
+
+    def __init__(self, backend, size=50, ttl=10, flush_interval=0.5, flush_batch=500,
+                 max_pending=10000, max_queue=256):
+        self.backend        = backend
+        self.size           = size
+        self.ttl            = ttl
+        self.flush_interval = flush_interval
+        self.flush_batch    = flush_batch
+        self.max_queue      = max_queue
+        self._lock     = threading.RLock()
+        self._buffers  = {}     # library_id -> deque of messages, oldest first
+        self._loaded   = {}     # library_id -> monotonic load time
+        self._subscribers = {}  # library_id -> set(queue.Queue)
+        self._pending  = queue.Queue(maxsize=max_pending)
+        self._retry    = []
+        self._writer   = None
+        self.written      = 0
+        self.write_errors = 0
+
+    # --- reads ---
+
+    def messages(self, library_id):
+        self._refresh(library_id)
+        with self._lock:
+            return list(self._buffers.get(library_id, ()))
+
+    def _refresh(self, library_id):
+        loaded = self._loaded.get(library_id)
+        if loaded is not None and time.monotonic() - loaded <= self.ttl:
+            return
+        stored = self.backend.recent(library_id, self.size)
+        with self._lock:
+            buffer = self._buffers.setdefault(library_id, deque(maxlen=self.size))
+            known = {msg['id'] for msg in buffer}
+            new = [msg for msg in stored if msg['id'] not in known]
+            if new:
+                merged = sorted(list(buffer) + new, key=lambda msg: msg['timestamp'])
+                buffer.clear()
+                buffer.extend(merged[-self.size:])
+                if loaded is not None:
+                    for msg in new:
+                        self._publish(library_id, {'type': 'message', **msg})
+            self._loaded[library_id] = time.monotonic()
+
+    # --- writes ---
+
+    def post(self, library_id, user_id, name, text):
+        """Accept a message; raises queue.Full when the backend has fallen too far behind."""
+        msg = {
+            'id':        uuid.uuid4().hex,
+            'user_id':   user_id,
+            'name':      name,
+            'text':      text,
+            'timestamp': datetime.utcnow().isoformat(),
+        }
+        self._pending.put_nowait((library_id, msg))
+        self._ensure_writer()
+        with self._lock:
+            self._buffers.setdefault(library_id, deque(maxlen=self.size)).append(msg)
+            self._publish(library_id, {'type': 'message', **msg})
+        return msg
+
+    def _ensure_writer(self):
+        if self._writer is None or not self._writer.is_alive():
+            with self._lock:
+                if self._writer is None or not self._writer.is_alive():
+                    self._writer = threading.Thread(target=self._write_loop, name='chat-writer', daemon=True)
+                    self._writer.start()
+
+    def _write_loop(self):
+        while True:
+            batch = self._retry
+            self._retry = []
+            try:
+                if not batch:
+                    batch.append(self._pending.get(timeout=self.flush_interval))
+                # give concurrent posts a moment to join the batch
+                deadline = time.monotonic() + self.flush_interval
+                while len(batch) < self.flush_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    batch.append(self._pending.get(timeout=remaining))
+            except queue.Empty:
+                pass
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch):
+        try:
+            self.backend.write_batch(batch)
+            self.written += len(batch)
+            for _ in batch:
+                self._pending.task_done()
+        except Exception:
+            # keep the batch and try again on the next round
+            self.write_errors += 1
+            self._retry = batch
+            time.sleep(self.flush_interval)
+
+    def flush(self, timeout=5):
+        """Block until everything posted so far has reached the backend (or timeout)."""
+        deadline = time.monotonic() + timeout
+        with self._pending.all_tasks_done:
+            while self._pending.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._pending.all_tasks_done.wait(remaining)
+        return True
+
+    # --- change stream ---
+
+    def subscribe(self, library_id):
+        q = queue.Queue(maxsize=self.max_queue)
+        with self._lock:
+            self._subscribers.setdefault(library_id, set()).add(q)
+        return q
+
+    def unsubscribe(self, library_id, q):
+        with self._lock:
+            self._subscribers.get(library_id, set()).discard(q)
+
+    def sse_stream(self, library_id, heartbeat=15):
+        """
+        Server-Sent Events for one subscriber: the recent messages as a
+        'snapshot', then one event per new message. Subscribes immediately;
+        unsubscribes when the generator is closed.
+        """
+        q = self.subscribe(library_id)
+        snapshot = self.messages(library_id)
+
+        def generate():
+            try:
+                yield sse_event({'messages': snapshot}, 'snapshot')
+                while True:
+                    try:
+                        event = q.get(timeout=heartbeat)
+                    except queue.Empty:
+                        # refresh from the backend (messages posted via other workers), keep the connection alive
+                        self.messages(library_id)
+                        yield ': keep-alive\n\n'
+                        continue
+                    if event['type'] == 'resync':
+                        yield sse_event({'messages': self.messages(library_id)}, 'snapshot')
+                    else:
+                        yield sse_event({k: v for k, v in event.items() if k != 'type'}, event['type'])
+            finally:
+                self.unsubscribe(library_id, q)
+
+        return generate()
+
+    def _publish(self, library_id, event):
+        for q in list(self._subscribers.get(library_id, ())):
+            try:
+                q.put_nowait(event)
+            except queue.Full:
+                # slow consumer: tell it to resync from a fresh snapshot
+                with q.mutex:
+                    q.queue.clear()
+                q.put_nowait({'type': 'resync'})
+
+    def stats(self):
+        with self._lock:
+            return {
+                'libraries':    len(self._buffers),
+                'subscribers':  sum(len(subs) for subs in self._subscribers.values()),
+                'pending':      self._pending.unfinished_tasks,
+                'written':      self.written,
+                'write_errors': self.write_errors,
+            }
+
+
+def backend_from_env(reference=None):
+    """CHAT_BACKEND=firebase (default) or local; CHAT_LOCAL_PATH for the local JSONL files."""
+    if os.environ.get('CHAT_BACKEND', 'firebase') == 'local':
+        return LocalChatBackend(os.environ.get('CHAT_LOCAL_PATH'))
+    return FirebaseChatBackend(reference)
+
+
+if __name__ == '__main__':
+    # Offline load test: P posting threads and S SSE-style subscribers per
+    # library against the local backend with a simulated 50 ms write latency.
+    #   python chat_relay.py [posts_per_thread] [posters] [subscribers]
+    import sys
+
+    posts    = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    posters  = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    subs     = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+    libraries = 4
+
+    backend = LocalChatBackend(write_delay=0.05)
+    relay = ChatRelay(backend, max_queue=posts * posters)
+    queues = [(lib, relay.subscribe(lib)) for lib in range(libraries) for _ in range(subs)]
+
+    def poster(n):
+        for i in range(posts):
+            relay.post(i % libraries, n, f'user {n}', f'message {i}')
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=poster, args=(n,)) for n in range(posters)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    posted = time.perf_counter() - start
+
+    reads = 20000
+    read_start = time.perf_counter()
+    for i in range(reads):
+        relay.messages(i % libraries)
+    read_time = time.perf_counter() - read_start
+
+    relay.flush(timeout=60)
+    total = posts * posters
+    delivered = sum(q.qsize() for _, q in queues)
+    print(f"posted {total:,} messages from {posters} threads in {posted:.2f}s ({total / posted:,.0f} msg/s)")
+    print(f"delivered {delivered:,} SSE events to {len(queues)} subscribers "
+          f"(expected {total * subs:,})")
+    print(f"backend: {relay.written:,} messages in {backend.batches} batch writes "
+          f"(~{relay.written / max(backend.batches, 1):.0f} per write) vs {total:,} single writes before")
+    print(f"reads: {reads:,} GETs in {read_time * 1000:.0f} ms "
+          f"({read_time / reads * 1e6:.1f} us each, no backend round trip)")
@@ -0,0 +1,105 @@
+import hashlib
+import io
+from collections import namedtuple
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:     # Pillow is optional; without it no covers are accepted or served
+    Image = None
+
+# bounding boxes (width, height); covers keep their aspect ratio inside them
+VARIANT_SIZES = {
+    'thumb':  (64, 96),
+    'small':  (160, 240),
+    'medium': (320, 480),
+    'large':  (800, 1200),
+}
+# served for ?size=original: the raw upload keeps its EXIF (camera, GPS position)
+LARGEST_VARIANT = max(VARIANT_SIZES, key=lambda name: VARIANT_SIZES[name][0] * VARIANT_SIZES[name][1])
+VARIANT_FORMAT  = 'WEBP'
+VARIANT_MIME    = 'image/webp'
+VARIANT_QUALITY = 80
+MAX_PIXELS      = 50_000_000    # refuse decompression bombs
+
+Variant = namedtuple('Variant', 'name data mime_type sha256 width height')
+
+
+def available():
+    return Image is not None
+
+
+def process_cover(data):
+    """
+    Decode an uploaded cover, apply its EXIF orientation, drop all metadata and
+    re-encode it at every VARIANT_SIZES bounding box. Returns a list of
+    Variant; empty when Pillow is missing or the bytes are not an image.
+    """
+    if Image is None:
+        return []
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            if img.width * img.height > MAX_PIXELS:
+                return []
+            img = ImageOps.exif_transpose(img)
+            img = img.convert('RGBA' if img.mode in ('RGBA', 'LA', 'P') else 'RGB')
+    except Exception:
+        return []
+
+    variants = []
+    for name, box in VARIANT_SIZES.items():
+        resized = img.copy()
+        resized.thumbnail(box, Image.LANCZOS)
+        out = io.BytesIO()
+        # saving without exif/icc arguments writes no metadata
+        resized.save(out, VARIANT_FORMAT, quality=VARIANT_QUALITY, method=4)
+        encoded = out.getvalue()
+        variants.append(Variant(
+            name, encoded, VARIANT_MIME, hashlib.sha256(encoded).hexdigest(), resized.width, resized.height
+        ))
+    return variants
+
+
+if __name__ == '__main__':
+    # Benchmark: bytes shipped for one 10-book catalogue page, before (original
+    # phone photos inlined as base64) and after (a thumbnail URL per book).
+    #   python cover_pipeline.py
+    import base64
+    import random
+    import time
+
+    if Image is None:
+        raise SystemExit('Pillow is required for the benchmark')
+
+    random.seed(7)
+    originals = []
+    for _ in range(10):
+        # 3024x4032 "phone photo" of a cover (gradients, blocks, sensor noise) with EXIF
+        base = Image.merge('RGB', [
+            Image.radial_gradient('L').resize((3024, 4032)),
+            Image.linear_gradient('L').resize((3024, 4032)),
+            Image.new('L', (3024, 4032), random.randint(0, 255)),
+        ])
+        for _ in range(12):
+            x, y = random.randint(0, 2800), random.randint(0, 3800)
+            block = Image.new('RGB', (random.randint(100, 900), random.randint(60, 400)),
+                              tuple(random.randint(0, 255) for _ in range(3)))
+            base.paste(block, (x, y))
+        noise = Image.effect_noise((3024, 4032), 12).convert('RGB')
+        img = Image.blend(base, noise, 0.08)
+        exif = Image.Exif()
+        exif[0x010F] = 'PhoneMaker'
+        exif[0x0112] = 1
+        out = io.BytesIO()
+        img.save(out, 'JPEG', quality=90, exif=exif)
+        originals.append(out.getvalue())
+
+    start = time.perf_counter()
+    processed = [process_cover(data) for data in originals]
+    elapsed = time.perf_counter() - start
+
+    before = sum(len(base64.b64encode(data)) for data in originals)
+    print(f"ingest: {elapsed / len(originals) * 1000:.0f} ms per cover")
+    print(f"before: {before:>12,} bytes per page (inline image_base64)")
+    for name in VARIANT_SIZES:
+        after = sum(len(v.data) for variants in processed for v in variants if v.name == name)
+        print(f"after:  {after:>12,} bytes per page ({name} variants, {before / after:,.0f}x smaller)")
@@ -0,0 +1,152 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.pool import QueuePool
+
+# upper bounds (ms) of the checkout-wait histogram buckets; the last bucket is open
+WAIT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+POOL_DEFAULTS = {
+    'POOL_SIZE':     5,
+    'MAX_OVERFLOW':  10,
+    'POOL_TIMEOUT':  30,       # seconds to wait for a free connection
+    'POOL_RECYCLE':  1800,     # seconds; keep below MySQL's wait_timeout
+    'POOL_PRE_PING': 1,
+}
+
+
+def _setting(service, name):
+    # LIBRARYDB_POOL_SIZE, then DB_POOL_SIZE, then the default
+    for key in (f'{service}_{name}', f'DB_{name}'):
+        if key in os.environ:
+            return int(os.environ[key])
+    return POOL_DEFAULTS[name]
+
+
+class PoolTelemetry:
+    """
+    Connection-pool counters for one engine: connections checked out and in
+    overflow right now, checkout timeouts, and a histogram of how long
+    checkouts waited for a connection (including opening a new one).
+    """
+
+    def __init__(self, service):
+        self.service = service
+        self.pool = None
+        self._lock = threading.Lock()
+        self._buckets = [0] * (len(WAIT_BUCKETS_MS) + 1)
+        self._waits = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self.timeouts = 0
+
+    def pool_class(self):
+        """A QueuePool that reports to this telemetry (survives engine.dispose())."""
+        telemetry = self
+
+        class TimedQueuePool(QueuePool):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                telemetry.pool = self
+
+            def _do_get(self):
+                start = time.perf_counter()
+                try:
+                    return super()._do_get()
+                except PoolTimeout:
+                    with telemetry._lock:
+                        telemetry.timeouts += 1
+                    raise
+                finally:
+                    telemetry.observe((time.perf_counter() - start) * 1000)
+
+        return TimedQueuePool
+
+    def observe(self, wait_ms):
+        with self._lock:
+            self._buckets[bisect_left(WAIT_BUCKETS_MS, wait_ms)] += 1
+            self._waits += 1
+            self._wait_total += wait_ms
+            if wait_ms > self._wait_max:
+                self._wait_max = wait_ms
+
+    def stats(self):
+        pool = self.pool
+        with self._lock:
+            data = {
+                'checkouts':        self._waits,
+                'timeouts':         self.timeouts,
+                'wait_ms_avg':      round(self._wait_total / self._waits, 3) if self._waits else 0,
+                'wait_ms_max':      round(self._wait_max, 3),
+                # le_ms is the bucket's upper bound; None for the open last bucket
+                'wait_ms_buckets':  [{'le_ms': b, 'count': n} for b, n in zip(WAIT_BUCKETS_MS + (None,), self._buckets)],
+            }
+        if pool is not None:
+            data.update({
+                'size':        pool.size(),
+                'checked_out': pool.checkedout(),
+                'checked_in':  pool.checkedin(),
+                'overflow':    max(pool.overflow(), 0),
+            })
+        return data
+
+
+def engine_options(service, url, telemetry=None):
+    """
+    SQLALCHEMY_ENGINE_OPTIONS for `service` from the environment:
+    {SERVICE}_POOL_SIZE / _MAX_OVERFLOW / _POOL_TIMEOUT / _POOL_RECYCLE /
+    _POOL_PRE_PING, each falling back to DB_<NAME> and then POOL_DEFAULTS.
+    In-memory SQLite keeps SQLAlchemy's single-connection pool.
+    """
+    options = {
+        'pool_pre_ping': bool(_setting(service, 'POOL_PRE_PING')),
+        'pool_recycle':  _setting(service, 'POOL_RECYCLE'),
+    }
+    parsed = make_url(url)
+    if parsed.get_backend_name() == 'sqlite' and parsed.database in (None, '', ':memory:'):
+        return options
+    options.update({
+        'pool_size':     _setting(service, 'POOL_SIZE'),
+        'max_overflow':  _setting(service, 'MAX_OVERFLOW'),
+        'pool_timeout':  _setting(service, 'POOL_TIMEOUT'),
+    })
+    if telemetry is not None:
+        options['poolclass'] = telemetry.pool_class()
+    return options
+
+
+if __name__ == '__main__':
+    # Load test: T threads each running short queries through a pool of
+    # POOL_SIZE + MAX_OVERFLOW connections, then the telemetry snapshot.
+    #   DB_POOL_SIZE=2 DB_MAX_OVERFLOW=1 python db_pool.py [url] [threads] [queries]
+    import json
+    import sys
+    import tempfile
+
+    from sqlalchemy import create_engine, text
+
+    url = sys.argv[1] if len(sys.argv) > 1 else f'sqlite:///{tempfile.mkdtemp()}/pool.db'
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    queries = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+
+    telemetry = PoolTelemetry('bench')
+    engine = create_engine(url, **engine_options('BENCH', url, telemetry))
+
+    def worker():
+        for _ in range(queries):
+            with engine.connect() as conn:
+                conn.execute(text('SELECT 1'))
+                time.sleep(0.001)     # hold the connection like a short request
+
+    start = time.perf_counter()
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    print(f"{threads * queries:,} checkouts from {threads} threads in {time.perf_counter() - start:.2f}s")
+    print(json.dumps(telemetry.stats(), indent=2))
@@ -0,0 +1,233 @@
+from decimal import Decimal
+
+from sqlalchemy import bindparam, func, or_, select, update
+
+from bulk import upsert
+
+FINE_PER_DAY = Decimal('5.00')     # R5 per day overdue
+
+
+def fine_amount(due_date, today, rate=FINE_PER_DAY):
+    days = (today - due_date).days
+    return rate * days if days > 0 else Decimal('0.00')
+
+
+def _running_fines(loan, fee):
+    # a loan's fine is a series of segments: paid ones, then at most one unpaid
+    # "running" segment (running_loan_id = loan_id) that accrual keeps current;
+    # a new segment starts where the last paid one was accrued through
+    paid = fee.alias('paid_fee')
+    paid_through = (
+        select(func.max(paid.c.accrued_through))
+        .where(paid.c.loan_id == loan.c.loan_id, paid.c.status == 'paid')
+        .scalar_subquery()
+    )
+    return (
+        select(loan.c.loan_id, loan.c.user_id, loan.c.due_date, fee.c.amount, paid_through.label('paid_through'))
+        .outerjoin(fee, fee.c.running_loan_id == loan.c.loan_id)
+    )
+
+
+def overdue_loans(loan, fee, today, after_id=0, limit=1000):
+    """
+    Next batch of overdue, unreturned loans whose running fine is missing or
+    behind `today`, as write_fines rows. The loan rows are locked (SKIP LOCKED:
+    a loan another accrual run or a desk return holds is left to it), so every
+    writer of a running fine reads its amount under the loan's row lock.
+    """
+    return (
+        _running_fines(loan, fee)
+        .where(
+            loan.c.loan_id > after_id,
+            loan.c.returned_date.is_(None),
+            loan.c.due_date < today,
+            or_(fee.c.feefine_id.is_(None), fee.c.accrued_through.is_(None), fee.c.accrued_through < today)
+        )
+        .order_by(loan.c.loan_id)
+        .limit(limit)
+        .with_for_update(skip_locked=True, of=loan)
+    )
+
+
+def loan_fines(loan, fee, loan_ids):
+    """write_fines rows for `loan_ids`; the caller holds their loan row locks."""
+    return _running_fines(loan, fee).where(loan.c.loan_id.in_(loan_ids))
+
+
+def write_fines(session, fee, summary, rows, today, rate=FINE_PER_DAY):
+    """
+    Bring the running fine of each (loan_id, user_id, due_date,
+    running_amount, paid_through) in `rows` up to `today`, without
+    committing: one multi-row upsert on feefine.running_loan_id, then one
+    executemany moving each affected user's unpaid_fees by the sum of their
+    loans' increases. The loans must be locked (see overdue_loans). A loan
+    whose earlier fine was paid gets a new segment from the paid-through date;
+    a segment with nothing owed yet is not created. Returns {loan_id: amount}
+    of the running segments written.
+    """
+    fines = []
+    amounts = {}
+    deltas = {}
+    for loan_id, user_id, due_date, previous, paid_through in rows:
+        amount = fine_amount(max(due_date, paid_through or due_date), today, rate)
+        if previous is None and not amount:
+            continue
+        amounts[loan_id] = amount
+        fines.append({
+            'loan_id':         loan_id,
+            'running_loan_id': loan_id,
+            'user_id':         user_id,
+            'amount':          amount,
+            'description':     f'Overdue fine for loan {loan_id}',
+            'status':          'unpaid',
+            'accrued_through': today,
+        })
+        deltas[user_id] = deltas.get(user_id, 0) + amount - Decimal(previous or 0)
+
+    upsert(session, fee, fines, ('running_loan_id',), ('amount', 'accrued_through'))
+    deltas = [{'uid': uid, 'delta': delta} for uid, delta in deltas.items() if delta]
+    if deltas:
+        session.execute(
+            update(summary)
+            .where(summary.c.user_id == bindparam('uid'))
+            .values(unpaid_fees=summary.c.unpaid_fees + bindparam('delta')),
+            deltas
+        )
+    return amounts
+
+
+def finalise_fines(session, loan, fee, summary, loan_ids, today, rate=FINE_PER_DAY):
+    """
+    Charge `loan_ids`, which are being returned, up to `today` and close
+    their running segments (running_loan_id cleared), without committing.
+    The caller holds the loans' row locks. Returns write_fines' {loan_id: amount}.
+    """
+    if not loan_ids:
+        return {}
+    amounts = write_fines(session, fee, summary, session.execute(loan_fines(loan, fee, loan_ids)).all(), today, rate)
+    session.execute(update(fee).where(fee.c.running_loan_id.in_(loan_ids)).values(running_loan_id=None))
+    return amounts
+
+
+def accrue_overdue_fines(session, loan, fee, summary, today, batch_size=1000, rate=FINE_PER_DAY):
+    """
+    Bring the running fine of every overdue, unreturned loan up to `today`.
+
+    `loan`, `fee` and `summary` are the loan, feefine and user_summary tables.
+    Each batch of loans is one transaction (see write_fines). Fines already
+    accrued through `today` are skipped, so re-running on the same day writes
+    nothing, and loans locked by an overlapping run are left to that run.
+    Returns the number of fines written.
+    """
+    written = 0
+    last_id = 0
+    while True:
+        rows = session.execute(overdue_loans(loan, fee, today, last_id, batch_size)).all()
+        if not rows:
+            session.commit()
+            break
+
+        written += len(write_fines(session, fee, summary, rows, today, rate))
+        session.commit()
+
+        last_id = rows[-1][0]
+        if len(rows) < batch_size:
+            break
+    return written
+
+
+if __name__ == '__main__':
+    # Benchmark: one accrual pass over N open overdue loans, against the
+    # per-loan approach (calculate_fees + SELECT/INSERT/UPDATE per loan).
+    #   python fines.py [n_loans]
+    import random
+    import sys
+    import time
+    from datetime import date, timedelta
+
+    from sqlalchemy import (Column, Date, DateTime, Enum, Index, Integer, MetaData,
+                            Numeric, Table, Text, create_engine)
+    from sqlalchemy.orm import Session
+
+    n_loans = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    n_users = n_loans // 4
+    random.seed(3)
+
+    meta = MetaData()
+    loan = Table('loan', meta,
+                 Column('loan_id', Integer, primary_key=True),
+                 Column('user_id', Integer, nullable=False),
+                 Column('book_id', Integer, nullable=False),
+                 Column('checkout_date', Date, nullable=False),
+                 Column('due_date', Date, nullable=False),
+                 Column('returned_date', Date))
+    fee = Table('feefine', meta,
+                Column('feefine_id', Integer, primary_key=True),
+                Column('user_id', Integer, nullable=False),
+                Column('loan_id', Integer),
+                Column('running_loan_id', Integer),
+                Column('amount', Numeric(8, 2), nullable=False),
+                Column('description', Text),
+                Column('status', Enum('unpaid', 'paid'), default='unpaid'),
+                Column('created_at', DateTime, server_default=func.current_timestamp()),
+                Column('accrued_through', Date),
+                Index('ix_feefine_loan', 'loan_id'),
+                Index('uq_feefine_running_loan', 'running_loan_id', unique=True))
+    summary = Table('user_summary', meta,
+                    Column('user_id', Integer, primary_key=True),
+                    Column('active_reservations', Integer, nullable=False, default=0),
+                    Column('open_loans', Integer, nullable=False, default=0),
+                    Column('unpaid_fees', Numeric(10, 2), nullable=False, default=0))
+
+    def fresh_db():
+        engine = create_engine('sqlite://')
+        meta.create_all(engine)
+        today = date(2026, 3, 1)
+        with engine.begin() as conn:
+            conn.execute(summary.insert(), [{'user_id': u, 'active_reservations': 0, 'open_loans': 0,
+                                             'unpaid_fees': 0} for u in range(1, n_users + 1)])
+            conn.execute(loan.insert(), [{
+                'loan_id': i, 'user_id': random.randint(1, n_users), 'book_id': i,
+                'checkout_date': today - timedelta(days=40),
+                'due_date': today - timedelta(days=random.randint(1, 30)),
+            } for i in range(1, n_loans + 1)])
+        return engine, today
+
+    def per_loan(session, today):
+        # what wiring calculate_fees() into a loop would do
+        for loan_id, user_id, due_date in session.execute(
+                select(loan.c.loan_id, loan.c.user_id, loan.c.due_date)
+                .where(loan.c.returned_date.is_(None), loan.c.due_date < today)).all():
+            amount = fine_amount(due_date, today)
+            existing = session.execute(select(fee.c.feefine_id, fee.c.amount)
+                                       .where(fee.c.loan_id == loan_id)).first()
+            if existing:
+                session.execute(update(fee).where(fee.c.feefine_id == existing[0]).values(amount=amount))
+                delta = amount - existing[1]
+            else:
+                session.execute(fee.insert().values(loan_id=loan_id, user_id=user_id, amount=amount))
+                delta = amount
+            session.execute(update(summary).where(summary.c.user_id == user_id)
+                            .values(unpaid_fees=summary.c.unpaid_fees + delta))
+        session.commit()
+
+    def timed(label, fn):
+        start = time.perf_counter()
+        result = fn()
+        print(f"{label:<34} {time.perf_counter() - start:8.2f} s  {result if result is not None else ''}")
+
+    print(f"{n_loans:,} open overdue loans, {n_users:,} users (sqlite)")
+    engine, today = fresh_db()
+    with Session(engine) as session:
+        timed('per-loan, first night', lambda: per_loan(session, today))
+        timed('per-loan, same night again', lambda: per_loan(session, today))
+
+    engine, today = fresh_db()
+    with Session(engine) as session:
+        timed('set-based, first night', lambda: accrue_overdue_fines(session, loan, fee, summary, today))
+        timed('set-based, same night again', lambda: accrue_overdue_fines(session, loan, fee, summary, today))
+        timed('set-based, next night', lambda: accrue_overdue_fines(session, loan, fee, summary,
+                                                                      today + timedelta(days=1)))
+        fines_total = session.execute(select(func.sum(fee.c.amount))).scalar()
+        counters    = session.execute(select(func.sum(summary.c.unpaid_fees))).scalar()
+        print(f"fines R{fines_total:,}  user_summary.unpaid_fees R{counters:,}")
@@ -0,0 +1,114 @@
+import threading
+import time
+from bisect import bisect_left, insort
+
+
+class HoldQueues:
+    """
+    The waiting holds of each book as a sorted list of hold ids. Holds are
+    served in hold_id order, so a hold's queue position is one binary search
+    instead of a COUNT over everything queued ahead of it.
+
+    loader(book_id) returns the ids of the book's waiting holds. A book is
+    loaded on first use and again after invalidate() or `ttl` seconds (which
+    picks up holds queued or allocated by other worker processes); writers
+    call add()/remove() after committing to keep this process current.
+    """
+
+    def __init__(self, loader, ttl=30):
+        self.loader = loader
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._queues = {}       # book_id -> (sorted hold ids, loaded_at)
+        self.loads = 0
+
+    def _ids(self, book_id, reload=False):
+        entry = self._queues.get(book_id)
+        if not reload and entry is not None and time.monotonic() - entry[1] <= self.ttl:
+            return entry[0]
+        ids = sorted(self.loader(book_id))
+        with self._lock:
+            self._queues[book_id] = (ids, time.monotonic())
+            self.loads += 1
+        return ids
+
+    def position(self, book_id, hold_id):
+        """
+        1-based place of `hold_id` in its book's queue, or None if it is not
+        waiting. A hold missing from a cached queue may have been queued by
+        another worker since it was loaded, so the book is reloaded once.
+        """
+        loads = self.loads
+        ids = self._ids(book_id)
+        i = bisect_left(ids, hold_id)
+        if (i == len(ids) or ids[i] != hold_id) and self.loads == loads:
+            ids = self._ids(book_id, reload=True)
+            i = bisect_left(ids, hold_id)
+        return i + 1 if i < len(ids) and ids[i] == hold_id else None
+
+    def length(self, book_id):
+        return len(self._ids(book_id))
+
+    def add(self, book_id, hold_id):
+        with self._lock:
+            entry = self._queues.get(book_id)
+            if entry is not None:
+                ids = entry[0]
+                i = bisect_left(ids, hold_id)
+                if i == len(ids) or ids[i] != hold_id:
+                    insort(ids, hold_id)
+
+    def remove(self, book_id, *hold_ids):
+        with self._lock:
+            entry = self._queues.get(book_id)
+            if entry is None:
+                return
+            ids = entry[0]
+            for hold_id in hold_ids:
+                i = bisect_left(ids, hold_id)
+                if i < len(ids) and ids[i] == hold_id:
+                    del ids[i]
+
+    def invalidate(self, *book_ids):
+        with self._lock:
+            for book_id in book_ids:
+                self._queues.pop(book_id, None)
+
+    def stats(self):
+        return {
+            'books':   len(self._queues),
+            'waiting': sum(len(ids) for ids, _ in self._queues.values()),
+            'loads':   self.loads,
+        }
+
+
+if __name__ == '__main__':
+    # Benchmark: queue-position lookups on one hot title, binary search against
+    # counting the waiting holds ahead (what a COUNT(*) query does per request).
+    #   python hold_queue.py [queued] [lookups]
+    import random
+    import sys
+
+    queued  = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    lookups = int(sys.argv[2]) if len(sys.argv) > 2 else 20_000
+    random.seed(5)
+
+    hold_ids = sorted(random.sample(range(1, queued * 3), queued))
+    queues = HoldQueues(lambda book_id: hold_ids, ttl=3600)
+    probes = [random.choice(hold_ids) for _ in range(lookups)]
+
+    start = time.perf_counter()
+    for hold_id in probes:
+        queues.position(1, hold_id)
+    searched = time.perf_counter() - start
+
+    sample = probes[:max(lookups // 100, 1)]
+    start = time.perf_counter()
+    for hold_id in sample:
+        sum(1 for other in hold_ids if other < hold_id) + 1
+    counted = (time.perf_counter() - start) / len(sample) * lookups
+
+    assert all(queues.position(1, h) == sum(1 for o in hold_ids if o < h) + 1 for h in sample)
+    print(f"{queued:,} waiting holds, {lookups:,} position lookups")
+    print(f"binary search: {searched * 1000:8.1f} ms  ({searched / lookups * 1e6:.2f} us each)")
+    print(f"count ahead:   {counted * 1000:8.1f} ms  ({counted / lookups * 1e6:.2f} us each, extrapolated)")
@@ -0,0 +1,109 @@
+import functools
+import hashlib
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+
+from cachetools import LRUCache
+from flask import current_app, make_response, request
+
+Entry = namedtuple('Entry', 'version body mimetype etag last_modified built_at')
+
+
+class ResponseCache:
+    """
+    Conditional-GET layer for read endpoints whose output only changes when a
+    known write endpoint runs.
+
+    Every cached view names the resource it renders (e.g. ('hours', 1)). Writers
+    call `bump(resource)` after committing, which moves that resource's version
+    counter on. A request whose cached entry still carries the current version
+    is answered from memory (200 with the stored body, or 304 when the client's
+    If-None-Match / If-Modified-Since matches) without running the view.
+
+    ETags are a hash of the body, so every worker process hands out the same
+    ETag for the same content. Version counters are per process, so entries are
+    also rebuilt every `ttl` seconds to pick up writes made by other workers.
+    """
+
+    def __init__(self, ttl=60, max_entries=1024):
+        self.ttl      = ttl
+        self._lock    = threading.Lock()
+        self._entries = LRUCache(maxsize=max_entries)
+        self._versions = {}
+        self.hits          = 0
+        self.not_modified  = 0
+        self.misses        = 0
+
+    def version(self, resource):
+        with self._lock:
+            return self._versions.get(resource, 0)
+
+    def bump(self, *resources):
+        with self._lock:
+            for resource in resources:
+                self._versions[resource] = self._versions.get(resource, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def cached(self, resource):
+        """
+        Decorator for a GET view. `resource(**view_args)` returns the version
+        key the view's output depends on. Only 200 responses are cached; the
+        query string is part of the cache key.
+        """
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                key = (request.path, tuple(sorted(request.args.items(multi=True))))
+                version = self.version(resource(**kwargs))
+                now = time.monotonic()
+                with self._lock:
+                    entry = self._entries.get(key)
+                hit = entry is not None and entry.version == version and now - entry.built_at <= self.ttl
+                if not hit:
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                    entry = self._store(key, version, response, entry, now)
+
+                response = current_app.response_class(entry.body, mimetype=entry.mimetype)
+                response.set_etag(entry.etag)
+                response.last_modified = entry.last_modified
+                response.cache_control.no_cache = True
+                response = response.make_conditional(request)
+                with self._lock:
+                    if response.status_code == 304:
+                        self.not_modified += 1
+                    elif hit:
+                        self.hits += 1
+                    else:
+                        self.misses += 1
+                return response
+            return wrapper
+        return decorator
+
+    def _store(self, key, version, response, previous, now):
+        body = response.get_data()
+        etag = hashlib.sha256(body).hexdigest()[:32]
+        if previous is not None and previous.etag == etag:
+            last_modified = previous.last_modified
+        else:
+            last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+        entry = Entry(version, body, response.mimetype, etag, last_modified, now)
+        with self._lock:
+            self._entries[key] = entry
+        return entry
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits':         self.hits,
+                'not_modified': self.not_modified,
+                'misses':       self.misses,
+                'entries':      len(self._entries),
+                'resources':    len(self._versions),
+            }
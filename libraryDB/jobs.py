@@ -0,0 +1,54 @@
+import threading
+import time
+
+from metrics import metrics
+
+
+class PeriodicJob(threading.Thread):
+    """
+    Runs `fn()` inside an app context every `interval` seconds on a daemon
+    thread. `fn` may return the number of rows it processed; duration and row
+    counts are published to the metrics registry under the job's name, and
+    passed to `record(name, rows, duration_ms, failed)` (in an app context)
+    when the job runs in a process other than the ones serving /metrics.
+    """
+
+    def __init__(self, app, name, interval, fn, record=None):
+        super().__init__(name=name, daemon=True)
+        self.app      = app
+        self.interval = interval
+        self.fn       = fn
+        self.record   = record
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.run_once()
+
+    def run_once(self):
+        start = time.perf_counter()
+        rows = 0
+        failed = False
+        try:
+            with self.app.app_context():
+                rows = self.fn() or 0
+        except Exception:
+            failed = True
+            metrics.incr(f'{self.name}.errors')
+            self.app.logger.exception(f'{self.name} failed')
+        finally:
+            duration_ms = (time.perf_counter() - start) * 1000
+            metrics.incr(f'{self.name}.runs')
+            metrics.incr(f'{self.name}.rows', rows)
+            metrics.set(f'{self.name}.last_rows', rows)
+            metrics.set(f'{self.name}.last_duration_ms', round(duration_ms, 2))
+        if self.record is not None:
+            try:
+                with self.app.app_context():
+                    self.record(self.name, rows, duration_ms, failed)
+            except Exception:
+                self.app.logger.exception(f'{self.name}: recording the run failed')
+        return rows
+
+    def stop(self):
+        self._stop_event.set()
@@ -1,21 +1,53 @@
-from flask import Flask, request, jsonify,g
+from flask import Flask, request, jsonify,g, url_for, make_response, Response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 from datetime import datetime, date, time,timedelta,timezone
 import uuid
+import queue
 import os
 import json
 import firebase_admin
 from firebase_admin import credentials, auth, db as firebase_db
-from sqlalchemy import func, and_, or_
+from sqlalchemy import func, and_, or_, update, delete, case, select, text, bindparam
 from werkzeug.exceptions import NotFound, Unauthorized, Forbidden
 from flask import abort
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
 import traceback
-from sqlalchemy.dialects.mysql import LONGBLOB
-import base64
+import math
+import time as time_mod
+import tempfile
+import shutil
+import threading
+import atexit
+import click
+import hashlib
 from extensions import db
-from librarydb_ext import User,OperatingTime, Library, StudyRoom, StudyRoomMedia, StudyRoomMindMap, StudyRoomMember
+from auth_cache import auth_cache
+from metrics import metrics
+from book_search import InvertedIndex, normalize_isbn, isbn_key, fulltext_rank, fulltext_match
+from jobs import PeriodicJob
+from seat_occupancy import OccupancyStore, SEAT_FIELDS, sse_event
+from bulk import upsert, chunked
+from fines import accrue_overdue_fines, overdue_loans, finalise_fines, fine_amount
+from query_audit import audit
+from appointment_slots import IntervalSet, WEEKDAYS, opening_windows, free_windows
+from chat_relay import ChatRelay, backend_from_env
+from weekly_schedule import ScheduleCache
+from hold_queue import HoldQueues
+from reading_lists import AvailabilityCache, normalize_module_code
+from exports import EXPORT_FORMATS, stream_rows
+from usage_rollup import roll_up, METRICS as USAGE_METRICS
+from db_pool import PoolTelemetry, engine_options
+import cover_pipeline
+from cover_pipeline import process_cover, VARIANT_SIZES, LARGEST_VARIANT
+from catalogue_import import detect_format, iter_records, parse_book, CoverArchive, MAX_REPORTED_ERRORS
+from pagination import cursor_requested, cursor_args, keyset_page, order_by_keys, encode_cursor
+from http_cache import ResponseCache
+from cachetools import LRUCache
+from models import (User, Library, Room, Seat, Book, BookCover, BookCoverVariant, Reservation, BookHold, ModuleBook, Loan, FeeFine,
+                    UserSummary, Announcement, OperatingTime, Appointment, ImportJob, PurchaseRequest,
+                    Recommendation, StudyRoom, StudyRoomMember, UsageHourly, UsageDaily, RollupWatermark, JobRun)
+import migrations
 
  
 
@@ -31,9 +63,15 @@ if not DATABASE_URL:
     raise RuntimeError("DATABASE_URL env var is required")
 
 app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL
+# Pool size/overflow/timeout/recycle/pre-ping from LIBRARYDB_* (or DB_*), see db_pool.py
+pool_telemetry = PoolTelemetry('librarydb')
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options('LIBRARYDB', DATABASE_URL, pool_telemetry)
+metrics.register('db_pool', pool_telemetry.stats)
 
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET', 'super-secret-key')
+# No schema work at import: tables and migrations are `flask --app librarydb db-upgrade`
+db.init_app(app)
 
 # Initialize Firebase
 # Load the JSON string from the environment
@@ -59,7 +97,7 @@ def authenticate_request():
 
 
     # Skip authentication for public endpoints
-    public_routes = ['register_user','update_computer','list_computers','add_book','update_book_status','update_book','search_books','get_rooms','update_seat','create_seat','seat_availability','bulk_update_hours','update_hours','get_announcements','delete_announcement','create_announcement', 'get_hours', 'search_books']
+    public_routes = ['register_user','get_book_cover','update_computer','list_computers','add_book','update_book_status','update_book','search_books','get_rooms','update_seat','bulk_update_seats','create_seat','seat_availability','seat_summary','seat_stream','bulk_update_hours','update_hours','get_announcements','delete_announcement','create_announcement', 'get_hours', 'opening_status', 'book_availability', 'module_books', 'search_books']
     if request.endpoint in public_routes:
         return
 
@@ -69,237 +107,219 @@ def authenticate_request():
 
     token = auth_header.split(' ')[1]
     try:
-        decoded_token = auth.verify_id_token(token)
+        decoded_token = auth_cache.verify_token(token, auth.verify_id_token)
         request.firebase_uid = decoded_token['uid']
-        # Get corresponding user from database
-        user = User.query.filter_by(firebase_uid=request.firebase_uid).first()
+        # Get corresponding user from the identity map, falling back to the database
+        user = auth_cache.get_user(request.firebase_uid, _load_user)
         if not user:
             raise NotFound('User not found in database')
-        g.current_user = user
+        g.current_user = db.session.merge(user, load=False)
     except Exception as e:
         raise Unauthorized(f'Invalid token: {str(e)}')
 
 
-# --- Database Models ---
-
-class Library(db.Model):
-    __tablename__ = 'library'
-    library_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    name = db.Column(db.String(256), nullable=False)
-    location = db.Column(db.String(256), nullable=False)
-    type = db.Column(db.String(64), nullable=False, default='Information Center')
-    
-    # Relationships
-    operating_hours = db.relationship('OperatingTime', backref='library', lazy=True)
-
-class Room(db.Model):
-    __tablename__ = 'room'
-    room_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    library_id = db.Column(db.Integer, db.ForeignKey('library.library_id'), nullable=False)
-    name = db.Column(db.String(64), nullable=False)
-    room_type = db.Column(db.String(20), nullable=False) 
-    seats = db.relationship('Seat', backref='room', lazy=True)
-
-class Seat(db.Model):
-    __tablename__ = 'seat'
-    seat_id     = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    room_id     = db.Column(db.Integer, db.ForeignKey('room.room_id'), nullable=False)
-    identifier  = db.Column(db.String(64), nullable=False)
-    is_computer = db.Column(db.Boolean, default=False)
-    is_active   = db.Column(db.Boolean, default=True)
-    is_occupied = db.Column(db.Boolean, default=False)
-    specs       = db.Column(db.String(256), default='Standard specs')
-
-
-class Book(db.Model):
-    __tablename__ = 'book'
-    book_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    isbn = db.Column(db.String(32), unique=True, nullable=False)
-    title = db.Column(db.String(512), nullable=False)
-    author = db.Column(db.String(256), nullable=False)
-    publisher = db.Column(db.String(256))
-    year = db.Column(db.Integer)
-    copies_total = db.Column(db.Integer, default=1)
-    copies_available = db.Column(db.Integer, default=1)
-    image= db.Column(LONGBLOB, nullable=True)  
-    
-    # Relationships
-    reservations = db.relationship('Reservation', backref='book', lazy=True)
-    loans = db.relationship('Loan', backref='book', lazy=True)
-
-class Reservation(db.Model):
-    __tablename__ = 'reservation'
-    reservation_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.user_id'), nullable=False)
-    book_id = db.Column(db.Integer, db.ForeignKey('book.book_id'), nullable=False)
-    library_id = db.Column(db.Integer, db.ForeignKey('library.library_id'), nullable=False)
-    reserved_from = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
-    reserved_until = db.Column(db.DateTime, nullable=False)
-    status = db.Column(db.Enum('active', 'cancelled', 'fulfilled'), default='active')
-
-class Loan(db.Model):
-    __tablename__ = 'loan'
-    loan_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.user_id'), nullable=False)
-    book_id = db.Column(db.Integer, db.ForeignKey('book.book_id'), nullable=False)
-    checkout_date = db.Column(db.Date, nullable=False, default=date.today)
-    due_date = db.Column(db.Date, nullable=False)
-    returned_date = db.Column(db.Date)
-
-class FeeFine(db.Model):
-    __tablename__ = 'feefine'
-    feefine_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.user_id'), nullable=False)
-    amount = db.Column(db.Numeric(8,2), nullable=False)
-    description = db.Column(db.Text)
-    status = db.Column(db.Enum('unpaid', 'paid'), default='unpaid')
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-
-class Announcement(db.Model):
-    __tablename__ = 'announcement'
-    announcement_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    title = db.Column(db.String(256), nullable=False)
-    body = db.Column(db.Text, nullable=False)
-    posted_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
-    is_active = db.Column(db.Boolean, default=True)
-
-class OperatingTime(db.Model):
-    __tablename__ = 'operatingtime'
-    operating_time_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    library_id = db.Column(db.Integer, db.ForeignKey('library.library_id'), nullable=False)
-    weekday = db.Column(db.Enum('Mon','Tue','Wed','Thu','Fri','Sat','Sun',name='weekday_enum'), nullable=False)
-    open_time = db.Column(db.Time, nullable=False)
-    close_time = db.Column(db.Time, nullable=False)
-
-class Appointment(db.Model):
-    __tablename__ = 'appointment'
-    appointment_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.user_id'), nullable=False)
-    librarian_user_id = db.Column(db.Integer, db.ForeignKey('user.user_id'), nullable=False)
-    library_id = db.Column(db.Integer, db.ForeignKey('library.library_id'), nullable=False)
-    start_datetime = db.Column(db.DateTime, nullable=False)
-    end_datetime = db.Column(db.DateTime, nullable=False)
-    status = db.Column(db.Enum('pending','confirmed','cancelled','completed', name='appointment_status_enum'), default='pending')
-    notes = db.Column(db.Text)
-
-    # Relationships
-    librarian = db.relationship('User', foreign_keys=[librarian_user_id])
-
-class PurchaseRequest(db.Model):
-    __tablename__ = 'purchaserequest'
-    request_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.user_id'), nullable=False)
-    title = db.Column(db.String(512), nullable=False)
-    author = db.Column(db.String(256), nullable=False)
-    isbn = db.Column(db.String(32))
-    justification = db.Column(db.Text)
-    status = db.Column(db.Enum('open','ordered','declined','received', name='purchase_status_enum'), default='open')
-    requested_at = db.Column(db.DateTime, default=datetime.utcnow)
-
-class Recommendation(db.Model):
-    __tablename__ = 'recommendation'
-    rec_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.user_id'), nullable=False)
-    category = db.Column(db.String(128), nullable=False)
-    content = db.Column(db.Text, nullable=False)
-    submitted_at = db.Column(db.DateTime, default=datetime.utcnow)
-    status = db.Column(db.Enum('new','reviewed','implemented','rejected', name='recommendation_status_enum'), default='new')
-
-# Create tables
-with app.app_context():
-    db.create_all()
-
-    if Library.query.count() == 0:
-        default_libraries = [
+def _load_user(firebase_uid):
+    user = User.query.filter_by(firebase_uid=firebase_uid).first()
+    if user:
+        # keep the cached copy out of the session so commits never expire it
+        db.session.expunge(user)
+    return user
+
+
+# --- Library provisioning ---
+# A layout is a list of rooms; seats are named f"{prefix}{n:0{pad}d}" for n = 1..seats.
+DEFAULT_LAYOUT = [
+    {"name": "library-lab01", "type": "computer_lab", "seats": 50,  "prefix": "Slab",   "pad": 2, "is_computer": True},
+    {"name": "library-lab02", "type": "computer_lab", "seats": 50,  "prefix": "Slab",   "pad": 2, "is_computer": True},
+    {"name": "library-lab03", "type": "computer_lab", "seats": 50,  "prefix": "Slab",   "pad": 2, "is_computer": True},
+    {"name": "library-lab04", "type": "computer_lab", "seats": 50,  "prefix": "Slab",   "pad": 2, "is_computer": True},
+    {"name": "studyarea",     "type": "study_room",   "seats": 100, "prefix": "SSlib-", "pad": 0, "is_computer": False},
+]
+SEAT_INSERT_CHUNK = 1000
+
+def _validate_layout(layout):
+    for room in layout:
+        if not room.get('name') or not room.get('type'):
+            raise ValueError("every room needs 'name' and 'type'")
+        if not isinstance(room.get('seats', 0), int) or room.get('seats', 0) < 0:
+            raise ValueError(f"room {room['name']!r}: 'seats' must be a non-negative integer")
+
+def provision_library(library_id, layout=DEFAULT_LAYOUT):
+    """
+    Create the rooms and seats of `layout` for one library in a single
+    transaction. Safe to re-run: rooms upsert on (library_id, name) and seats on
+    (room_id, identifier), so only what is missing gets inserted. Existing seats
+    keep their active/occupied state.
+    """
+    _validate_layout(layout)
+    try:
+        upsert(db.session, Room, [
+            {'library_id': library_id, 'name': room['name'], 'room_type': room['type']}
+            for room in layout
+        ], ('library_id', 'name'), ('room_type',))
+
+        room_ids = dict(
+            db.session.query(Room.name, Room.room_id)
+            .filter(Room.library_id == library_id, Room.name.in_([room['name'] for room in layout]))
+            .all()
+        )
+        seats = (
             {
-                "name":     "Thoko Mayekiso",
-                "location": "Mbombela Mian campus",
-                "type":     "Information Center"
+                'room_id':     room_ids[room['name']],
+                'identifier':  f"{room.get('prefix', '')}{n:0{room.get('pad', 0)}d}",
+                'is_computer': bool(room.get('is_computer', False)),
+                'is_active':   True,
+                'is_occupied': False,
+                'specs':       room.get('specs', 'Standard specs')
             }
-        ]
-
-        for lib_def in default_libraries:
-            db.session.add(Library(**lib_def))
+            for room in layout
+            for n in range(1, room.get('seats', 0) + 1)
+        )
+        for chunk in chunked(seats, SEAT_INSERT_CHUNK):
+            upsert(db.session, Seat, chunk, ('room_id', 'identifier'), ('is_computer',))
 
         db.session.commit()
-        print("🌱 Seeded 2 default libraries")
-    else:
-        print(f"✅ {Library.query.count()} libraries already present, skipping seed")
-        
+    except Exception:
+        db.session.rollback()
+        raise
+    occupancy.expire(library_id)
+    response_cache.bump(('rooms', library_id))
+
 def initialize_library(library_id=1):
-    # Create default rooms if they don't exist
-    rooms = [
-        {"name": "library-lab01", "type": "computer_lab"},
-        {"name": "library-lab02", "type": "computer_lab"},
-        {"name": "library-lab03", "type": "computer_lab"},
-        {"name": "library-lab04", "type": "computer_lab"},
-        {"name": "studyarea", "type": "study_room"},
-    ]
-    
-    for room_data in rooms:
-        room = Room.query.filter_by(
-            library_id=library_id,
-            name=room_data["name"]
-        ).first()
-        
-        if not room:
-            room = Room(
-                library_id=library_id,
-                name=room_data["name"],
-                room_type=room_data["type"]
-            )
-            db.session.add(room)
-            db.session.commit()
-            
-            # Create seats for this room
-            seat_count = 50 if "lab" in room_data["name"] else 100
-            prefix = "Slab" if "lab" in room_data["name"] else "SSlib-"
-            
-            for i in range(1, seat_count + 1):
-                identifier = f"{prefix}{i:02d}" if "lab" in room_data["name"] else f"{prefix}{i}"
-                
-                seat = Seat(
-                    room_id=room.room_id,
-                    identifier=identifier,
-                    is_computer=("lab" in room_data["name"]),
-                    is_active=True,
-                    is_occupied=False
-                )
-                db.session.add(seat)
-    
-    db.session.commit()
+    provision_library(library_id, DEFAULT_LAYOUT)
+
+def provision_libraries(specs):
+    """
+    specs: [{"library_id": 1} | {"name", "location", "type"}, optional "layout"].
+    Libraries given by name are created if no library with that name exists.
+    Each library is its own transaction; returns a per-library report with timings.
+    """
+    report = []
+    for spec in specs:
+        start = time_mod.perf_counter()
+        entry = {'library_id': spec.get('library_id'), 'name': spec.get('name')}
+        try:
+            library_id = spec.get('library_id')
+            if library_id is None:
+                if not spec.get('name') or not spec.get('location'):
+                    raise ValueError("new libraries need 'name' and 'location'")
+                library = Library.query.filter_by(name=spec['name']).first()
+                if not library:
+                    library = Library(name=spec['name'], location=spec['location'],
+                                      type=spec.get('type', 'Information Center'))
+                    db.session.add(library)
+                    db.session.flush()
+                library_id = entry['library_id'] = library.library_id
+            elif not db.session.get(Library, library_id):
+                raise ValueError(f'library {library_id} does not exist')
+
+            layout = spec.get('layout') or DEFAULT_LAYOUT
+            provision_library(library_id, layout)
+            if spec.get('library_id') is None:
+                response_cache.bump(('libraries',))
+            entry.update(status='ok', rooms=len(layout), seats=sum(room.get('seats', 0) for room in layout))
+        except Exception as e:
+            db.session.rollback()
+            entry.update(status='error', error=str(e))
+        entry['elapsed_ms'] = round((time_mod.perf_counter() - start) * 1000, 2)
+        report.append(entry)
+    return report
 
 # --- API Endpoints ---
 
+# Public, rarely-changing reads (hours, announcements, libraries, rooms) are
+# answered from memory with ETag/Last-Modified; their write endpoints bump the
+# matching resource version after committing.
+response_cache = ResponseCache(ttl=int(os.environ.get('HTTP_CACHE_TTL', 60)))
+metrics.register('http_cache', response_cache.stats)
+
 # 1. Seat Availability
+# Reads are served from the in-memory occupancy bitmaps; the seat write
+# endpoints keep them current and push deltas to /seats/stream subscribers.
+occupancy = OccupancyStore(ttl=int(os.environ.get('SEAT_OCCUPANCY_TTL', 30)))
+metrics.register('seat_stream_subscribers', occupancy.subscriber_count)
+SSE_HEARTBEAT = 15
+
+def _warm_occupancy(library_id):
+    if occupancy.needs_load(library_id):
+        rows = (
+            db.session.query(*[getattr(Seat, field) for field in SEAT_FIELDS])
+            .join(Room, Room.room_id == Seat.room_id)
+            .filter(Room.library_id == library_id)
+            .all()
+        )
+        occupancy.load(library_id, rows)
+
+def _seat_state(s):
+    return {field: getattr(s, field) for field in SEAT_FIELDS}
+
 @app.route('/libraries/<int:library_id>/seats/availability', methods=['GET'])
 def seat_availability(library_id):
     is_computer = request.args.get('is_computer', type=str)
     room_id = request.args.get('room_id', type=int)
     active_only = request.args.get('active', 'true') == 'true'
     
-    # Join with Room to filter by library
-    query = Seat.query.join(Room).filter(Room.library_id == library_id)
-    
-    # Add room filter if provided
-    if room_id:
-        query = query.filter(Seat.room_id == room_id)
-    
+    computer_filter = None
     if is_computer and is_computer.lower() in ['true', 'false']:
-        query = query.filter(Seat.is_computer == (is_computer.lower() == 'true'))
-    if active_only:
-        query = query.filter(Seat.is_active == True)
+        computer_filter = is_computer.lower() == 'true'
     
-    seats = query.all()
+    _warm_occupancy(library_id)
+    seats = occupancy.seats(library_id, room_id=room_id, is_computer=computer_filter, active_only=active_only)
     return jsonify([{
-        'seat_id': s.seat_id,
-        'identifier': s.identifier,
-        'is_computer': s.is_computer,
-        'is_active': s.is_active,
-        'is_occupied': s.is_occupied,
-        'room_id': s.room_id
+        'seat_id': s['seat_id'],
+        'identifier': s['identifier'],
+        'is_computer': s['is_computer'],
+        'is_active': s['is_active'],
+        'is_occupied': s['is_occupied'],
+        'room_id': s['room_id']
     } for s in seats])
 
+# Per-room free/occupied counts
+@app.route('/libraries/<int:library_id>/seats/summary', methods=['GET'])
+def seat_summary(library_id):
+    _warm_occupancy(library_id)
+    return jsonify({'rooms': occupancy.summary(library_id)})
+
+# Server-Sent Events: a snapshot, then one event per seat change
+@app.route('/libraries/<int:library_id>/seats/stream', methods=['GET'])
+def seat_stream(library_id):
+    _warm_occupancy(library_id)
+    q = occupancy.subscribe(library_id)
+    snapshot = occupancy.seats(library_id)
+
+    def generate():
+        try:
+            yield sse_event({'seats': snapshot}, 'snapshot')
+            while True:
+                try:
+                    event = q.get(timeout=SSE_HEARTBEAT)
+                except queue.Empty:
+                    # pick up changes made through other workers, then keep the connection alive
+                    with app.app_context():
+                        _warm_occupancy(library_id)
+                    yield ': keep-alive\n\n'
+                    continue
+                if event['type'] == 'resync':
+                    yield sse_event({'seats': occupancy.seats(library_id)}, 'snapshot')
+                else:
+                    yield sse_event(event, event['type'])
+        finally:
+            occupancy.unsubscribe(library_id, q)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+def _commit_unique():
+    """Commit, or roll back and return False if a unique key (room name, seat identifier) is already taken."""
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return False
+    return True
+
 # Create Seat
 @app.route('/libraries/<int:library_id>/seats', methods=['POST'])
 def create_seat(library_id):
@@ -326,7 +346,9 @@ def create_seat(library_id):
         is_occupied=bool(is_occupied)
     )
     db.session.add(s)
-    db.session.commit()
+    if not _commit_unique():
+        return jsonify({'error': 'Seat identifier already in use in this room'}), 409
+    occupancy.put(library_id, _seat_state(s))
 
     return jsonify({
         'seat_id': s.seat_id,
@@ -362,7 +384,9 @@ def update_seat(library_id, seat_id):
         if new_room:
             s.room_id = data['room_id']
 
-    db.session.commit()
+    if not _commit_unique():
+        return jsonify({'error': 'Seat identifier already in use in this room'}), 409
+    occupancy.put(library_id, _seat_state(s))
     return jsonify({
         'seat_id': s.seat_id,
         'identifier': s.identifier,
@@ -372,8 +396,78 @@ def update_seat(library_id, seat_id):
         'room_id': s.room_id
     }), 200
 
+# Bulk update: a list of seat ids and/or a whole room, one UPDATE, one transaction
+BULK_SEAT_FIELDS = {'is_active': bool, 'is_occupied': bool, 'is_computer': bool, 'specs': str}
+
+@app.route('/libraries/<int:library_id>/seats', methods=['PATCH'])
+def bulk_update_seats(library_id):
+    data = request.get_json() or {}
+    seat_ids = data.get('seat_ids')
+    room_id = data.get('room_id')
+    changes = data.get('changes') or {}
+
+    if seat_ids is None and room_id is None:
+        abort(400, description="Provide 'seat_ids' and/or 'room_id'")
+    if seat_ids is not None and (not isinstance(seat_ids, list) or not all(isinstance(i, int) for i in seat_ids)):
+        abort(400, description="'seat_ids' must be a list of integers")
+    if not isinstance(changes, dict):
+        abort(400, description="'changes' must be an object")
+    unknown = set(changes) - set(BULK_SEAT_FIELDS)
+    if not changes or unknown:
+        abort(400, description=f"'changes' may only contain {sorted(BULK_SEAT_FIELDS)}")
+    wrong = sorted(field for field, value in changes.items() if type(value) is not BULK_SEAT_FIELDS[field])
+    if wrong:
+        abort(400, description=f"'changes' has values of the wrong type for {wrong}")
+    values = dict(changes)
+
+    # Ownership check for every target seat in a single query
+    owned = db.session.query(Seat.seat_id).join(Room, Room.room_id == Seat.room_id) \
+                      .filter(Room.library_id == library_id)
+    if seat_ids is not None:
+        owned = owned.filter(Seat.seat_id.in_(seat_ids))
+    if room_id is not None:
+        owned = owned.filter(Seat.room_id == room_id)
+    owned_ids = [sid for (sid,) in owned.all()]
+
+    if owned_ids:
+        db.session.execute(
+            update(Seat).where(Seat.seat_id.in_(owned_ids)).values(**values)
+            .execution_options(synchronize_session=False)
+        )
+    db.session.commit()
+
+    rows = db.session.query(*[getattr(Seat, field) for field in SEAT_FIELDS]) \
+                     .filter(Seat.seat_id.in_(owned_ids)).all() if owned_ids else []
+    results = []
+    for row in rows:
+        state = dict(zip(SEAT_FIELDS, row))
+        occupancy.put(library_id, state)
+        results.append({'status': 'updated', **state})
+    for sid in sorted(set(seat_ids or []) - set(owned_ids)):
+        results.append({'seat_id': sid, 'status': 'not_found'})
+
+    return jsonify({'updated': len(owned_ids), 'results': results}), 200
+
+# Provision one or many libraries from layout specs (staff only)
+@app.route('/libraries/provision', methods=['POST'])
+def provision_libraries_endpoint():
+    if g.current_user.role != 'staff':
+        raise Forbidden('Staff only')
+    data = request.get_json() or {}
+    specs = data.get('libraries')
+    if not isinstance(specs, list) or not specs:
+        abort(400, description="'libraries' must be a non-empty list")
+
+    start = time_mod.perf_counter()
+    report = provision_libraries(specs)
+    return jsonify({
+        'libraries':  report,
+        'elapsed_ms': round((time_mod.perf_counter() - start) * 1000, 2)
+    }), 200
+
 # 2. Lab List
 @app.route('/libraries/labs', methods=['GET'])
+@response_cache.cached(lambda: ('libraries',))
 def lab_list():
     labs = Library.query.filter_by(type='lab').all()
     return jsonify([{
@@ -383,44 +477,126 @@ def lab_list():
     } for l in labs])
 
 # 3. Book Search
+# Ranked search: MySQL FULLTEXT / Postgres tsvector when available, otherwise an
+# in-process inverted index (SQLite). Exact ISBNs go straight to the unique index.
+SEARCH_INDEX_TTL = int(os.environ.get('BOOK_SEARCH_INDEX_TTL', 300))
+search_index = InvertedIndex()
+_search_index_lock = threading.Lock()
+
+def _search_index_stale():
+    return search_index.built_at is None or time_mod.monotonic() - search_index.built_at > SEARCH_INDEX_TTL
+
+def _memory_search_index():
+    if _search_index_stale():
+        # one rebuild per expiry: searches that queued behind it find it fresh
+        with _search_index_lock:
+            if _search_index_stale():
+                search_index.rebuild(db.session.query(Book.book_id, Book.title, Book.author).yield_per(5000))
+    return search_index
+
+def _book_list_query():
+    return (
+        db.session.query(Book, BookCover.sha256, Book.image.isnot(None).label('has_image'))
+        .outerjoin(BookCover, BookCover.book_id == Book.book_id)
+    )
+
+def _book_summary(b, cover_hash, has_image):
+    return {
+        'book_id':          b.book_id,
+        'isbn':             b.isbn,
+        'title':            b.title,
+        'author':           b.author,
+        'copies_available': b.copies_available,
+        'cover_hash':       cover_hash,
+        'cover_url':        _cover_url(b.book_id, cover_hash, 'small') if has_image else None
+    }
+
+# Shorter all-digit queries ("1984") are searched as text, not as ISBN prefixes
+ISBN_PREFIX_MIN_DIGITS = 10
+
 @app.route('/books', methods=['GET'])
 def search_books():
     search_term = request.args.get('q', '').strip()
-    page        = request.args.get('page', 1, type=int)
+    page        = max(request.args.get('page', 1, type=int), 1)
     per_page    = 10
 
-    qry = Book.query
-    if search_term:
-        qry = qry.filter(
-            or_(
-                Book.isbn.ilike(f'%{search_term}%'),
-                Book.title.ilike(f'%{search_term}%'),
-                Book.author.ilike(f'%{search_term}%')
-            )
-        )
-
-    paginated = qry.paginate(page=page, per_page=per_page, error_out=False)
-
-    items = []
-    for b in paginated.items:
-        # base64 encode the binary if present
-        img_b64 = base64.b64encode(b.image).decode('ascii') if b.image else None
+    # Opt-in cursor mode (?after=<cursor>&limit=N): seeks on the sort key, no COUNT(*)
+    use_cursor = cursor_requested(request.args)
+    try:
+        after, limit = cursor_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    want_total = not use_cursor or request.args.get('count') == 'true'
+
+    qry = _book_list_query()
+    isbn = normalize_isbn(search_term)
+    digits = search_term.replace('-', '').replace(' ', '')
+    isbn_prefix = digits.isdigit() and len(digits) >= ISBN_PREFIX_MIN_DIGITS
+    dialect = db.engine.dialect.name
+    score = fulltext_rank(dialect, Book.title, Book.author, search_term) if search_term else None
+
+    # exact ISBN fast path (stored with or without hyphens)
+    exact = qry.filter(Book.isbn_key == isbn).all() if isbn else []
+
+    total = next_cursor = None
+    if exact:
+        rows, total = exact, len(exact)
+        if not use_cursor and page > 1:
+            rows = []
+    elif search_term and not isbn_prefix and score is None:
+        # no full-text engine (SQLite): rank with the in-process index
+        index = _memory_search_index()
+        if use_cursor:
+            try:
+                total, ranked = index.search_after(search_term, after, limit + 1)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            if len(ranked) > limit:
+                ranked = ranked[:limit]
+                last_id, last_score = ranked[-1]
+                next_cursor = encode_cursor([last_score, last_id])
+        else:
+            total, ranked = index.search_page(search_term, (page - 1) * per_page, per_page)
+        page_ids = [book_id for book_id, _ in ranked]
+        by_id = {row[0].book_id: row for row in qry.filter(Book.book_id.in_(page_ids)).all()} if page_ids else {}
+        rows = [by_id[book_id] for book_id in page_ids if book_id in by_id]
+    else:
+        if isbn_prefix:
+            # partial ISBN typeahead: left-anchored, so it can use the unique index
+            qry = qry.filter(Book.isbn.startswith(digits))
+            keys, key_of = [(Book.isbn, False)], lambda row: [row[0].isbn]
+        elif search_term:
+            qry = qry.add_columns(score.label('score')) \
+                     .filter(fulltext_match(dialect, Book.title, Book.author, search_term))
+            keys, key_of = [(score, True), (Book.book_id, False)], lambda row: [row.score, row[0].book_id]
+        else:
+            keys, key_of = [(Book.book_id, False)], lambda row: [row[0].book_id]
+
+        if use_cursor:
+            try:
+                rows, next_cursor = keyset_page(qry, keys, after, limit, key_of)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            if want_total:
+                total = qry.order_by(None).count()
+        else:
+            paginated = qry.order_by(*order_by_keys(keys)).paginate(page=page, per_page=per_page, error_out=False)
+            rows, total = paginated.items, paginated.total
 
-        items.append({
-            'book_id':          b.book_id,
-            'isbn':             b.isbn,
-            'title':            b.title,
-            'author':           b.author,
-            'copies_available': b.copies_available,
-            'image_base64':     img_b64
+    items = [_book_summary(*row[:3]) for row in rows]
+    if use_cursor:
+        return jsonify({
+            'items':       items,
+            'next_cursor': next_cursor,
+            'limit':       limit,
+            'total':       total if want_total else None
         })
-
     return jsonify({
         'items':    items,
-        'total':    paginated.total,
-        'page':     paginated.page,
-        'per_page': paginated.per_page,
-        'pages':    paginated.pages
+        'total':    total,
+        'page':     page,
+        'per_page': per_page,
+        'pages':    math.ceil(total / per_page) if total else 0
     })
 
 
@@ -435,6 +611,7 @@ def add_book():
     year_raw      = request.form.get('year', '').strip()
     copies_raw    = request.form.get('copies_total', '').strip()
     image_file    = request.files.get('image')
+    cover_upload  = _read_cover_upload(image_file) if image_file else None
 
     # Validate
     if not isbn_raw:
@@ -470,11 +647,11 @@ def add_book():
             copies_available=copies
         )
 
-        if image_file:
-            new_book.image = image_file.read()
-
         db.session.add(new_book)
+        if cover_upload:
+            _store_cover(new_book, cover_upload)
         db.session.commit()
+        search_index.add(new_book.book_id, new_book.title, new_book.author)
 
         return jsonify({
             'message': 'Book added successfully',
@@ -504,23 +681,35 @@ def update_book_status(book_id):
     if request.method == 'OPTIONS':
         return '', 200  # allow preflight CORS request
    
-    book = Book.query.get(book_id)
-    if not book:
-        return jsonify({'error': 'Book not found'}), 404
-    
     action = request.json.get('action')
     
+    # Adjust counts in SQL so a concurrent reservation is never overwritten
     if action == 'add':
-        book.copies_total += 1
-        book.copies_available += 1
+        values = {
+            'copies_total':     Book.copies_total + 1,
+            'copies_available': Book.copies_available + 1
+        }
     elif action == 'remove':
-        if book.copies_available > 0:
-            book.copies_available -= 1
-        book.copies_total -= 1
+        values = {
+            'copies_total':     Book.copies_total - 1,
+            'copies_available': case((Book.copies_available > 0, Book.copies_available - 1),
+                                     else_=Book.copies_available)
+        }
     else:
         return jsonify({'error': 'Invalid action'}), 400
     
+    result = db.session.execute(
+        update(Book).where(Book.book_id == book_id).values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        db.session.rollback()
+        return jsonify({'error': 'Book not found'}), 404
+    allocated = _allocate_holds([book_id]) if action == 'add' else {}
     db.session.commit()
+    _holds_allocated(allocated)
+
+    book = Book.query.get(book_id)
     return jsonify({
         'copies_total': book.copies_total,
         'copies_available': book.copies_available
@@ -536,6 +725,9 @@ def update_book(book_id):
     if request.method == 'OPTIONS':
         return '', 200
 
+    image_file = request.files.get('image')
+    cover_upload = _read_cover_upload(image_file) if image_file else None
+
     # Extract updated fields
     book.title = request.form.get('title', book.title)
     book.author = request.form.get('author', book.author)
@@ -544,27 +736,352 @@ def update_book(book_id):
     book.isbn = request.form.get('isbn', book.isbn)
 
     # Optional: update image
-    image_file = request.files.get('image')
-    if image_file:
-        book.image = image_file.read()
+    if cover_upload:
+        _store_cover(book, cover_upload)
 
     try:
         db.session.commit()
+        search_index.add(book.book_id, book.title, book.author)
         return jsonify({'message': 'Book updated successfully'}), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 
+# Bulk catalogue import (CSV / JSONL), streamed and upserted on ISBN in chunks
+BOOK_IMPORT_CHUNK = int(os.environ.get('BOOK_IMPORT_CHUNK', 500))
+
+def _import_chunk(books, cover_names, covers, counts):
+    isbns = list(books)
+    existing = {isbn for (isbn,) in db.session.query(Book.isbn).filter(Book.isbn.in_(isbns))}
+    # re-importing a title adjusts availability by the change in copies_total
+    upsert(db.session, Book, list(books.values()), ('isbn',), lambda new: {
+        'copies_available': case(
+            (Book.copies_available + new.copies_total - Book.copies_total < 0, 0),
+            else_=Book.copies_available + new.copies_total - Book.copies_total
+        ),
+        'copies_total': new.copies_total,
+        'title':        new.title,
+        'author':       new.author,
+        'publisher':    new.publisher,
+        'year':         new.year,
+    })
+    added_covers = 0
+    if cover_names:
+        book_ids = dict(db.session.query(Book.isbn, Book.book_id).filter(Book.isbn.in_(list(cover_names))))
+        for isbn, cover_name in cover_names.items():
+            image = covers.find(isbn, cover_name)
+            variants = process_cover(image) if image and isbn in book_ids and _sniff_image_type(image) else []
+            if variants:
+                db.session.execute(
+                    update(Book).where(Book.book_id == book_ids[isbn]).values(image=image)
+                    .execution_options(synchronize_session=False)
+                )
+                _record_cover(book_ids[isbn], image, variants)
+                added_covers += 1
+
+    counts['inserted'] += len(books) - len(existing)
+    counts['updated']  += len(existing)
+    counts['covers']   += added_covers
+
+def _save_import_progress(job_id, counts, errors, **fields):
+    job = db.session.get(ImportJob, job_id)
+    for name, value in counts.items():
+        setattr(job, name, value)
+    job.errors = list(errors)
+    for name, value in fields.items():
+        setattr(job, name, value)
+    db.session.commit()
+    return job
+
+def run_catalogue_import(job_id, path, fmt, covers_path=None):
+    counts = {'processed': 0, 'inserted': 0, 'updated': 0, 'failed': 0, 'covers': 0}
+    errors = []
+    _save_import_progress(job_id, counts, errors, status='running')
+
+    covers = CoverArchive(covers_path)
+    final = {'status': 'completed'}
+    try:
+        with open(path, 'rb') as fh:
+            for chunk in chunked(iter_records(fh, fmt), BOOK_IMPORT_CHUNK):
+                books, cover_names = {}, {}
+                for line_no, record in chunk:
+                    counts['processed'] += 1
+                    try:
+                        if isinstance(record, Exception):
+                            raise record
+                        book, cover_name = parse_book(record)
+                    except ValueError as e:
+                        counts['failed'] += 1
+                        if len(errors) < MAX_REPORTED_ERRORS:
+                            isbn = record.get('isbn') if isinstance(record, dict) else None
+                            errors.append({'line': line_no, 'isbn': isbn, 'error': str(e)})
+                        continue
+                    # the last row for an ISBN within a chunk wins
+                    books[book['isbn']] = book
+                    if cover_name or covers_path:
+                        cover_names[book['isbn']] = cover_name
+
+                try:
+                    _import_chunk(books, cover_names, covers, counts)
+                    _save_import_progress(job_id, counts, errors)
+                except SQLAlchemyError as e:
+                    db.session.rollback()
+                    app.logger.error("SQLAlchemyError importing books:\n" + traceback.format_exc())
+                    counts['failed'] += len(books)
+                    if len(errors) < MAX_REPORTED_ERRORS:
+                        errors.append({'line': chunk[0][0], 'isbn': None,
+                                       'error': f'chunk of {len(books)} rows failed: {e.__class__.__name__}'})
+                    _save_import_progress(job_id, counts, errors)
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error("Book import failed:\n" + traceback.format_exc())
+        final = {'status': 'failed', 'message': str(e)}
+    finally:
+        covers.close()
+        search_index.expire()
+    return _save_import_progress(job_id, counts, errors, finished_at=datetime.utcnow(), **final)
+
+def _import_job_json(job):
+    return {
+        'job_id':      job.job_id,
+        'status':      job.status,
+        'source':      job.source,
+        'processed':   job.processed,
+        'inserted':    job.inserted,
+        'updated':     job.updated,
+        'failed':      job.failed,
+        'covers':      job.covers,
+        'errors':      job.errors or [],
+        'message':     job.message,
+        'created_at':  job.created_at.isoformat() if job.created_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None
+    }
+
+@app.route('/books/import', methods=['POST'])
+def import_books():
+    if g.current_user.role != 'staff':
+        raise Forbidden('Staff only')
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        return jsonify({'error': 'A CSV or JSONL file is required'}), 400
+    try:
+        fmt = detect_format(upload.filename, request.form.get('format'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # spool to disk; the worker thread streams from there
+    workdir = tempfile.mkdtemp(prefix='book-import-')
+    path = os.path.join(workdir, 'catalogue')
+    upload.save(path)
+    covers_path = None
+    covers_file = request.files.get('covers')
+    if covers_file and covers_file.filename:
+        covers_path = os.path.join(workdir, 'covers.zip')
+        covers_file.save(covers_path)
+
+    job = ImportJob(job_id=str(uuid.uuid4()), source=upload.filename[:256], status='queued')
+    db.session.add(job)
+    db.session.commit()
+    job_id = job.job_id
+
+    def work():
+        with app.app_context():
+            try:
+                run_catalogue_import(job_id, path, fmt, covers_path)
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    threading.Thread(target=work, name=f'book-import-{job_id}', daemon=True).start()
+    return jsonify({
+        'job_id':     job_id,
+        'status':     'queued',
+        'status_url': url_for('import_status', job_id=job_id)
+    }), 202
+
+@app.route('/books/import/<string:job_id>', methods=['GET'])
+def import_status(job_id):
+    job = ImportJob.query.get_or_404(job_id)
+    return jsonify(_import_job_json(job))
+
+@app.cli.command('import-books')
+@click.argument('path')
+@click.option('--covers', 'covers_path', default=None, help='zip of cover images named <isbn>.<ext>')
+@click.option('--format', 'fmt', default=None, help='csv or jsonl (default: from the file extension)')
+def import_books_command(path, covers_path, fmt):
+    """Import a catalogue file, upserting books on ISBN."""
+    job = ImportJob(job_id=str(uuid.uuid4()), source=os.path.basename(path)[:256], status='queued')
+    db.session.add(job)
+    db.session.commit()
+    job = run_catalogue_import(job.job_id, path, detect_format(path, fmt), covers_path)
+    summary = _import_job_json(job)
+    for error in summary['errors']:
+        click.echo(f"line {error['line']}: {error['error']}", err=True)
+    click.echo(f"{summary['status']}: {summary['processed']} rows, {summary['inserted']} inserted, "
+               f"{summary['updated']} updated, {summary['failed']} failed, {summary['covers']} covers")
+
 # 4. Create Reservation
+# Copies are claimed and released with single conditional UPDATEs; the row
+# lock is held only for the remainder of that short transaction.
+def _take_copy(book_id):
+    """Atomically claim one available copy. False if none are left."""
+    result = db.session.execute(
+        update(Book)
+        .where(Book.book_id == book_id, Book.copies_available > 0)
+        .values(copies_available=Book.copies_available - 1)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+def _return_copies(book_id, count=1):
+    """Atomically put copies back, never above copies_total."""
+    result = db.session.execute(
+        update(Book)
+        .where(Book.book_id == book_id, Book.copies_available + count <= Book.copies_total)
+        .values(copies_available=Book.copies_available + count)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+# Hold queue: with no copy left, reserve_book queues the student (once per
+# book) instead of failing. Every path that puts copies back calls
+# _allocate_holds in its own transaction, which turns the oldest waiting holds
+# into reservations for as many copies as are free. Changes to a book's queue
+# take the book row lock; positions come from hold_queues in memory.
+HOLD_PICKUP_HOURS = int(os.environ.get('HOLD_PICKUP_HOURS', 24))
+
+def _waiting_hold_ids(book_id):
+    return db.session.execute(
+        select(BookHold.hold_id).where(BookHold.book_id == book_id, BookHold.status == 'waiting')
+    ).scalars().all()
+
+hold_queues = HoldQueues(_waiting_hold_ids, ttl=int(os.environ.get('HOLD_QUEUE_TTL', 30)))
+metrics.register('hold_queues', hold_queues.stats)
+
+def _lock_book(book_id):
+    """Lock one book row; returns its copies_available, or None if there is no such book."""
+    return db.session.execute(
+        select(Book.copies_available).where(Book.book_id == book_id).with_for_update()
+    ).scalar()
+
+def _allocate_holds(book_ids):
+    """
+    Hand the free copies of `book_ids` to their oldest waiting holds in one
+    batch: a reservation per allocated hold, one UPDATE for the holds, one
+    executemany each for the copy counts and the users' counters. Runs in the
+    caller's transaction; returns {book_id: [hold_id, ...]} for
+    _holds_allocated() once that has committed.
+    """
+    book_ids = sorted(set(book_ids))
+    if not book_ids:
+        return {}
+    locked = db.session.execute(
+        select(Book.book_id).where(Book.book_id.in_(book_ids), Book.copies_available > 0)
+        .order_by(Book.book_id).with_for_update()
+    ).scalars().all()
+    if not locked:
+        return {}
+
+    queue = (
+        select(BookHold.hold_id, BookHold.book_id, BookHold.user_id, BookHold.library_id,
+               func.row_number().over(partition_by=BookHold.book_id, order_by=BookHold.hold_id).label('place'))
+        .where(BookHold.book_id.in_(locked), BookHold.status == 'waiting')
+        .subquery()
+    )
+    winners = db.session.execute(
+        select(queue.c.hold_id, queue.c.book_id, queue.c.user_id, queue.c.library_id)
+        .join(Book, Book.book_id == queue.c.book_id)
+        .where(queue.c.place <= Book.copies_available)
+        .order_by(queue.c.hold_id)
+    ).all()
+    if not winners:
+        return {}
+
+    now = datetime.utcnow()
+    db.session.execute(Reservation.__table__.insert(), [{
+        'user_id':        w.user_id,
+        'book_id':        w.book_id,
+        'library_id':     w.library_id,
+        'reserved_from':  now,
+        'reserved_until': now + timedelta(hours=HOLD_PICKUP_HOURS),
+        'status':         'active',
+    } for w in winners])
+    db.session.execute(
+        update(BookHold)
+        .where(BookHold.hold_id.in_([w.hold_id for w in winners]))
+        .values(status='allocated', allocated_at=now)
+        .execution_options(synchronize_session=False)
+    )
+
+    allocated, per_user = {}, {}
+    for w in winners:
+        allocated.setdefault(w.book_id, []).append(w.hold_id)
+        per_user[w.user_id] = per_user.get(w.user_id, 0) + 1
+    books, summary = Book.__table__, UserSummary.__table__
+    db.session.execute(
+        update(books).where(books.c.book_id == bindparam('bid'))
+        .values(copies_available=books.c.copies_available - bindparam('n')),
+        [{'bid': book_id, 'n': len(ids)} for book_id, ids in allocated.items()]
+    )
+    db.session.execute(
+        update(summary).where(summary.c.user_id == bindparam('uid'))
+        .values(active_reservations=summary.c.active_reservations + bindparam('n')),
+        [{'uid': uid, 'n': n} for uid, n in per_user.items()]
+    )
+    return allocated
+
+def _holds_allocated(allocated):
+    for book_id, hold_ids in allocated.items():
+        hold_queues.remove(book_id, *hold_ids)
+
+def _hold_json(hold):
+    waiting = hold.status == 'waiting'
+    return {
+        'hold_id':      hold.hold_id,
+        'book_id':      hold.book_id,
+        'library_id':   hold.library_id,
+        'status':       hold.status,
+        'requested_at': hold.requested_at.isoformat(),
+        'allocated_at': hold.allocated_at.isoformat() if hold.allocated_at else None,
+        'position':     hold_queues.position(hold.book_id, hold.hold_id) if waiting else None,
+        'queue_length': hold_queues.length(hold.book_id) if waiting else None,
+    }
+
+def _queue_hold(book_id, library_id):
+    if _lock_book(book_id) is None:
+        db.session.rollback()
+        abort(404)
+    user_id = g.current_user.user_id
+    hold = BookHold.query.filter_by(book_id=book_id, user_id=user_id, status='waiting').first()
+    if hold:
+        db.session.commit()
+        return jsonify(_hold_json(hold)), 200
+    # an allocated hold became an active reservation: the patron already has a copy waiting
+    reservation_id = db.session.execute(
+        select(Reservation.reservation_id)
+        .where(Reservation.book_id == book_id, Reservation.user_id == user_id, Reservation.status == 'active')
+        .limit(1)
+    ).scalar()
+    if reservation_id is not None:
+        db.session.rollback()
+        return jsonify({'error': 'You already have an active reservation for this book',
+                        'reservation_id': reservation_id}), 409
+
+    hold = BookHold(book_id=book_id, user_id=user_id, library_id=library_id)
+    db.session.add(hold)
+    db.session.flush()
+    # a copy may have come back since _take_copy failed; it goes to the queue
+    allocated = _allocate_holds([book_id])
+    db.session.commit()
+    _holds_allocated(allocated)
+    db.session.refresh(hold)
+    if hold.status == 'waiting':
+        hold_queues.add(book_id, hold.hold_id)
+    return jsonify(_hold_json(hold)), 202
+
 @app.route('/books/<int:book_id>/reserve', methods=['POST'])
 def reserve_book(book_id):
-    book = Book.query.get_or_404(book_id)
-    data = request.get_json()
-    
-    
-    if book.copies_available <= 0:
-        return jsonify({'error': 'No available copies'}), 400
+    data = request.get_json() or {}
     
     # Calculate reservation period (default 2 hours)
     reserved_from = datetime.now(timezone.utc)
@@ -573,6 +1090,15 @@ def reserve_book(book_id):
     if 'reserved_until' in data:
         reserved_until = datetime.fromisoformat(data['reserved_until'])
     
+    if not _take_copy(book_id):
+        db.session.rollback()
+        if data.get('hold') is False:
+            if not db.session.query(Book.book_id).filter_by(book_id=book_id).first():
+                abort(404)
+            return jsonify({'error': 'No available copies'}), 400
+        # no copy left: join the book's hold queue instead (202 with the position)
+        return _queue_hold(book_id, data.get('library_id', 1))
+    
     reservation = Reservation(
         user_id = g.current_user.user_id,
         book_id=book_id,
@@ -581,8 +1107,8 @@ def reserve_book(book_id):
         reserved_until=reserved_until
     )
     
-    book.copies_available -= 1
     db.session.add(reservation)
+    _adjust_summary(g.current_user.user_id, reservations=1)
     db.session.commit()
     
     return jsonify({
@@ -592,11 +1118,10 @@ def reserve_book(book_id):
 
 @app.route('/books/<int:book_id>', methods=['GET'])
 def get_book_by_id(book_id):
-    book = Book.query.get(book_id)
-    if not book:
+    row = _book_list_query().filter(Book.book_id == book_id).first()
+    if not row:
         return jsonify({'error': 'Book not found'}), 404
-
-    img_b64 = base64.b64encode(book.image).decode('ascii') if book.image else None
+    book, cover_hash, has_image = row
 
     return jsonify({
         'book_id':          book.book_id,
@@ -606,10 +1131,249 @@ def get_book_by_id(book_id):
         'publisher':        book.publisher,
         'year':             book.year,
         'copies_available': book.copies_available,
-        'image_base64':     img_b64
+        'cover_hash':       cover_hash,
+        'cover_url':        _cover_url(book.book_id, cover_hash, 'large') if has_image else None
     })
 
 
+# Reading lists and batch availability. A module's reading list maps its code
+# to book ids; /books/availability answers many books (ids, ISBNs and/or a
+# module code) with compact rows from one query on the book primary key and
+# isbn index. availability_cache keeps those rows for AVAILABILITY_CACHE_TTL
+# seconds and the reading_list_warm job refreshes the books of recently
+# requested modules in the background, so start-of-semester lookups are
+# answered from memory.
+AVAILABILITY_MAX_ITEMS = 200
+AVAILABILITY_FIELDS    = (Book.book_id, Book.isbn, Book.title, Book.copies_available, Book.copies_total)
+
+def _load_availability(book_ids, isbns):
+    conditions = []
+    if book_ids:
+        conditions.append(Book.book_id.in_(book_ids))
+    if isbns:
+        conditions.append(Book.isbn_key.in_(_isbn_keys(isbns)))
+    return [row._asdict() for row in db.session.execute(select(*AVAILABILITY_FIELDS).where(or_(*conditions)))]
+
+def _load_module_books(code):
+    return db.session.execute(
+        select(ModuleBook.book_id).where(ModuleBook.module_code == code).order_by(ModuleBook.book_id)
+    ).scalars().all()
+
+def _load_reading_lists(codes):
+    rows = db.session.execute(
+        select(ModuleBook.module_code, *AVAILABILITY_FIELDS)
+        .join(Book, Book.book_id == ModuleBook.book_id)
+        .where(ModuleBook.module_code.in_(codes))
+        .order_by(ModuleBook.module_code, ModuleBook.book_id)
+    )
+    return [(code, {'book_id': book_id, 'isbn': isbn, 'title': title,
+                    'copies_available': available, 'copies_total': total})
+            for code, book_id, isbn, title, available, total in rows]
+
+AVAILABILITY_CACHE_TTL = int(os.environ.get('AVAILABILITY_CACHE_TTL', 10))
+READING_LIST_WARM_WINDOW = int(os.environ.get('READING_LIST_WARM_WINDOW', 600))
+availability_cache = AvailabilityCache(_load_availability, _load_module_books, _load_reading_lists,
+                                       ttl=AVAILABILITY_CACHE_TTL, warm_window=READING_LIST_WARM_WINDOW)
+metrics.register('availability_cache', availability_cache.stats)
+
+def _id_list(values):
+    if isinstance(values, str):
+        values = [v for v in values.split(',') if v.strip()]
+    try:
+        return [int(v) for v in values or []]
+    except (TypeError, ValueError):
+        abort(400, description="'book_ids' must be integers")
+
+def _isbn_list(values):
+    if isinstance(values, str):
+        values = values.split(',')
+    return [str(v).strip() for v in values or [] if str(v).strip()]
+
+def _isbn_keys(isbns):
+    return sorted({isbn_key(isbn) for isbn in isbns})
+
+def _availability_response(book_ids, isbns, module=None):
+    if module is not None:
+        code = normalize_module_code(module)
+        if not code:
+            abort(400, description="'module' must be a module code like INF1511")
+        book_ids = list(availability_cache.module_books(code)) + book_ids
+    if not book_ids and not isbns:
+        abort(400, description="Give 'book_ids', 'isbns' or 'module'")
+    if len(book_ids) + len(isbns) > AVAILABILITY_MAX_ITEMS:
+        abort(400, description=f"At most {AVAILABILITY_MAX_ITEMS} books per request")
+
+    rows, missing = availability_cache.lookup(book_ids, isbns)
+    body = {
+        'items': [dict(row, available=row['copies_available'] > 0) for row in rows],
+        'missing': missing,
+    }
+    if module is not None:
+        body['module'] = code
+    return jsonify(body), 200
+
+# GET /books/availability?book_ids=1,2&isbns=978...,978...&module=INF1511
+# (or POST the same keys as JSON lists for long reading lists)
+@app.route('/books/availability', methods=['GET', 'POST'])
+def book_availability():
+    source = (request.get_json(silent=True) or {}) if request.method == 'POST' else request.args
+    return _availability_response(_id_list(source.get('book_ids')), _isbn_list(source.get('isbns')),
+                                  source.get('module'))
+
+@app.route('/modules/<string:module_code>/books', methods=['GET'])
+def module_books(module_code):
+    return _availability_response([], [], module_code)
+
+# Replace a module's reading list (staff): {"book_ids": [...], "isbns": [...]}
+@app.route('/modules/<string:module_code>/books', methods=['PUT'])
+def set_module_books(module_code):
+    if g.current_user.role != 'staff':
+        raise Forbidden('Staff only')
+    code = normalize_module_code(module_code)
+    if not code:
+        abort(400, description="Module code must look like INF1511")
+    data = request.get_json() or {}
+    book_ids = _id_list(data.get('book_ids'))
+    isbns = _isbn_list(data.get('isbns'))
+    if len(book_ids) + len(isbns) > AVAILABILITY_MAX_ITEMS:
+        abort(400, description=f"At most {AVAILABILITY_MAX_ITEMS} books per reading list")
+
+    found = _load_availability(book_ids, isbns) if book_ids or isbns else []
+    known_ids = {row['book_id'] for row in found}
+    known_isbns = {isbn_key(row['isbn']) for row in found}
+    unknown = [b for b in book_ids if b not in known_ids] + [i for i in isbns if isbn_key(i) not in known_isbns]
+    if unknown:
+        return jsonify({'error': 'Unknown books', 'unknown': unknown}), 400
+
+    db.session.execute(delete(ModuleBook).where(ModuleBook.module_code == code))
+    if known_ids:
+        db.session.execute(ModuleBook.__table__.insert(), [
+            {'module_code': code, 'book_id': book_id, 'added_at': datetime.utcnow()}
+            for book_id in sorted(known_ids)
+        ])
+    db.session.commit()
+    availability_cache.invalidate_module(code)
+
+    return jsonify({'module': code, 'book_ids': sorted(known_ids)}), 200
+
+
+# Book covers are served separately from the catalogue JSON, with a strong
+# ETag (sha256 of the bytes). URLs carrying ?v=<hash> never change content.
+IMAGE_SIGNATURES = [
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+]
+
+def _sniff_image_type(data):
+    """The image type the bytes themselves declare, or None. The client's Content-Type is never trusted."""
+    for signature, mime_type in IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return mime_type
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    return None
+
+def _read_cover_upload(image_file):
+    """(bytes, variants) of an uploaded cover; only covers that decode and re-encode are accepted."""
+    data = image_file.read()
+    if _sniff_image_type(data) is None:
+        abort(400, description="Cover image must be a JPEG, PNG, GIF or WebP file")
+    if not cover_pipeline.available():
+        abort(503, description="Cover processing is not available")
+    variants = process_cover(data)
+    if not variants:
+        abort(400, description="Cover image could not be decoded")
+    return data, variants
+
+def _store_cover(book, upload):
+    data, variants = upload
+    book.image = data
+    db.session.flush()  # make sure book_id is populated
+    return _record_cover(book.book_id, data, variants)
+
+def _record_cover(book_id, data, variants=None):
+    cover = db.session.get(BookCover, book_id) or BookCover(book_id=book_id)
+    with _unprocessable_lock:
+        _unprocessable_covers.pop((book_id, cover.sha256), None)
+    cover.sha256     = hashlib.sha256(data).hexdigest()
+    cover.mime_type  = _sniff_image_type(data) or 'application/octet-stream'
+    cover.size_bytes = len(data)
+    db.session.add(cover)
+    _store_cover_variants(book_id, data, variants)
+    return cover
+
+def _store_cover_variants(book_id, data, variants=None):
+    variants = process_cover(data) if variants is None else variants
+    db.session.execute(delete(BookCoverVariant).where(BookCoverVariant.book_id == book_id))
+    for v in variants:
+        db.session.add(BookCoverVariant(
+            book_id=book_id, variant=v.name, mime_type=v.mime_type, sha256=v.sha256,
+            width=v.width, height=v.height, size_bytes=len(v.data), data=v.data
+        ))
+    return len(variants)
+
+def _cover_url(book_id, cover_hash, size=None):
+    params = {'size': size} if size else {}
+    if cover_hash:
+        params['v'] = cover_hash[:16]
+    return url_for('get_book_cover', book_id=book_id, **params)
+
+# covers this worker failed to decode, by (book_id, sha256) so a replaced
+# cover is tried afresh; don't retry them on every request
+UNPROCESSABLE_COVERS_MAX = int(os.environ.get('UNPROCESSABLE_COVERS_MAX', 10000))
+_unprocessable_covers = LRUCache(maxsize=UNPROCESSABLE_COVERS_MAX)
+_unprocessable_lock = threading.Lock()
+
+@app.route('/books/<int:book_id>/cover', methods=['GET'])
+def get_book_cover(book_id):
+    size = request.args.get('size', 'large')
+    if size != 'original' and size not in VARIANT_SIZES:
+        return jsonify({'error': f"size must be 'original' or one of {sorted(VARIANT_SIZES)}"}), 400
+
+    cover = db.session.get(BookCover, book_id)
+    if not cover:
+        # books stored before covers had metadata: backfill on first request
+        image = db.session.query(Book.image).filter(Book.book_id == book_id).scalar()
+        if not image:
+            return jsonify({'error': 'Cover not found'}), 404
+        cover = _record_cover(book_id, image)
+        db.session.commit()
+
+    # 'original' is the largest re-encoded variant: the upload itself still carries its metadata
+    name = LARGEST_VARIANT if size == 'original' else size
+    variant = db.session.get(BookCoverVariant, (book_id, name))
+    if variant is None and cover_pipeline.available() and (book_id, cover.sha256) not in _unprocessable_covers:
+        image = db.session.query(Book.image).filter(Book.book_id == book_id).scalar()
+        if image and _store_cover_variants(book_id, image):
+            db.session.commit()
+            variant = db.session.get(BookCoverVariant, (book_id, name))
+        else:
+            key = (book_id, cover.sha256)
+            db.session.rollback()
+            with _unprocessable_lock:
+                _unprocessable_covers[key] = True
+    if variant is None:
+        # only re-encoded variants are served: the upload itself never reaches clients
+        return jsonify({'error': 'Cover not available'}), 404
+
+    # Answer revalidations from the small metadata rows, without reading any blob
+    if request.if_none_match.contains(variant.sha256):
+        resp = make_response('', 304)
+    else:
+        resp = make_response(variant.data)
+        resp.headers['Content-Type'] = variant.mime_type
+
+    resp.set_etag(variant.sha256)
+    resp.headers['X-Content-Type-Options'] = 'nosniff'
+    if request.args.get('v') and cover.sha256.startswith(request.args['v']):
+        resp.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        resp.headers['Cache-Control'] = 'public, no-cache'
+    return resp
+
+
 # GET /reservations
 @app.route('/reservations', methods=['GET', 'OPTIONS'])
 def get_reservations():
@@ -622,7 +1386,18 @@ def get_reservations():
     if book_id:
         query = query.filter_by(book_id=book_id)
     
-    reservations = query.all()
+    next_cursor = None
+    if cursor_requested(request.args):
+        try:
+            after, limit = cursor_args(request.args)
+            reservations, next_cursor = keyset_page(
+                query, [(Reservation.reservation_id, False)], after, limit,
+                lambda r: [r.reservation_id]
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    else:
+        reservations = query.all()
     
     return jsonify({
         'items': [{
@@ -632,7 +1407,8 @@ def get_reservations():
             'reserved_from': r.reserved_from.isoformat(),
             'reserved_until': r.reserved_until.isoformat(),
             'status': r.status
-        } for r in reservations]
+        } for r in reservations],
+        'next_cursor': next_cursor
     })
 
 @app.route('/users/<string:firebase_uid>/reservations', methods=['GET', 'OPTIONS'])
@@ -673,8 +1449,16 @@ def collect_reservation(reservation_id):
     if reservation.user_id != g.current_user.user_id:
         raise Forbidden("You can only collect your own reservations")
     
-    # Validate reservation status
-    if reservation.status != 'active':
+    # Validate and update reservation status in one step so a double submit
+    # can't create two loans
+    result = db.session.execute(
+        update(Reservation)
+        .where(Reservation.reservation_id == reservation_id, Reservation.status == 'active')
+        .values(status='fulfilled')
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        db.session.rollback()
         return jsonify({'error': 'Reservation is not active'}), 400
     
     # Create loan with 5-day default period
@@ -682,15 +1466,14 @@ def collect_reservation(reservation_id):
     loan = Loan(
         user_id=reservation.user_id,
         book_id=reservation.book_id,
+        library_id=reservation.library_id,
         checkout_date=today,
-        due_date=today + timedelta(days=5)
+        due_date=today + timedelta(days=LOAN_PERIOD_DAYS)
     )
     
-    # Update reservation status
-    reservation.status = 'fulfilled'
-    
     # Commit changes
     db.session.add(loan)
+    _adjust_summary(reservation.user_id, reservations=-1, loans=1)
     db.session.commit()
     
     return jsonify({
@@ -701,16 +1484,132 @@ def collect_reservation(reservation_id):
 @app.route('/reservations/<int:reservation_id>', methods=['DELETE'])
 def delete_reservation(reservation_id):
     reservation = Reservation.query.get_or_404(reservation_id)
-    book = Book.query.get(reservation.book_id)
-    
-    # Increase book availability
-    book.copies_available += 1
-    
-    db.session.delete(reservation)
+    book_id = reservation.book_id
+    user_id = reservation.user_id
+    
+    # Only an active reservation holds a copy. Deleting it conditionally means
+    # two concurrent cancels can't both hand the copy back.
+    result = db.session.execute(
+        delete(Reservation)
+        .where(Reservation.reservation_id == reservation_id, Reservation.status == 'active')
+        .execution_options(synchronize_session=False)
+    )
+    allocated = {}
+    if result.rowcount:
+        _return_copies(book_id)
+        _adjust_summary(user_id, reservations=-1)
+        allocated = _allocate_holds([book_id])
+    else:
+        db.session.execute(
+            delete(Reservation)
+            .where(Reservation.reservation_id == reservation_id)
+            .execution_options(synchronize_session=False)
+        )
     db.session.commit()
+    _holds_allocated(allocated)
     
     return jsonify({'message': 'Reservation cancelled successfully'}), 200
 
+# Holds of the current user (waiting ones with their queue position)
+@app.route('/holds', methods=['GET'])
+def get_holds():
+    status = request.args.get('status', 'waiting')
+    holds = (BookHold.query
+             .filter_by(user_id=g.current_user.user_id, status=status)
+             .order_by(BookHold.hold_id.desc())
+             .limit(100).all())
+    return jsonify({'items': [_hold_json(h) for h in holds]}), 200
+
+@app.route('/holds/<int:hold_id>', methods=['GET'])
+def get_hold(hold_id):
+    hold = BookHold.query.get_or_404(hold_id)
+    if hold.user_id != g.current_user.user_id and g.current_user.role != 'staff':
+        raise Forbidden('You can only view your own holds')
+    return jsonify(_hold_json(hold)), 200
+
+@app.route('/holds/<int:hold_id>', methods=['DELETE'])
+def cancel_hold(hold_id):
+    hold = BookHold.query.get_or_404(hold_id)
+    if hold.user_id != g.current_user.user_id and g.current_user.role != 'staff':
+        raise Forbidden('You can only cancel your own holds')
+
+    _lock_book(hold.book_id)
+    result = db.session.execute(
+        update(BookHold)
+        .where(BookHold.hold_id == hold_id, BookHold.status == 'waiting')
+        .values(status='cancelled')
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        db.session.rollback()
+        return jsonify({'error': 'Hold is no longer waiting'}), 400
+    db.session.commit()
+    hold_queues.remove(hold.book_id, hold_id)
+
+    return jsonify({'message': 'Hold cancelled'}), 200
+
+# Reservation expiry: active reservations past reserved_until are cancelled in
+# bounded batches and their copies go back on the shelf in the same transaction.
+RESERVATION_SWEEP_INTERVAL = int(os.environ.get('RESERVATION_SWEEP_INTERVAL', 60))
+RESERVATION_SWEEP_BATCH    = int(os.environ.get('RESERVATION_SWEEP_BATCH', 500))
+
+def expire_reservations(now=None, batch_size=RESERVATION_SWEEP_BATCH):
+    now = now or datetime.utcnow()
+    expired = 0
+    while True:
+        # served by ix_reservation_status_until; SKIP LOCKED leaves rows that a
+        # concurrent collect/cancel is working on to that request
+        ids = [rid for (rid,) in
+               db.session.query(Reservation.reservation_id)
+               .filter(Reservation.status == 'active', Reservation.reserved_until < now)
+               .order_by(Reservation.reserved_until)
+               .limit(batch_size)
+               .with_for_update(skip_locked=True)]
+        if not ids:
+            break
+
+        returned = (
+            select(func.count(Reservation.reservation_id))
+            .where(Reservation.book_id == Book.book_id, Reservation.reservation_id.in_(ids))
+            .scalar_subquery()
+        )
+        affected_books = select(Reservation.book_id).where(Reservation.reservation_id.in_(ids))
+        expiring = (
+            select(func.count(Reservation.reservation_id))
+            .where(Reservation.user_id == UserSummary.user_id,
+                   Reservation.reservation_id.in_(ids), Reservation.status == 'active')
+            .scalar_subquery()
+        )
+        db.session.execute(
+            update(UserSummary)
+            .where(UserSummary.user_id.in_(select(Reservation.user_id).where(Reservation.reservation_id.in_(ids))))
+            .values(active_reservations=UserSummary.active_reservations - expiring)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.execute(
+            update(Book)
+            .where(Book.book_id.in_(affected_books))
+            .values(copies_available=case(
+                (Book.copies_available + returned > Book.copies_total, Book.copies_total),
+                else_=Book.copies_available + returned
+            ))
+            .execution_options(synchronize_session=False)
+        )
+        result = db.session.execute(
+            update(Reservation)
+            .where(Reservation.reservation_id.in_(ids), Reservation.status == 'active')
+            .values(status='cancelled')
+            .execution_options(synchronize_session=False)
+        )
+        allocated = _allocate_holds(db.session.execute(affected_books).scalars())
+        db.session.commit()
+        _holds_allocated(allocated)
+        expired += result.rowcount
+
+        if len(ids) < batch_size:
+            break
+    return expired
+
 # GET /loans
 @app.route('/loans', methods=['GET'])
 def get_loans():
@@ -723,7 +1622,17 @@ def get_loans():
     if book_id:
         query = query.filter_by(book_id=book_id)
     
-    loans = query.all()
+    next_cursor = None
+    if cursor_requested(request.args):
+        try:
+            after, limit = cursor_args(request.args)
+            loans, next_cursor = keyset_page(
+                query, [(Loan.loan_id, False)], after, limit, lambda l: [l.loan_id]
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    else:
+        loans = query.all()
     
     return jsonify({
         'items': [{
@@ -733,7 +1642,8 @@ def get_loans():
             'checkout_date': l.checkout_date.isoformat(),
             'due_date':       l.due_date.isoformat() if l.due_date else None, 
             'returned_date': l.returned_date.isoformat() if l.returned_date else None
-        } for l in loans]
+        } for l in loans],
+        'next_cursor': next_cursor
     })
 
 # fee calculation
@@ -741,21 +1651,53 @@ def calculate_fees(loan):
    
     if loan.returned_date:
         return 0.0
-    today = date.today()
-    if today > loan.due_date:
-        days_overdue = (today - loan.due_date).days
-        return round(days_overdue * 5.00, 2)  # R5 per day
-    return 0.0
+    return float(fine_amount(loan.due_date, date.today()))  # R5 per day
+
+# Overdue fines: one running FeeFine per overdue loan, brought up to date in
+# set-based batches. Re-running on the same day is a no-op, so the job can run
+# more often than nightly without double-charging.
+FINE_ACCRUAL_INTERVAL = int(os.environ.get('FINE_ACCRUAL_INTERVAL', 3600))
+FINE_ACCRUAL_BATCH    = int(os.environ.get('FINE_ACCRUAL_BATCH', 1000))
+
+def accrue_fines(today=None):
+    try:
+        return accrue_overdue_fines(
+            db.session, Loan.__table__, FeeFine.__table__, UserSummary.__table__,
+            today or date.today(), FINE_ACCRUAL_BATCH
+        )
+    except Exception:
+        db.session.rollback()
+        raise
+
+@app.cli.command('accrue-fines')
+@click.option('--date', 'as_of', default=None, help='accrue as of YYYY-MM-DD (default: today)')
+def accrue_fines_command(as_of):
+    """Bring overdue-loan fines up to date."""
+    written = accrue_fines(date.fromisoformat(as_of) if as_of else None)
+    click.echo(f"{written} fines accrued")
 
 # PUT /feefine/<int:fee_id>/pay
 @app.route('/feefine/<int:fee_id>/pay', methods=['PUT'])
 def pay_fee(fee_id):
     fee = FeeFine.query.get_or_404(fee_id)
-    
-    if fee.status == 'paid':
+    if fee.loan_id is not None:
+        # accrual writes a running fine under its loan's row lock; take it too
+        # so the amount paid is the amount the counter was moved by
+        db.session.execute(select(Loan.loan_id).where(Loan.loan_id == fee.loan_id).with_for_update())
+        db.session.refresh(fee)
+    
+    # a loan that stays overdue starts a new fine segment on the next accrual
+    result = db.session.execute(
+        update(FeeFine)
+        .where(FeeFine.feefine_id == fee_id, FeeFine.status == 'unpaid')
+        .values(status='paid', running_loan_id=None)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        db.session.rollback()
         return jsonify({'error': 'Fee already paid'}), 400
         
-    fee.status = 'paid'
+    _adjust_summary(fee.user_id, fees=-fee.amount)
     db.session.commit()
     
     return jsonify({'message': 'Fee paid successfully'}), 200
@@ -780,14 +1722,276 @@ def renew_loan(loan_id):
         'new_due_date': loan.due_date.isoformat()
     })
 
+def _finalise_fines(loan_ids, today):
+    """Final fines of overdue loans being returned (locked by the caller); {loan_id: amount}."""
+    return finalise_fines(db.session, Loan.__table__, FeeFine.__table__, UserSummary.__table__, loan_ids, today)
+
+# Return Loan (borrower or staff at the desk)
+@app.route('/loans/<int:loan_id>/return', methods=['PUT'])
+def return_loan(loan_id):
+    loan = Loan.query.get_or_404(loan_id)
+    
+    if loan.user_id != g.current_user.user_id and g.current_user.role != 'staff':
+        raise Forbidden('You can only return your own loans')
+    
+    today = date.today()
+    result = db.session.execute(
+        update(Loan)
+        .where(Loan.loan_id == loan_id, Loan.returned_date.is_(None))
+        .values(returned_date=today)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        db.session.rollback()
+        return jsonify({'error': 'Book already returned'}), 400
+    
+    # the UPDATE holds the loan's row lock: charge the days since the last accrual run
+    fines = _finalise_fines([loan_id] if loan.due_date < today else [], today)
+    _return_copies(loan.book_id)
+    _adjust_summary(loan.user_id, loans=-1)
+    allocated = _allocate_holds([loan.book_id])
+    db.session.commit()
+    _holds_allocated(allocated)
+    
+    body = {
+        'loan_id': loan_id,
+        'returned_date': today.isoformat()
+    }
+    if loan_id in fines:
+        body['fine'] = float(fines[loan_id])
+    return jsonify(body)
+
+# Circulation desk (staff). A scanned batch is applied in one transaction:
+# the scanned books are locked in id order, then each kind of change is one
+# set-based statement (reservations fulfilled, copies taken or put back, loans
+# closed, fines finalised, counters moved) and every scan gets its own result.
+LOAN_PERIOD_DAYS = 5
+DESK_MAX_ITEMS   = 200
+
+def _desk_scans(data, *kinds):
+    parse = {'loan_ids': _id_list, 'book_ids': _id_list, 'isbns': _isbn_list}
+    scans = [(kind[:-1], value) for kind in kinds for value in parse[kind](data.get(kind))]
+    if not scans:
+        abort(400, description=f"Scan at least one of {', '.join(kinds)}")
+    if len(scans) > DESK_MAX_ITEMS:
+        abort(400, description=f"At most {DESK_MAX_ITEMS} items per batch")
+    return scans
+
+def _scan_key(kind, value):
+    return (kind, isbn_key(value) if kind == 'isbn' else value)
+
+def _lock_books(book_ids=(), isbns=()):
+    if not book_ids and not isbns:
+        return []
+    return db.session.execute(
+        select(Book.book_id, Book.isbn, Book.copies_available)
+        .where(or_(Book.book_id.in_(book_ids), Book.isbn_key.in_(_isbn_keys(isbns))))
+        .order_by(Book.book_id)
+        .with_for_update()
+    ).all()
+
+# Check out a batch of books to one patron:
+#   {"user_id": 12, "isbns": [...], "book_ids": [...], "library_id": 1}
+# A book the patron has an active reservation for fulfils that reservation;
+# any other needs a free copy.
+@app.route('/desk/checkout', methods=['POST'])
+def desk_checkout():
+    if g.current_user.role != 'staff':
+        raise Forbidden('Staff only')
+    data = request.get_json() or {}
+    patron_id = data.get('user_id')
+    if not isinstance(patron_id, int) or not db.session.get(User, patron_id):
+        abort(404, description='Patron not found')
+    library_id = data.get('library_id')
+    if library_id is not None and not db.session.get(Library, library_id):
+        abort(404, description='Library not found')
+    scans = _desk_scans(data, 'isbns', 'book_ids')
+    today = date.today()
+
+    books = _lock_books([v for k, v in scans if k == 'book_id'], [v for k, v in scans if k == 'isbn'])
+    by_key = {('book_id', b.book_id): b for b in books} | {_scan_key('isbn', b.isbn): b for b in books}
+    free = {b.book_id: b.copies_available for b in books}
+    reserved = dict(db.session.execute(
+        select(Reservation.book_id, func.min(Reservation.reservation_id))
+        .where(Reservation.user_id == patron_id, Reservation.status == 'active',
+               Reservation.book_id.in_(free))
+        .group_by(Reservation.book_id)
+    ).all())
+    on_loan = set(db.session.execute(
+        select(Loan.book_id).where(Loan.user_id == patron_id, Loan.returned_date.is_(None),
+                                   Loan.book_id.in_(free))
+    ).scalars())
+
+    items, loans, fulfilled, taken = [], {}, [], []
+    for kind, value in scans:
+        item = {kind: value}
+        items.append(item)
+        book = by_key.get(_scan_key(kind, value))
+        if book is None:
+            item['status'] = 'not_found'
+            continue
+        item['book_id'] = book.book_id
+        if book.book_id in loans:
+            item['status'] = 'duplicate'
+        elif book.book_id in on_loan:
+            item['status'] = 'already_on_loan'
+        elif book.book_id in reserved:
+            item['reservation_id'] = reserved[book.book_id]
+            fulfilled.append(reserved[book.book_id])
+        elif free[book.book_id] > 0:
+            taken.append(book.book_id)
+        else:
+            item['status'] = 'unavailable'
+        if 'status' not in item:
+            item['status'] = 'checked_out'
+            loans[book.book_id] = Loan(user_id=patron_id, book_id=book.book_id, library_id=library_id,
+                                       checkout_date=today, due_date=today + timedelta(days=LOAN_PERIOD_DAYS))
+
+    if fulfilled:
+        db.session.execute(
+            update(Reservation)
+            .where(Reservation.reservation_id.in_(fulfilled), Reservation.status == 'active')
+            .values(status='fulfilled')
+            .execution_options(synchronize_session=False)
+        )
+    if taken:
+        db.session.execute(
+            update(Book)
+            .where(Book.book_id.in_(taken), Book.copies_available > 0)
+            .values(copies_available=Book.copies_available - 1)
+            .execution_options(synchronize_session=False)
+        )
+    # the patron has the book now, so their own place in its queue goes
+    dropped = db.session.execute(
+        select(BookHold.book_id, BookHold.hold_id)
+        .where(BookHold.user_id == patron_id, BookHold.status == 'waiting', BookHold.book_id.in_(loans))
+    ).all() if loans else []
+    if dropped:
+        db.session.execute(
+            update(BookHold)
+            .where(BookHold.hold_id.in_([h.hold_id for h in dropped]))
+            .values(status='cancelled')
+            .execution_options(synchronize_session=False)
+        )
+    db.session.add_all(loans.values())
+    db.session.flush()
+    _adjust_summary(patron_id, reservations=-len(fulfilled), loans=len(loans))
+    db.session.commit()
+    for hold in dropped:
+        hold_queues.remove(hold.book_id, hold.hold_id)
+
+    for item in items:
+        loan = loans.get(item.get('book_id')) if item['status'] == 'checked_out' else None
+        if loan is not None:
+            item['loan_id'] = loan.loan_id
+            item['due_date'] = loan.due_date.isoformat()
+    return jsonify({'user_id': patron_id, 'checked_out': len(loans), 'items': items}), 200
+
+# Return a batch: {"loan_ids": [...], "isbns": [...], "book_ids": [...]}.
+# A scanned book closes its oldest open loan (of "user_id" if given). Overdue
+# loans get their fine finalised through today before they close.
+@app.route('/desk/return', methods=['POST'])
+def desk_return():
+    if g.current_user.role != 'staff':
+        raise Forbidden('Staff only')
+    data = request.get_json() or {}
+    scans = _desk_scans(data, 'loan_ids', 'isbns', 'book_ids')
+    patron_id = data.get('user_id')
+    today = date.today()
+
+    loan_fields = (Loan.loan_id, Loan.user_id, Loan.book_id, Loan.due_date, Loan.returned_date)
+    by_id = {l.loan_id: l for l in db.session.execute(
+        select(*loan_fields).where(Loan.loan_id.in_([v for k, v in scans if k == 'loan_id'])).with_for_update()
+    )}
+    scanned_books = db.session.execute(
+        select(Book.book_id, Book.isbn).where(or_(
+            Book.book_id.in_([v for k, v in scans if k == 'book_id']),
+            Book.isbn_key.in_(_isbn_keys([v for k, v in scans if k == 'isbn']))
+        ))
+    ).all()
+    book_key = {('book_id', b.book_id): b.book_id for b in scanned_books} | \
+               {_scan_key('isbn', b.isbn): b.book_id for b in scanned_books}
+    open_loans = {}
+    if scanned_books:
+        query = (select(*loan_fields)
+                 .where(Loan.book_id.in_([b.book_id for b in scanned_books]), Loan.returned_date.is_(None))
+                 .order_by(Loan.loan_id).with_for_update())
+        if isinstance(patron_id, int):
+            query = query.where(Loan.user_id == patron_id)
+        for loan in db.session.execute(query):
+            open_loans.setdefault(loan.book_id, []).append(loan)
+
+    items, closing = [], {}
+    for kind, value in scans:
+        item = {kind: value}
+        items.append(item)
+        if kind == 'loan_id':
+            loan = by_id.get(value)
+            if loan is None:
+                item['status'] = 'not_found'
+            elif loan.loan_id in closing:
+                item['status'] = 'duplicate'
+            elif loan.returned_date is not None:
+                item['status'] = 'already_returned'
+        else:
+            book_id = book_key.get(_scan_key(kind, value))
+            queue = [l for l in open_loans.get(book_id, []) if l.loan_id not in closing]
+            loan = queue[0] if queue else None
+            item['status'] = 'not_found' if book_id is None else None if loan else 'no_open_loan'
+            if item['status'] is None:
+                del item['status']
+        if 'status' not in item:
+            item.update(status='returned', loan_id=loan.loan_id, book_id=loan.book_id, user_id=loan.user_id)
+            closing[loan.loan_id] = loan
+
+    if closing:
+        per_book, per_user = {}, {}
+        for loan in closing.values():
+            per_book[loan.book_id] = per_book.get(loan.book_id, 0) + 1
+            per_user[loan.user_id] = per_user.get(loan.user_id, 0) + 1
+        _lock_books(sorted(per_book))
+
+        # the loans are locked, so their running fines can be read and finalised;
+        # a paid segment is left alone and only the days after it are charged
+        fines = _finalise_fines([l.loan_id for l in closing.values() if l.due_date < today], today)
+
+        db.session.execute(
+            update(Loan)
+            .where(Loan.loan_id.in_(closing), Loan.returned_date.is_(None))
+            .values(returned_date=today)
+            .execution_options(synchronize_session=False)
+        )
+        books, summary = Book.__table__, UserSummary.__table__
+        db.session.execute(
+            update(books).where(books.c.book_id == bindparam('bid'))
+            .values(copies_available=case(
+                (books.c.copies_available + bindparam('n') > books.c.copies_total, books.c.copies_total),
+                else_=books.c.copies_available + bindparam('n')
+            )),
+            [{'bid': book_id, 'n': n} for book_id, n in per_book.items()]
+        )
+        db.session.execute(
+            update(summary).where(summary.c.user_id == bindparam('uid'))
+            .values(open_loans=summary.c.open_loans - bindparam('n')),
+            [{'uid': uid, 'n': n} for uid, n in per_user.items()]
+        )
+        allocated = _allocate_holds(per_book)
+        db.session.commit()
+        _holds_allocated(allocated)
+
+        for item in items:
+            if item['status'] == 'returned' and item['loan_id'] in fines:
+                item['fine'] = float(fines[item['loan_id']])
+    return jsonify({'returned': len(closing), 'items': items}), 200
+
 # 6. User Fees
 @app.route('/users/<string:user_id>/fees', methods=['GET'])
 def view_fees(user_id):
-    # Assuming g.current_user.user_id is also a Firebase UID string
+    # user_id in the path is the Firebase UID; fees are keyed by the numeric user_id
     if user_id != g.current_user.firebase_uid:
         raise Forbidden('Unauthorized access')
     
-    fees = FeeFine.query.filter_by(user_id=user_id, status='unpaid').all()
+    fees = FeeFine.query.filter_by(user_id=g.current_user.user_id, status='unpaid').all()
     total = sum(float(fee.amount) for fee in fees)
     
     return jsonify({
@@ -802,28 +2006,40 @@ def view_fees(user_id):
 
 
 # 7. Chat Messages
+# Served from the in-process relay: GETs read its ring buffer, POSTs are
+# fanned out to /chat/stream subscribers and written to the backend in batches.
+chat_relay = ChatRelay(
+    backend_from_env(firebase_db.reference),
+    size=int(os.environ.get('CHAT_BUFFER_SIZE', 50)),
+    ttl=int(os.environ.get('CHAT_REFRESH_TTL', 10))
+)
+metrics.register('chat_relay', chat_relay.stats)
+atexit.register(chat_relay.flush)
+
 @app.route('/libraries/<int:library_id>/chat/messages', methods=['GET', 'POST'])
 def chat_messages(library_id):
-    ref = firebase_db.reference(f'chats/{library_id}/messages')
-    
     if request.method == 'GET':
-        # Get last 50 messages
-        messages = ref.order_by_child('timestamp').limit_to_last(50).get() or {}
-        return jsonify(list(messages.values()))
+        # Last CHAT_BUFFER_SIZE messages, oldest first
+        return jsonify(chat_relay.messages(library_id))
     
     elif request.method == 'POST':
-        data = request.get_json()
-        msg_id = str(uuid.uuid4())
-        
-        payload = {
-            'user_id': request.current_user.user_id,
-            'name': request.current_user.name,
-            'text': data['text'],
-            'timestamp': datetime.utcnow().isoformat()
-        }
-        
-        ref.child(msg_id).set(payload)
-        return jsonify(payload), 201
+        data = request.get_json() or {}
+        text = (data.get('text') or '').strip()
+        if not text:
+            return jsonify({'error': 'text is required'}), 400
+        try:
+            msg = chat_relay.post(library_id, g.current_user.user_id, g.current_user.name, text)
+        except queue.Full:
+            return jsonify({'error': 'Chat is busy, try again shortly'}), 503
+        return jsonify(msg), 201
+
+# Server-Sent Events: the recent messages, then one event per new message
+@app.route('/libraries/<int:library_id>/chat/stream', methods=['GET'])
+def chat_stream(library_id):
+    return Response(chat_relay.sse_stream(library_id, SSE_HEARTBEAT), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
 
 # 8. Purchase Request
 @app.route('/purchase_requests', methods=['POST'])
@@ -848,6 +2064,7 @@ def create_purchase_request():
 
 # 9. Announcements
 @app.route('/announcements', methods=['GET'])
+@response_cache.cached(lambda: ('announcements',))
 def get_announcements():
     active_only = request.args.get('active', 'true') == 'true'
     limit = request.args.get('limit', 5, type=int)
@@ -880,6 +2097,7 @@ def create_announcement():
     )
     db.session.add(ann)
     db.session.commit()
+    response_cache.bump(('announcements',))
     return jsonify({
         'id': ann.announcement_id,
         'title': ann.title,
@@ -899,10 +2117,32 @@ def delete_announcement(ann_id):
     # Option B: hard‑delete
     db.session.delete(ann)
     db.session.commit()
+    response_cache.bump(('announcements',))
     return '', 204
 
 # 10. Library Hours
+# Each library's week is compiled once into a WeeklySchedule (see
+# weekly_schedule.py) and rebuilt only when its hours change, so "open now?"
+# never touches the database. The write endpoints upsert on
+# (library_id, weekday) and invalidate the schedule after committing.
+
+def _load_hours(library_id):
+    if db.session.get(Library, library_id) is None:
+        return None
+    return {
+        t.weekday: (t.open_time, t.close_time)
+        for t in OperatingTime.query.filter_by(library_id=library_id).all()
+    }
+
+hours_schedules = ScheduleCache(_load_hours, ttl=int(os.environ.get('HOURS_SCHEDULE_TTL', 60)))
+metrics.register('hours_schedules', hours_schedules.stats)
+
+def _hours_changed(library_id):
+    hours_schedules.invalidate(library_id)
+    response_cache.bump(('hours', library_id))
+
 @app.route('/libraries/<int:library_id>/hours', methods=['GET'])
+@response_cache.cached(lambda library_id: ('hours', library_id))
 def get_hours(library_id):
     times = OperatingTime.query.filter_by(library_id=library_id).all()
     return jsonify([{
@@ -911,6 +2151,28 @@ def get_hours(library_id):
         'close_time': t.close_time.strftime('%H:%M')
     } for t in times])
 
+# Open/closed right now, when that changes next, and the next 7 days:
+# GET /libraries/<id>/hours/now [?at=YYYY-MM-DDTHH:MM] (library local time)
+@app.route('/libraries/<int:library_id>/hours/now', methods=['GET'])
+def opening_status(library_id):
+    schedule = hours_schedules.get(library_id)
+    if schedule is None:
+        abort(404)
+    try:
+        now = datetime.fromisoformat(request.args['at']) if 'at' in request.args else datetime.now()
+    except ValueError:
+        abort(400, description="'at' must be an ISO datetime")
+
+    is_open, next_change = schedule.status(now)
+    return jsonify({
+        'library_id':           library_id,
+        'at':                   now.isoformat(timespec='minutes'),
+        'open':                 is_open,
+        'next_change':          next_change.isoformat(timespec='minutes') if next_change else None,
+        'seconds_until_change': int((next_change - now).total_seconds()) if next_change else None,
+        'week':                 schedule.week(now.date()),
+    }), 200
+
 @app.route('/libraries/<int:library_id>/hours/<string:weekday>', methods=['PUT'])
 def update_hours(library_id, weekday):
     # Validate weekday
@@ -930,41 +2192,29 @@ def update_hours(library_id, weekday):
     except ValueError:
         abort(400, description="Times must be in 'HH:MM' format")
 
-    # Look for existing record
-    entry = OperatingTime.query.filter_by(
-        library_id=library_id,
-        weekday=weekday
-    ).first()
-
-    if entry:
-        entry.open_time = open_dt
-        entry.close_time = close_dt
-    else:
-        # Create new if none exists
-        entry = OperatingTime(
-            library_id=library_id,
-            weekday=weekday,
-            open_time=open_dt,
-            close_time=close_dt
-        )
-        db.session.add(entry)
-
+    upsert(db.session, OperatingTime, [{
+        'library_id': library_id,
+        'weekday':    weekday,
+        'open_time':  open_dt,
+        'close_time': close_dt,
+    }], ('library_id', 'weekday'), ('open_time', 'close_time'))
     db.session.commit()
+    _hours_changed(library_id)
 
     return jsonify({
-        'library_id': entry.library_id,
-        'weekday': entry.weekday,
-        'open_time': entry.open_time.strftime('%H:%M'),
-        'close_time': entry.close_time.strftime('%H:%M')
+        'library_id': library_id,
+        'weekday': weekday,
+        'open_time': open_dt.strftime('%H:%M'),
+        'close_time': close_dt.strftime('%H:%M')
     }), 200
 
 
-# (Optional) Bulk‐update endpoint if you ever want to send all days at once:
+# Bulk-update endpoint to send several days at once, written as one upsert:
 @app.route('/libraries/<int:library_id>/hours', methods=['PUT'])
 def bulk_update_hours(library_id):
     payload = request.get_json() or {}
     # payload should be a dict: { "Mon": {open_time:"08:00", close_time:"20:00"}, ... }
-    updated = []
+    rows = []
     for weekday, times in payload.items():
         if weekday not in ('Mon','Tue','Wed','Thu','Fri','Sat','Sun'):
             continue
@@ -976,42 +2226,53 @@ def bulk_update_hours(library_id):
             ct = datetime.strptime(c, '%H:%M').time()
         except ValueError:
             continue
+        rows.append({'library_id': library_id, 'weekday': weekday, 'open_time': ot, 'close_time': ct})
 
-        entry = OperatingTime.query.filter_by(
-            library_id=library_id,
-            weekday=weekday
-        ).first()
-        if entry:
-            entry.open_time = ot
-            entry.close_time = ct
-        else:
-            entry = OperatingTime(
-                library_id=library_id,
-                weekday=weekday,
-                open_time=ot,
-                close_time=ct
-            )
-            db.session.add(entry)
-        updated.append(entry)
-
-    db.session.commit()
+    if rows:
+        upsert(db.session, OperatingTime, rows, ('library_id', 'weekday'), ('open_time', 'close_time'))
+        db.session.commit()
+        _hours_changed(library_id)
 
     return jsonify([{
-        'weekday': e.weekday,
-        'open_time': e.open_time.strftime('%H:%M'),
-        'close_time': e.close_time.strftime('%H:%M')
-    } for e in updated]), 200
+        'weekday': r['weekday'],
+        'open_time': r['open_time'].strftime('%H:%M'),
+        'close_time': r['close_time'].strftime('%H:%M')
+    } for r in rows]), 200
 
 # 11. Create Appointment
+# Appointments are capped at APPOINTMENT_MAX_HOURS, so everything that can
+# overlap [start, end) starts inside [start - cap, end): one bounded range on
+# ix_appointment_librarian_start, however long the appointment history gets.
+APPOINTMENT_MAX_HOURS     = int(os.environ.get('APPOINTMENT_MAX_HOURS', 8))
+AVAILABILITY_MAX_DAYS     = 31
+
+def _busy_intervals(librarian_ids, start, end):
+    """{librarian_user_id: IntervalSet of non-cancelled appointments touching [start, end)}."""
+    rows = (
+        db.session.query(Appointment.librarian_user_id, Appointment.start_datetime, Appointment.end_datetime)
+        .filter(
+            Appointment.librarian_user_id.in_(librarian_ids),
+            Appointment.start_datetime >= start - timedelta(hours=APPOINTMENT_MAX_HOURS),
+            Appointment.start_datetime < end,
+            Appointment.status != 'cancelled'
+        )
+        .all()
+    )
+    intervals = {lid: [] for lid in librarian_ids}
+    for lid, s, e in rows:
+        intervals[lid].append((s, e))
+    return {lid: IntervalSet(spans) for lid, spans in intervals.items()}
+
 @app.route('/appointments', methods=['POST'])
 def create_appointment():
     data = request.get_json()
     
-    # Check librarian exists and is staff
+    # Check librarian exists and is staff; the row lock serialises bookings
+    # for this librarian so two requests can't both pass the conflict check
     librarian = User.query.filter_by(
         user_id=data['librarian_user_id'],
         role='staff'
-    ).first_or_404()
+    ).with_for_update().first_or_404()
     
     # Validate time slot
     start = datetime.fromisoformat(data['start_datetime'])
@@ -1019,22 +2280,16 @@ def create_appointment():
     
     if end <= start:
         return jsonify({'error': 'End time must be after start time'}), 400
+    if end - start > timedelta(hours=APPOINTMENT_MAX_HOURS):
+        return jsonify({'error': f'Appointments can be at most {APPOINTMENT_MAX_HOURS} hours'}), 400
     
     # Check for conflicts
-    conflict = Appointment.query.filter(
-        Appointment.librarian_user_id == librarian.user_id,
-        or_(
-            and_(Appointment.start_datetime <= start, Appointment.end_datetime > start),
-            and_(Appointment.start_datetime < end, Appointment.end_datetime >= end),
-            and_(Appointment.start_datetime >= start, Appointment.end_datetime <= end)
-        )
-    ).first()
-    
-    if conflict:
+    if _busy_intervals([librarian.user_id], start, end)[librarian.user_id].overlaps(start, end):
+        db.session.rollback()
         return jsonify({'error': 'Time slot not available'}), 409
     
     appointment = Appointment(
-        user_id=request.current_user.user_id,
+        user_id=g.current_user.user_id,
         librarian_user_id=librarian.user_id,
         library_id=data['library_id'],
         start_datetime=start,
@@ -1051,6 +2306,54 @@ def create_appointment():
         'start': appointment.start_datetime.isoformat()
     }), 201
 
+# Free time of one librarian (or every staff member) at a library, within its
+# opening hours: GET /appointments/availability?library_id=1
+#   [&librarian_user_id=] [&from=YYYY-MM-DD] [&days=7] [&duration=30]
+@app.route('/appointments/availability', methods=['GET'])
+def appointment_availability():
+    library_id = request.args.get('library_id', type=int)
+    if not library_id:
+        abort(400, description="'library_id' is required")
+    librarian_id = request.args.get('librarian_user_id', type=int)
+    days = request.args.get('days', 7, type=int)
+    duration = request.args.get('duration', 30, type=int)
+    if not 1 <= days <= AVAILABILITY_MAX_DAYS:
+        abort(400, description=f"'days' must be between 1 and {AVAILABILITY_MAX_DAYS}")
+    if not 1 <= duration <= APPOINTMENT_MAX_HOURS * 60:
+        abort(400, description="'duration' is out of range")
+    try:
+        first_day = date.fromisoformat(request.args['from']) if 'from' in request.args else date.today()
+    except ValueError:
+        abort(400, description="'from' must be YYYY-MM-DD")
+    last_day = first_day + timedelta(days=days - 1)
+
+    librarians = User.query.filter_by(role='staff')
+    if librarian_id:
+        librarians = librarians.filter_by(user_id=librarian_id)
+    librarians = librarians.order_by(User.user_id).all()
+    if librarian_id and not librarians:
+        abort(404)
+
+    schedule = hours_schedules.get(library_id)
+    windows = opening_windows(schedule.hours if schedule else {}, first_day, last_day)
+    busy = _busy_intervals([l.user_id for l in librarians],
+                           datetime.combine(first_day, time.min),
+                           datetime.combine(last_day + timedelta(days=1), time.min))
+    min_length = timedelta(minutes=duration)
+    now = datetime.now()
+
+    return jsonify({
+        'library_id': library_id,
+        'from':       first_day.isoformat(),
+        'to':         last_day.isoformat(),
+        'librarians': [{
+            'librarian_user_id': l.user_id,
+            'name':              l.name,
+            'free': [{'start': s.isoformat(), 'end': e.isoformat()}
+                     for s, e in free_windows(busy[l.user_id], windows, min_length, not_before=now)]
+        } for l in librarians]
+    }), 200
+
 # 12. Submit Recommendation
 @app.route('/recommendations', methods=['POST'])
 def submit_recommendation():
@@ -1070,6 +2373,7 @@ def submit_recommendation():
 # 13. VENUES 
 # Get all rooms
 @app.route('/libraries/<int:library_id>/rooms', methods=['GET'])
+@response_cache.cached(lambda library_id: ('rooms', library_id))
 def get_rooms(library_id):
     rooms = Room.query.filter_by(library_id=library_id).all()
     room_list = [{'room_id': r.room_id, 'name': r.name, 'room_type': r.room_type} for r in rooms]
@@ -1085,7 +2389,9 @@ def create_room(library_id):
         room_type=data['type']
     )
     db.session.add(new_room)
-    db.session.commit()
+    if not _commit_unique():
+        return jsonify({'error': 'A room with this name already exists in this library'}), 409
+    response_cache.bump(('rooms', library_id))
     return jsonify({
     'room_id': new_room.room_id,
     'name': new_room.name,
@@ -1095,19 +2401,15 @@ def create_room(library_id):
 #14 List ALL computers in library ---
 @app.route('/libraries/<int:library_id>/computers', methods=['GET'])
 def list_computers(library_id):
-    comps = (
-        Seat.query
-        .join(Room)
-        .filter(Room.library_id == library_id, Seat.is_computer == True)
-        .all()
-    )
+    _warm_occupancy(library_id)
+    comps = occupancy.seats(library_id, is_computer=True)
     return jsonify([{
-        'computer_id': s.seat_id,
-        'identifier':  s.identifier,
-        'specs':       s.specs,
-        'is_active':   s.is_active,
-        'is_occupied': s.is_occupied,
-        'room_id':     s.room_id
+        'computer_id': s['seat_id'],
+        'identifier':  s['identifier'],
+        'specs':       s['specs'],
+        'is_active':   s['is_active'],
+        'is_occupied': s['is_occupied'],
+        'room_id':     s['room_id']
     } for s in comps]), 200
 
 # Update a computer’s details (specs, active, occupied) ---
@@ -1131,7 +2433,9 @@ def update_computer(library_id, computer_id):
     if 'is_occupied' in data:
         comp.is_occupied = bool(data['is_occupied'])
 
-    db.session.commit()
+    if not _commit_unique():
+        return jsonify({'error': 'Seat identifier already in use in this room'}), 409
+    occupancy.put(library_id, _seat_state(comp))
 
     return jsonify({
         'computer_id': comp.seat_id,
@@ -1168,6 +2472,7 @@ def register_user():
     
     db.session.add(user)
     db.session.commit()
+    auth_cache.invalidate_user(firebase_uid)
     
     return jsonify({
         'user_id': user.user_id,
@@ -1182,25 +2487,104 @@ def user_summary(user_id):
     if user_id != g.current_user.firebase_uid and g.current_user.role != 'staff':
         raise Forbidden('Unauthorized access')
 
-    # Count active reservations & loans
-    res_count = Reservation.query \
-                 .filter_by(user_id=g.current_user.user_id, status='active') \
-                 .count()
-    loan_count = Loan.query \
-                   .filter_by(user_id=g.current_user.user_id, returned_date=None) \
-                   .count()
-    # Sum unpaid fees
-    total_fees = db.session.query(func.coalesce(func.sum(FeeFine.amount), 0)) \
-                   .filter_by(user_id=g.current_user.user_id, status='unpaid') \
-                   .scalar()
+    # Primary-key read of the materialised counters; built on first use
+    summary = db.session.get(UserSummary, g.current_user.user_id)
+    if summary is None:
+        user_pk = g.current_user.user_id
+        db.session.commit()   # end the read snapshot; the rebuild must lock first
+        _rebuild_summaries([user_pk])
+        db.session.commit()
+        summary = db.session.get(UserSummary, user_pk)
 
     return jsonify({
-      'reservations': res_count,
-      'loans':        loan_count,
-      'fees':         float(total_fees)
+      'reservations': summary.active_reservations,
+      'loans':        summary.open_loans,
+      'fees':         float(summary.unpaid_fees)
     })
 
+# Circulation counters. Writers adjust them with a relative UPDATE inside their
+# own transaction; a user without a row yet is simply skipped and gets one built
+# from the source tables on first read or by the reconcile job.
+USER_SUMMARY_RECONCILE_INTERVAL = int(os.environ.get('USER_SUMMARY_RECONCILE_INTERVAL', 3600))
+USER_SUMMARY_RECONCILE_BATCH    = int(os.environ.get('USER_SUMMARY_RECONCILE_BATCH', 1000))
+
+def _adjust_summary(user_id, reservations=0, loans=0, fees=0):
+    db.session.execute(
+        update(UserSummary)
+        .where(UserSummary.user_id == user_id)
+        .values(
+            active_reservations=UserSummary.active_reservations + reservations,
+            open_loans=UserSummary.open_loans + loans,
+            unpaid_fees=UserSummary.unpaid_fees + fees
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+def _summary_counts(user_ids):
+    """{user_id: (reservations, loans, fees)} computed from the source tables."""
+    counts = {uid: [0, 0, 0] for uid in user_ids}
+    for uid, n in (db.session.query(Reservation.user_id, func.count())
+                   .filter(Reservation.user_id.in_(user_ids), Reservation.status == 'active')
+                   .group_by(Reservation.user_id)):
+        counts[uid][0] = n
+    for uid, n in (db.session.query(Loan.user_id, func.count())
+                   .filter(Loan.user_id.in_(user_ids), Loan.returned_date.is_(None))
+                   .group_by(Loan.user_id)):
+        counts[uid][1] = n
+    for uid, total in (db.session.query(FeeFine.user_id, func.sum(FeeFine.amount))
+                       .filter(FeeFine.user_id.in_(user_ids), FeeFine.status == 'unpaid')
+                       .group_by(FeeFine.user_id)):
+        counts[uid][2] = total or 0
+    return counts
+
+def _rebuild_summaries(user_ids):
+    """
+    Recompute the counters of `user_ids` and write them back; returns how many
+    rows were missing or had drifted. Existing rows are locked first, so a
+    concurrent writer either committed before the recount (and is included) or
+    applies its delta on top of the repaired value afterwards.
+
+    Call this at the start of a transaction: under REPEATABLE READ the recount
+    sees the snapshot taken by the transaction's first plain read, and only if
+    that read comes after the locks does it include every committed writer.
+    """
+    current = {
+        s.user_id: s for s in
+        UserSummary.query.filter(UserSummary.user_id.in_(user_ids)).with_for_update().all()
+    }
+    now = datetime.utcnow()
+    rows = []
+    for uid, (reservations, loans, fees) in _summary_counts(user_ids).items():
+        s = current.get(uid)
+        if s is None or (s.active_reservations, s.open_loans, s.unpaid_fees) != (reservations, loans, fees):
+            rows.append({'user_id': uid, 'active_reservations': reservations, 'open_loans': loans,
+                         'unpaid_fees': fees, 'reconciled_at': now})
+    upsert(db.session, UserSummary, rows, ('user_id',),
+           ('active_reservations', 'open_loans', 'unpaid_fees', 'reconciled_at'))
+    return len(rows)
+
+def reconcile_user_summaries(batch_size=USER_SUMMARY_RECONCILE_BATCH):
+    """Repair drifted or missing counters for every user, one batch per transaction."""
+    repaired = 0
+    last_id = 0
+    while True:
+        user_ids = [uid for (uid,) in
+                    db.session.query(User.user_id).filter(User.user_id > last_id)
+                    .order_by(User.user_id).limit(batch_size)]
+        if not user_ids:
+            break
+        db.session.commit()   # the id read must not fix the recount's snapshot
+        try:
+            repaired += _rebuild_summaries(user_ids)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        last_id = user_ids[-1]
+    return repaired
+
 @app.route('/libraries', methods=['GET'])
+@response_cache.cached(lambda: ('libraries',))
 def all_libraries():
     libs = Library.query.all()
     return jsonify([{
@@ -1211,6 +2595,383 @@ def all_libraries():
     } for l in libs])
 
 
+# 16. Staff exports
+# GET /exports/loans?format=csv&from=2026-01-01&to=2026-03-31&library_id=1
+# Rows come off a server-side cursor (yield_per) and are written to the response
+# a chunk at a time, so memory stays flat however large the export; the
+# connection is held until the download finishes. `from`/`to` are inclusive
+# dates on checkout_date / reserved_from / created_at. Fees are matched to a
+# library through their loan, so the library filter leaves out other fees.
+EXPORT_BATCH = int(os.environ.get('EXPORT_BATCH', 2000))
+
+EXPORTS = {
+    'loans': (Loan.checkout_date, Loan.library_id, [
+        Loan.loan_id, Loan.user_id, Loan.book_id, Loan.library_id,
+        Loan.checkout_date, Loan.due_date, Loan.returned_date,
+    ]),
+    'reservations': (Reservation.reserved_from, Reservation.library_id, [
+        Reservation.reservation_id, Reservation.user_id, Reservation.book_id, Reservation.library_id,
+        Reservation.reserved_from, Reservation.reserved_until, Reservation.status,
+    ]),
+    'fees': (FeeFine.created_at, Loan.library_id, [
+        FeeFine.feefine_id, FeeFine.user_id, FeeFine.loan_id, Loan.library_id.label('library_id'),
+        FeeFine.amount, FeeFine.status, FeeFine.description, FeeFine.created_at, FeeFine.accrued_through,
+    ]),
+}
+
+def _date_arg(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        abort(400, description=f"'{name}' must be a date (YYYY-MM-DD)")
+
+def _export_query(kind, start, end, library_id):
+    date_col, library_col, columns = EXPORTS[kind]
+    query = select(*columns)
+    if kind == 'fees':
+        query = query.outerjoin(Loan, Loan.loan_id == FeeFine.loan_id)
+    # compare as datetimes so the date-typed and datetime-typed columns share one range form
+    as_bound = (lambda d: d) if kind == 'loans' else (lambda d: datetime.combine(d, time.min))
+    if start:
+        query = query.where(date_col >= as_bound(start))
+    if end:
+        query = query.where(date_col < as_bound(end + timedelta(days=1)))
+    if library_id is not None:
+        query = query.where(library_col == library_id)
+    return query.order_by(date_col, columns[0])
+
+@app.route('/exports/<any(loans, reservations, fees):kind>', methods=['GET'])
+def export_rows(kind):
+    if g.current_user.role != 'staff':
+        raise Forbidden('Staff only')
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        abort(400, description=f"'format' must be one of {', '.join(EXPORT_FORMATS)}")
+    start, end = _date_arg('from'), _date_arg('to')
+    if start and end and start > end:
+        abort(400, description="'from' is after 'to'")
+    library_id = request.args.get('library_id', type=int)
+
+    query = _export_query(kind, start, end, library_id)
+    columns = [c.name for c in query.selected_columns]
+    rows = db.session.execute(query, execution_options={'yield_per': EXPORT_BATCH})
+
+    filename = '-'.join([kind] + [str(p) for p in (library_id, start, end) if p is not None])
+    return Response(stream_with_context(stream_rows(rows, columns, fmt)), mimetype=EXPORT_FORMATS[fmt], headers={
+        'Content-Disposition': f'attachment; filename="{filename}.{fmt}"',
+        'Cache-Control': 'no-store',
+        'X-Accel-Buffering': 'no'
+    })
+
+# 17. Usage analytics
+# GET /analytics/usage?period=day|hour&from=2025-10-01&to=2026-09-30&library_id=1
+# Reads only the usage_daily / usage_hourly rollups, which the usage_rollup job
+# brings up to date from the rows added since its watermark (usage_rollup.py),
+# so a year of days is a range read of 365 rows per library. Without
+# library_id the libraries are summed, seat peaks included.
+USAGE_ROLLUP_INTERVAL     = int(os.environ.get('USAGE_ROLLUP_INTERVAL', 300))
+USAGE_ROLLUP_BATCH        = int(os.environ.get('USAGE_ROLLUP_BATCH', 5000))
+ANALYTICS_MAX_DAYS        = int(os.environ.get('ANALYTICS_MAX_DAYS', 3 * 366))
+ANALYTICS_MAX_HOURLY_DAYS = int(os.environ.get('ANALYTICS_MAX_HOURLY_DAYS', 31))
+
+def roll_up_usage(now=None):
+    try:
+        return roll_up(db.session, now, USAGE_ROLLUP_BATCH)
+    except Exception:
+        db.session.rollback()
+        raise
+
+@app.cli.command('roll-up-usage')
+def roll_up_usage_command():
+    """Count new loans, reservations and fees into the usage rollups."""
+    click.echo(f"{roll_up_usage()} rows rolled up")
+
+def _usage_figures(row):
+    figures = {metric: row[metric] or 0 for metric in USAGE_METRICS}
+    figures['fines_amount'] = float(figures['fines_amount'])
+    figures['conversion'] = (round(figures['reservations_fulfilled'] / figures['reservations'], 3)
+                             if figures['reservations'] else None)
+    return figures
+
+@app.route('/analytics/usage', methods=['GET'])
+def usage_analytics():
+    if g.current_user.role != 'staff':
+        raise Forbidden('Staff only')
+    period = request.args.get('period', 'day')
+    if period not in ('day', 'hour'):
+        abort(400, description="'period' must be day or hour")
+    end = _date_arg('to') or date.today()
+    start = _date_arg('from') or end - timedelta(days=29)
+    max_days = ANALYTICS_MAX_HOURLY_DAYS if period == 'hour' else ANALYTICS_MAX_DAYS
+    if start > end or (end - start).days >= max_days:
+        abort(400, description=f"'from'..'to' must span 1 to {max_days} days")
+    library_id = request.args.get('library_id', type=int)
+
+    model = UsageHourly if period == 'hour' else UsageDaily
+    column = getattr(model, period)
+    first, after = start, end + timedelta(days=1)
+    if period == 'hour':
+        first, after = datetime.combine(first, time.min), datetime.combine(after, time.min)
+    query = (
+        select(column.label('period'),
+               *[func.sum(getattr(model, metric)).label(metric) for metric in USAGE_METRICS],
+               func.sum(model.seats_peak).label('seats_peak'),
+               func.sum(model.seats_active).label('seats_active'))
+        .where(column >= first, column < after)
+        .group_by(column)
+        .order_by(column)
+    )
+    if library_id is not None:
+        query = query.where(model.library_id == library_id)
+    rows = db.session.execute(query).mappings().all()
+
+    series = [{
+        period: row['period'].isoformat(),
+        **_usage_figures(row),
+        'seats_peak': row['seats_peak'],
+        'seats_active': row['seats_active'],
+    } for row in rows]
+    totals = _usage_figures({metric: sum(row[metric] or 0 for row in rows) for metric in USAGE_METRICS})
+    totals['seats_peak'] = max((row['seats_peak'] for row in rows), default=0)
+    rolled_up_at = db.session.execute(select(func.max(RollupWatermark.updated_at))).scalar()
+
+    return jsonify({
+        'library_id': library_id,
+        'period': period,
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'rolled_up_at': rolled_up_at.isoformat() if rolled_up_at else None,
+        'totals': totals,
+        'series': series
+    })
+
+# Runtime metrics (auth cache hit/miss counters, ...)
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    if g.current_user.role != 'staff':
+        raise Forbidden('Staff only')
+    return jsonify(metrics.snapshot())
+
+
+# Query-plan audit: EXPLAIN the hot handler queries and fail on full table scans.
+#   flask audit-queries [--seed 5000]    (seed only a scratch database)
+def _hot_queries():
+    now = datetime.utcnow()
+    today = date.today()
+    return [
+        ('user_summary: counters',
+         select(UserSummary).where(UserSummary.user_id == 1)),
+        ('summary reconcile: active reservations',
+         select(Reservation.user_id, func.count()).where(Reservation.user_id.in_([1, 2, 3]), Reservation.status == 'active')
+         .group_by(Reservation.user_id)),
+        ('summary reconcile: open loans',
+         select(Loan.user_id, func.count()).where(Loan.user_id.in_([1, 2, 3]), Loan.returned_date.is_(None))
+         .group_by(Loan.user_id)),
+        ('view_fees',
+         select(FeeFine).where(FeeFine.user_id == 1, FeeFine.status == 'unpaid')),
+        ('get_user_reservations',
+         select(Reservation).where(Reservation.user_id == 1)),
+        ('reservation sweeper',
+         select(Reservation.reservation_id).where(Reservation.status == 'active', Reservation.reserved_until < now)
+         .order_by(Reservation.reserved_until).limit(RESERVATION_SWEEP_BATCH)),
+        ('fine accrual batch',
+         overdue_loans(Loan.__table__, FeeFine.__table__, today, 0, FINE_ACCRUAL_BATCH)),
+        ('create_appointment / availability: busy intervals',
+         select(Appointment.librarian_user_id, Appointment.start_datetime, Appointment.end_datetime).where(
+             Appointment.librarian_user_id.in_([50, 100]),
+             Appointment.start_datetime >= now - timedelta(hours=APPOINTMENT_MAX_HOURS),
+             Appointment.start_datetime < now + timedelta(days=7),
+             Appointment.status != 'cancelled'
+         )),
+        ('seat occupancy warm-up',
+         select(*[getattr(Seat, field) for field in SEAT_FIELDS])
+         .join(Room, Room.room_id == Seat.room_id).where(Room.library_id == 1)),
+        ('active computers in a room',
+         select(Seat.seat_id).where(Seat.room_id == 1, Seat.is_computer == True, Seat.is_active == True)),
+        ('study room membership',
+         select(StudyRoomMember.member_id).where(StudyRoomMember.room_id == 1, StudyRoomMember.user_id == 1,
+                                                 StudyRoomMember.status == 'approved')),
+        ('study room member count',
+         select(func.count()).select_from(StudyRoomMember)
+         .where(StudyRoomMember.room_id == 1, StudyRoomMember.status == 'approved')),
+        ('get_hours / hours schedule',
+         select(OperatingTime).where(OperatingTime.library_id == 1)),
+        ('hold queue: waiting holds of a book',
+         select(BookHold.hold_id).where(BookHold.book_id == 1, BookHold.status == 'waiting')),
+        ('get_holds',
+         select(BookHold).where(BookHold.user_id == 1, BookHold.status == 'waiting')
+         .order_by(BookHold.hold_id.desc()).limit(100)),
+        ('batch availability',
+         select(*AVAILABILITY_FIELDS).where(or_(Book.book_id.in_([1, 2, 3]),
+                                                Book.isbn_key.in_(['9780306406157', '9791000000002'])))),
+        ('reading list of a module',
+         select(ModuleBook.book_id).where(ModuleBook.module_code == 'INF1511').order_by(ModuleBook.book_id)),
+        ('reading_list_warm: books of requested modules',
+         select(ModuleBook.module_code, *AVAILABILITY_FIELDS).join(Book, Book.book_id == ModuleBook.book_id)
+         .where(ModuleBook.module_code.in_(['INF1511', 'AUD0001']))
+         .order_by(ModuleBook.module_code, ModuleBook.book_id)),
+        ('book by isbn',
+         select(Book.book_id).where(Book.isbn_key == '9780306406157')),
+        ('export loans: library and date range',
+         _export_query('loans', today - timedelta(days=30), today, 1)),
+        ('export reservations: date range',
+         _export_query('reservations', today - timedelta(days=30), today, None)),
+        ('export fees: date range',
+         _export_query('fees', today - timedelta(days=30), today, None)),
+        ('usage analytics: one library, daily',
+         select(UsageDaily).where(UsageDaily.library_id == 1, UsageDaily.day >= today - timedelta(days=365),
+                                  UsageDaily.day < today)),
+        ('usage analytics: all libraries, hourly',
+         select(UsageHourly.hour, func.sum(UsageHourly.loans))
+         .where(UsageHourly.hour >= now - timedelta(days=7), UsageHourly.hour < now).group_by(UsageHourly.hour)),
+    ]
+
+def _seed_audit_data(n):
+    """Synthetic rows so the planner sees realistic table sizes."""
+    today = date.today()
+    now = datetime.utcnow()
+    library_id = db.session.query(Library.library_id).order_by(Library.library_id).scalar()
+    provision_library(library_id)
+    n_libraries = max(n // 100, 1)
+    first_library = db.session.query(func.max(Library.library_id)).scalar() + 1
+    tables = [
+        (Library, [{'library_id': first_library + i, 'name': f'Audit library {i}', 'location': 'Audit',
+                    'type': 'Information Center'} for i in range(n_libraries)]),
+        (OperatingTime, [{'library_id': first_library + i // 7, 'weekday': WEEKDAYS[i % 7],
+                          'open_time': time(8), 'close_time': time(20)} for i in range(n_libraries * 7)]),
+        (User, [{'user_id': i, 'firebase_uid': f'audit-{i}', 'name': f'Audit {i}', 'email': f'audit-{i}@example.com',
+                 'role': 'staff' if i % 50 == 0 else 'student'} for i in range(1, n + 1)]),
+        (Book, [{'book_id': i, 'isbn': f'979{i:010d}', 'isbn_key': f'979{i:010d}', 'title': f'Audit title {i}', 'author': 'Audit',
+                 'copies_total': 3, 'copies_available': 1} for i in range(1, n + 1)]),
+        (Reservation, [{'user_id': i % n + 1, 'book_id': i % n + 1, 'library_id': library_id,
+                        'reserved_from': now - timedelta(days=i % 365), 'reserved_until': now + timedelta(hours=i % 48 - 24),
+                        'status': ('active', 'cancelled', 'fulfilled')[i % 3]} for i in range(n)]),
+        (Loan, [{'user_id': i % n + 1, 'book_id': i % n + 1, 'library_id': library_id,
+                 'checkout_date': today - timedelta(days=20 + i % 365),
+                 'due_date': today - timedelta(days=i % 30 - 10),
+                 'returned_date': today if i % 4 == 0 else None} for i in range(n)]),
+        (FeeFine, [{'user_id': i % n + 1, 'amount': 5, 'status': ('unpaid', 'paid')[i % 2],
+                    'created_at': now - timedelta(days=i % 365),
+                    'loan_id': i + 1 if i % 3 else None,
+                    'running_loan_id': i + 1 if i % 3 and i % 2 == 0 else None} for i in range(n)]),
+        (Appointment, [{'user_id': i % n + 1, 'librarian_user_id': 50 * (i % max(n // 50, 1) + 1),
+                        'library_id': library_id, 'start_datetime': now + timedelta(hours=i),
+                        'end_datetime': now + timedelta(hours=i, minutes=30)} for i in range(n)]),
+        (BookHold, [{'book_id': i % (n // 10 + 1) + 1, 'user_id': i % n + 1, 'library_id': library_id,
+                     'requested_at': now, 'status': ('waiting', 'allocated', 'cancelled')[i % 3]} for i in range(n)]),
+        (UsageDaily, [{'library_id': first_library + i % n_libraries, 'day': today - timedelta(days=i // n_libraries),
+                       'loans': i % 40} for i in range(n)]),
+        (UsageHourly, [{'library_id': first_library + i % n_libraries, 'hour': now.replace(minute=0, second=0,
+                        microsecond=0) - timedelta(hours=i // n_libraries), 'loans': i % 5} for i in range(n)]),
+        (ModuleBook, [{'module_code': f'AUD{i // 10:04d}', 'book_id': i + 1} for i in range(n)]),
+        (StudyRoom, [{'room_id': i, 'name': f'Audit room {i}'} for i in range(1, n // 10 + 2)]),
+        (StudyRoomMember, [{'room_id': i % (n // 10 + 1) + 1, 'user_id': i % n + 1,
+                            'status': ('pending', 'approved', 'rejected')[i % 3]} for i in range(n)]),
+    ]
+    for model, rows in tables:
+        for chunk in chunked(rows, 1000):
+            db.session.execute(model.__table__.insert(), chunk)
+    db.session.commit()
+    reconcile_user_summaries()
+
+@app.cli.command('audit-queries')
+@click.option('--seed', type=int, default=0, help='insert N synthetic rows per table first (scratch databases only)')
+def audit_queries_command(seed):
+    """EXPLAIN the hot queries; exit 1 if any reads a table with a full scan."""
+    if seed:
+        if db.session.query(User.user_id).first():
+            raise click.ClickException('refusing to seed a database that already has users')
+        _seed_audit_data(seed)
+    with db.engine.connect() as conn:
+        if conn.dialect.name == 'sqlite':
+            conn.execute(text('ANALYZE'))
+        reports = audit(conn, _hot_queries())
+        conn.rollback()
+
+    failed = 0
+    for report in reports:
+        ok = not report['full_scans']
+        failed += not ok
+        click.echo(f"{'ok  ' if ok else 'SCAN'} {report['name']}"
+                   + ('' if ok else f"  (full scan of {', '.join(report['full_scans'])})"))
+        for line in report['plan']:
+            click.echo(f"       {line}")
+    click.echo(f"{len(reports) - failed}/{len(reports)} queries use indexes")
+    if failed:
+        raise SystemExit(1)
+
+
+# --- Background jobs ---
+# Database jobs run in exactly one process, started explicitly: the
+# `flask --app librarydb run-jobs` worker in production, or the dev server's
+# reloader child. Importing the module (gunicorn workers, other CLI commands)
+# starts nothing.
+def _record_job_run(name, rows, duration_ms, failed):
+    upsert(db.session, JobRun, [{
+        'name': name, 'runs': 1, 'errors': int(failed), 'rows': rows, 'last_rows': rows,
+        'last_duration_ms': round(duration_ms, 2), 'last_run_at': datetime.utcnow(),
+    }], ('name',), lambda new: {
+        'runs':             JobRun.runs + 1,
+        'errors':           JobRun.errors + new.errors,
+        'rows':             JobRun.rows + new.rows,
+        'last_rows':        new.last_rows,
+        'last_duration_ms': new.last_duration_ms,
+        'last_run_at':      new.last_run_at,
+    })
+    db.session.commit()
+
+def _job_runs():
+    return {run.name: {
+        'runs':             run.runs,
+        'errors':           run.errors,
+        'rows':             run.rows,
+        'last_rows':        run.last_rows,
+        'last_duration_ms': run.last_duration_ms,
+        'last_run_at':      run.last_run_at.isoformat() if run.last_run_at else None,
+    } for run in JobRun.query.order_by(JobRun.name)}
+
+# the jobs run in `flask run-jobs`; their stats reach the web workers' /metrics through job_run
+metrics.register('background_jobs', _job_runs)
+
+background_jobs = [
+    PeriodicJob(app, 'reservation_sweeper', RESERVATION_SWEEP_INTERVAL, expire_reservations, _record_job_run),
+    PeriodicJob(app, 'user_summary_reconcile', USER_SUMMARY_RECONCILE_INTERVAL, reconcile_user_summaries,
+                _record_job_run),
+    PeriodicJob(app, 'fine_accrual', FINE_ACCRUAL_INTERVAL, accrue_fines, _record_job_run),
+    PeriodicJob(app, 'usage_rollup', USAGE_ROLLUP_INTERVAL, roll_up_usage, _record_job_run),
+]
+
+# In-process cache refreshes belong to every serving process; each starts
+# its own on its first request.
+cache_jobs = [
+    PeriodicJob(app, 'reading_list_warm', max(AVAILABILITY_CACHE_TTL // 2, 1), availability_cache.warm),
+]
+_cache_jobs_lock = threading.Lock()
+
+def start_background_jobs(jobs=background_jobs):
+    for job in jobs:
+        if not job.is_alive():
+            job.start()
+
+@app.before_request
+def _start_cache_jobs():
+    if all(job.is_alive() for job in cache_jobs):
+        return
+    with _cache_jobs_lock:
+        start_background_jobs(cache_jobs)
+
+@app.cli.command('run-jobs')
+def run_jobs_command():
+    """Run the database background jobs in the foreground (one such process per deployment)."""
+    start_background_jobs()
+    click.echo(f"running {', '.join(job.name for job in background_jobs)}")
+    for job in background_jobs:
+        job.join()
+
+
 # Error Handlers
 @app.errorhandler(404)
 def not_found(error):
@@ -1228,9 +2989,18 @@ def forbidden(error):
 def bad_request(error):
     return jsonify({'error': 'Bad request'}), 400
 
+@app.cli.command('db-upgrade')
+def db_upgrade_command():
+    """Create missing tables, apply pending schema migrations and seed the default libraries."""
+    applied = migrations.upgrade()
+    click.echo(f"applied migrations: {', '.join(map(str, applied)) or 'none (up to date)'}")
+
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()
+        migrations.upgrade()
         initialize_library(library_id=1)
+    # debug=True runs the app in a reloader child; only that process runs the jobs
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_jobs()
     app.run(host='0.0.0.0', port=5003, debug=True)
 
@@ -1,8 +1,8 @@
-from flask import Flask, request, jsonify, g, abort, send_file, url_for
+from flask import Flask, request, jsonify, g, abort, send_file, url_for, Response
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 from datetime import datetime
-import uuid, os, json
+import uuid, os, json, queue, atexit
 import firebase_admin
 from firebase_admin import credentials, auth, db as firebase_db
 from sqlalchemy import Table
@@ -10,6 +10,11 @@ from werkzeug.exceptions import NotFound, Unauthorized, Forbidden
 from werkzeug.utils import secure_filename
 from flask import send_from_directory
 from extensions import db
+from auth_cache import auth_cache
+from metrics import metrics
+from chat_relay import ChatRelay, backend_from_env
+from db_pool import PoolTelemetry, engine_options
+from models import User, StudyRoom, StudyRoomMember, StudyRoomMedia, StudyRoomMindMap
 
 
 app = Flask(__name__)
@@ -26,10 +31,15 @@ if not DATABASE_URL:
     raise RuntimeError("DATABASE_URL env var is required")
 
 app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL
+# Pool size/overflow/timeout/recycle/pre-ping from LIBRARYDB_EXT_* (or DB_*), see db_pool.py
+pool_telemetry = PoolTelemetry('librarydb_ext')
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options('LIBRARYDB_EXT', DATABASE_URL, pool_telemetry)
+metrics.register('db_pool_ext', pool_telemetry.stats)
 
 
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['JWT_SECRET_KEY']                 = os.getenv('JWT_SECRET', 'super-secret-key')
+db.init_app(app)
 
 basedir = os.path.dirname(os.path.abspath(__file__))
 app.config.setdefault('MEDIA_UPLOAD_FOLDER', os.path.join(basedir, 'uploads', 'media'))
@@ -63,130 +73,66 @@ def authenticate_request():
         raise Unauthorized('Missing or invalid Authorization header')
     token = auth_header.split(' ', 1)[1]
     try:
-        decoded = auth.verify_id_token(token)
+        decoded = auth_cache.verify_token(token, auth.verify_id_token)
         request.firebase_uid = decoded['uid']
-        user = User.query.filter_by(firebase_uid=request.firebase_uid).first()
+        user = auth_cache.get_user(request.firebase_uid, _load_user)
         if not user:
             raise NotFound('User not found')
-        g.current_user = user
+        g.current_user = db.session.merge(user, load=False)
     except Exception as e:
         import traceback
         print("‼️ Token verification failed:", e)
         traceback.print_exc()
         raise Unauthorized(f'Invalid token: {e}')
 
-# --- Models ---
-class User(db.Model):
-    __tablename__ = 'user'
-    user_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    firebase_uid = db.Column(db.String(128), unique=True, nullable=False)
-    name = db.Column(db.String(256), nullable=False)
-    email = db.Column(db.String(256), unique=True, nullable=False)
-    role = db.Column(db.Enum('student', 'staff'), nullable=False, default='student')
-    
-    # Relationships
-    reservations = db.relationship('Reservation', backref='user', lazy=True)
-    loans = db.relationship('Loan', backref='user', lazy=True)
-    fees = db.relationship('FeeFine', backref='user', lazy=True)
-    appointments = db.relationship('Appointment', foreign_keys='Appointment.user_id', backref='user', lazy=True)
-    purchase_requests = db.relationship('PurchaseRequest', backref='user', lazy=True)
-    recommendations = db.relationship('Recommendation', backref='user', lazy=True)
-    
-class OperatingTime(db.Model):
-    __tablename__ = 'operatingtime'
-    operating_time_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    library_id        = db.Column(db.Integer, db.ForeignKey('library.library_id'), nullable=False)
-    weekday           = db.Column(db.Enum('Mon','Tue','Wed','Thu','Fri','Sat','Sun', name='weekday_enum'), nullable=False)
-    open_time         = db.Column(db.Time, nullable=False)
-    close_time        = db.Column(db.Time, nullable=False)
-
-class Library(db.Model):
-    __tablename__ = 'library'
-    __table_args__ = {'extend_existing': True}
-    library_id     = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    name           = db.Column(db.String(256), nullable=False)
-    location       = db.Column(db.String(256), nullable=False)
-    type           = db.Column(db.String(64), nullable=False, default='Information Center')
-    # relationship defined after both classes
-
-class StudyRoom(db.Model):
-    __tablename__ = 'study_room'
-    room_id        = db.Column(db.Integer, primary_key=True)
-    name           = db.Column(db.String(255), nullable=False)
-    description    = db.Column(db.Text)
-    subject        = db.Column(db.String(100))
-    capacity       = db.Column(db.Integer, default=10)
-    created_by     = db.Column(db.Integer, db.ForeignKey('user.user_id'))
-    created_at     = db.Column(db.DateTime, default=datetime.utcnow)
-    is_active      = db.Column(db.Boolean, default=True)
-
-class StudyRoomMember(db.Model):
-    __tablename__ = 'study_room_member'
-    member_id      = db.Column(db.Integer, primary_key=True)
-    room_id        = db.Column(db.Integer, db.ForeignKey('study_room.room_id'))
-    user_id        = db.Column(db.Integer, db.ForeignKey('user.user_id'))
-    student_number = db.Column(db.String(50))
-    student_email  = db.Column(db.String(255))
-    status         = db.Column(db.Enum('pending','approved','rejected',name='membership_status_enum'), default='pending')
-    joined_at      = db.Column(db.DateTime)
-
-    # ← ADD THIS:
-    user = db.relationship(
-        'User',
-        backref=db.backref('study_memberships', lazy='dynamic'),
-        lazy='joined'
-    )
-
 
-class StudyRoomMedia(db.Model):
-    __tablename__ = 'study_room_media'
-    media_id       = db.Column(db.Integer, primary_key=True)
-    room_id        = db.Column(db.Integer, db.ForeignKey('study_room.room_id'))
-    user_id        = db.Column(db.Integer, db.ForeignKey('user.user_id'))
-    file_name      = db.Column(db.String(255))
-    file_type      = db.Column(db.String(50))
-    file_path      = db.Column(db.String(512))
-    uploaded_at    = db.Column(db.DateTime, default=datetime.utcnow)
-
-    user = db.relationship(
-        'User',
-        backref=db.backref('media_uploads', lazy='dynamic'),
-        lazy='joined'
-    )
-
-class StudyRoomMindMap(db.Model):
-    __tablename__ = 'study_room_mindmap'
-    id = db.Column(db.Integer, primary_key=True)
-    room_id = db.Column(db.Integer, db.ForeignKey('study_room.room_id'), unique=True)
-    data = db.Column(db.JSON)  # Stores nodes and connections
+def _load_user(firebase_uid):
+    user = User.query.filter_by(firebase_uid=firebase_uid).first()
+    if user:
+        # keep the cached copy out of the session so commits never expire it
+        db.session.expunge(user)
+    return user
 
-# define relationship after both sides are known
-Library.operating_hours = db.relationship('OperatingTime', backref='library', lazy=True)
+# Models live in models.py, shared with librarydb; schema changes are
+# applied by `flask --app librarydb db-upgrade`.
 
 
 # 7. Chat Messages
+# Served from the in-process relay: GETs read its ring buffer, POSTs are
+# fanned out to /chat/stream subscribers and written to the backend in batches.
+CHAT_SSE_HEARTBEAT = 15
+chat_relay = ChatRelay(
+    backend_from_env(firebase_db.reference),
+    size=int(os.environ.get('CHAT_BUFFER_SIZE', 50)),
+    ttl=int(os.environ.get('CHAT_REFRESH_TTL', 10))
+)
+metrics.register('chat_relay', chat_relay.stats)
+atexit.register(chat_relay.flush)
+
 @app.route('/libraries/<int:library_id>/chat/messages', methods=['GET', 'POST'])
 def chat_messages(library_id):
-    ref = firebase_db.reference(f'chats/{library_id}/messages')
-    
     if request.method == 'GET':
-        # Get last 50 messages
-        messages = ref.order_by_child('timestamp').limit_to_last(50).get() or {}
-        return jsonify(list(messages.values()))
+        # Last CHAT_BUFFER_SIZE messages, oldest first
+        return jsonify(chat_relay.messages(library_id))
     
     elif request.method == 'POST':
-        data = request.get_json()
-        msg_id = str(uuid.uuid4())
-        
-        payload = {
-            'user_id': request.current_user.user_id,
-            'name': request.current_user.name,
-            'text': data['text'],
-            'timestamp': datetime.utcnow().isoformat()
-        }
-        
-        ref.child(msg_id).set(payload)
-        return jsonify(payload), 201
+        data = request.get_json() or {}
+        text = (data.get('text') or '').strip()
+        if not text:
+            return jsonify({'error': 'text is required'}), 400
+        try:
+            msg = chat_relay.post(library_id, g.current_user.user_id, g.current_user.name, text)
+        except queue.Full:
+            return jsonify({'error': 'Chat is busy, try again shortly'}), 503
+        return jsonify(msg), 201
+
+# Server-Sent Events: the recent messages, then one event per new message
+@app.route('/libraries/<int:library_id>/chat/stream', methods=['GET'])
+def chat_stream(library_id):
+    return Response(chat_relay.sse_stream(library_id, CHAT_SSE_HEARTBEAT), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
 
 # 15. User Registration (Sync with Firebase)
 @app.route('/register', methods=['POST'])
@@ -212,6 +158,7 @@ def register_user():
     
     db.session.add(user)
     db.session.commit()
+    auth_cache.invalidate_user(firebase_uid)
     
     return jsonify({
         'user_id': user.user_id,
@@ -563,6 +510,14 @@ def room_mindmap(room_id):
         return jsonify({'message': 'Mindmap saved'}), 200
 
 
+# Runtime metrics (auth cache hit/miss counters, ...)
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    if g.current_user.role != 'staff':
+        raise Forbidden('Staff only')
+    return jsonify(metrics.snapshot())
+
+
 # Error Handlers
 @app.errorhandler(404)
 def not_found(error):
@@ -0,0 +1,36 @@
+import threading
+
+
+class Metrics:
+    """Tiny in-process metrics registry (counters, gauges and callable sources)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._sources = {}
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def set(self, name, value):
+        with self._lock:
+            self._gauges[name] = value
+
+    def register(self, name, fn):
+        # fn() is called on every snapshot and must return something jsonify-able
+        self._sources[name] = fn
+
+    def snapshot(self):
+        with self._lock:
+            data = {
+                'counters': dict(self._counters),
+                'gauges':   dict(self._gauges),
+            }
+        for name, fn in self._sources.items():
+            data[name] = fn()
+        return data
+
+
+metrics = Metrics()
@@ -0,0 +1,112 @@
+from sqlalchemy import bindparam, delete, func, select, update
+
+from book_search import ensure_search_indexes, isbn_key
+from bulk import chunked
+from extensions import db
+from models import (Appointment, Book, FeeFine, Library, Loan, OperatingTime, Reservation, Room, Seat,
+                    StudyRoomMember)
+from schema import Migration, add_columns, create_indexes, drop_indexes, migrate
+
+# The explicit schema step for the library database, run once per deploy
+# (`flask --app librarydb db-upgrade`) instead of on every worker boot.
+
+
+def _running_fine_segments(conn):
+    add_columns(conn, FeeFine.__table__, 'running_loan_id')
+    conn.execute(update(FeeFine.__table__)
+                 .where(FeeFine.status == 'unpaid',
+                        FeeFine.loan_id.in_(select(Loan.loan_id).where(Loan.returned_date.is_(None))))
+                 .values(running_loan_id=FeeFine.loan_id))
+    # the plain loan_id index goes in first: MySQL needs one for the foreign key
+    create_indexes(conn, FeeFine.__table__, 'ix_feefine_loan', 'uq_feefine_running_loan')
+    drop_indexes(conn, FeeFine.__table__, 'uq_feefine_loan')
+
+def _isbn_keys(conn):
+    add_columns(conn, Book.__table__, 'isbn_key')
+    rows = conn.execute(select(Book.book_id, Book.isbn).where(Book.isbn_key.is_(None))).all()
+    stmt = update(Book.__table__).where(Book.book_id == bindparam('b_id')).values(isbn_key=bindparam('b_key'))
+    for chunk in chunked(rows, 1000):
+        conn.execute(stmt, [{'b_id': book_id, 'b_key': isbn_key(isbn)} for book_id, isbn in chunk])
+    create_indexes(conn, Book.__table__, 'ix_book_isbn_key')
+
+def _dedupe_rooms_and_seats(conn):
+    # keep the lowest id of each room and seat; a duplicate room's seats move to the room kept
+    kept = {}
+    for room_id, library_id, name in conn.execute(
+            select(Room.room_id, Room.library_id, Room.name).order_by(Room.room_id)):
+        keep = kept.setdefault((library_id, name), room_id)
+        if keep != room_id:
+            conn.execute(update(Seat.__table__).where(Seat.room_id == room_id).values(room_id=keep))
+            conn.execute(delete(Room.__table__).where(Room.room_id == room_id))
+    keep = select(func.min(Seat.seat_id).label('seat_id')).group_by(Seat.room_id, Seat.identifier).subquery()
+    conn.execute(delete(Seat.__table__).where(Seat.seat_id.not_in(select(keep.c.seat_id))))
+
+def _dedupe_operating_hours(conn):
+    # the old update endpoints edited the first row they found, so keep the lowest id
+    keep = select(func.min(OperatingTime.operating_time_id).label('operating_time_id')) \
+        .group_by(OperatingTime.library_id, OperatingTime.weekday).subquery()
+    conn.execute(delete(OperatingTime.__table__).where(
+        OperatingTime.operating_time_id.not_in(select(keep.c.operating_time_id))
+    ))
+
+# Schema changes to tables that already exist. create_all builds new tables
+# complete with their indexes; these steps bring older databases up to date.
+MIGRATIONS = [
+    Migration(1, 'reservation expiry, room and seat upsert keys', lambda conn: (
+        create_indexes(conn, Reservation.__table__, 'ix_reservation_status_until'),
+        _dedupe_rooms_and_seats(conn),
+        create_indexes(conn, Room.__table__, 'uq_room_library_name'),
+        create_indexes(conn, Seat.__table__, 'uq_seat_room_identifier'),
+    )),
+    Migration(2, 'running overdue fine per loan', lambda conn: (
+        add_columns(conn, FeeFine.__table__, 'loan_id', 'accrued_through'),
+        create_indexes(conn, FeeFine.__table__, 'ix_feefine_loan'),
+    )),
+    Migration(3, 'composite indexes for per-user and per-room lookups', lambda conn: (
+        create_indexes(conn, Reservation.__table__, 'ix_reservation_user_status'),
+        create_indexes(conn, Loan.__table__, 'ix_loan_user_returned'),
+        create_indexes(conn, FeeFine.__table__, 'ix_feefine_user_status'),
+        create_indexes(conn, Appointment.__table__, 'ix_appointment_librarian_start'),
+        create_indexes(conn, Seat.__table__, 'ix_seat_room_computer_active'),
+        create_indexes(conn, StudyRoomMember.__table__, 'ix_study_room_member_room_user_status'),
+    )),
+    Migration(4, 'one operating-hours row per library and weekday', lambda conn: (
+        _dedupe_operating_hours(conn),
+        create_indexes(conn, OperatingTime.__table__, 'uq_operatingtime_library_weekday'),
+    )),
+    Migration(5, 'loan library and date-range indexes for exports', lambda conn: (
+        add_columns(conn, Loan.__table__, 'library_id'),
+        create_indexes(conn, Loan.__table__, 'ix_loan_checkout', 'ix_loan_library_checkout'),
+        create_indexes(conn, Reservation.__table__, 'ix_reservation_from', 'ix_reservation_library_from'),
+        create_indexes(conn, FeeFine.__table__, 'ix_feefine_created'),
+    )),
+    Migration(6, 'overdue fines continue in a new segment after payment', _running_fine_segments),
+    Migration(7, 'normalised isbn lookup key', _isbn_keys),
+]
+
+DEFAULT_LIBRARIES = [
+    {
+        "name":     "Thoko Mayekiso",
+        "location": "Mbombela Mian campus",
+        "type":     "Information Center"
+    }
+]
+
+
+def upgrade():
+    """
+    Bring the library database up to date: create missing tables, apply the
+    pending MIGRATIONS, add the full-text index and seed DEFAULT_LIBRARIES
+    into an empty library table. Idempotent; needs an app context.
+    Returns the migration versions applied.
+    """
+    db.create_all()
+    applied = migrate(db.engine, 'librarydb', MIGRATIONS)
+    ensure_search_indexes(db.engine)
+
+    if db.session.query(Library.library_id).first() is None:
+        for lib_def in DEFAULT_LIBRARIES:
+            db.session.add(Library(**lib_def))
+        db.session.commit()
+        print(f"🌱 Seeded {len(DEFAULT_LIBRARIES)} default libraries")
+    return applied
@@ -0,0 +1,386 @@
+from datetime import date, datetime
+
+from sqlalchemy.dialects.mysql import LONGBLOB
+from sqlalchemy.orm import deferred, validates
+
+from book_search import isbn_key
+from extensions import db
+
+# One set of models for every service on the library database (librarydb,
+# librarydb_ext). Schema changes go through migrations.py, never import time.
+
+
+class User(db.Model):
+    __tablename__ = 'user'
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    firebase_uid = db.Column(db.String(128), unique=True, nullable=False)
+    name = db.Column(db.String(256), nullable=False)
+    email = db.Column(db.String(256), unique=True, nullable=False)
+    role = db.Column(db.Enum('student', 'staff'), nullable=False, default='student')
+
+    # Relationships
+    reservations = db.relationship('Reservation', backref='user', lazy=True)
+    loans = db.relationship('Loan', backref='user', lazy=True)
+    fees = db.relationship('FeeFine', backref='user', lazy=True)
+    appointments = db.relationship('Appointment', foreign_keys='Appointment.user_id', backref='user', lazy=True)
+    purchase_requests = db.relationship('PurchaseRequest', backref='user', lazy=True)
+    recommendations = db.relationship('Recommendation', backref='user', lazy=True)
+
+class Library(db.Model):
+    __tablename__ = 'library'
+    library_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    name = db.Column(db.String(256), nullable=False)
+    location = db.Column(db.String(256), nullable=False)
+    type = db.Column(db.String(64), nullable=False, default='Information Center')
+    
+    # Relationships
+    operating_hours = db.relationship('OperatingTime', backref='library', lazy=True)
+
+class Room(db.Model):
+    __tablename__ = 'room'
+    __table_args__ = (
+        db.Index('uq_room_library_name', 'library_id', 'name', unique=True),
+    )
+    room_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    library_id = db.Column(db.Integer, db.ForeignKey('library.library_id'), nullable=False)
+    name = db.Column(db.String(64), nullable=False)
+    room_type = db.Column(db.String(20), nullable=False) 
+    seats = db.relationship('Seat', backref='room', lazy=True)
+
+class Seat(db.Model):
+    __tablename__ = 'seat'
+    __table_args__ = (
+        db.Index('uq_seat_room_identifier', 'room_id', 'identifier', unique=True),
+        db.Index('ix_seat_room_computer_active', 'room_id', 'is_computer', 'is_active'),
+    )
+    seat_id     = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    room_id     = db.Column(db.Integer, db.ForeignKey('room.room_id'), nullable=False)
+    identifier  = db.Column(db.String(64), nullable=False)
+    is_computer = db.Column(db.Boolean, default=False)
+    is_active   = db.Column(db.Boolean, default=True)
+    is_occupied = db.Column(db.Boolean, default=False)
+    specs       = db.Column(db.String(256), default='Standard specs')
+
+
+class Book(db.Model):
+    __tablename__ = 'book'
+    __table_args__ = (
+        db.Index('ix_book_isbn_key', 'isbn_key'),
+    )
+    book_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    isbn = db.Column(db.String(32), unique=True, nullable=False)
+    # isbn_key(isbn): lookups match an ISBN whether it was stored or sent with hyphens or bare
+    isbn_key = db.Column(db.String(32))
+    title = db.Column(db.String(512), nullable=False)
+    author = db.Column(db.String(256), nullable=False)
+    publisher = db.Column(db.String(256))
+    year = db.Column(db.Integer)
+    copies_total = db.Column(db.Integer, default=1)
+    copies_available = db.Column(db.Integer, default=1)
+    # deferred: only the cover endpoint ever needs the blob
+    image = deferred(db.Column(db.LargeBinary().with_variant(LONGBLOB, 'mysql'), nullable=True))
+    
+    # Relationships
+    reservations = db.relationship('Reservation', backref='book', lazy=True)
+    loans = db.relationship('Loan', backref='book', lazy=True)
+
+    @validates('isbn')
+    def _set_isbn_key(self, _, value):
+        self.isbn_key = isbn_key(value)
+        return value
+
+# Reading lists: the books set for a module code (e.g. INF1511)
+class ModuleBook(db.Model):
+    __tablename__ = 'module_book'
+    __table_args__ = (
+        db.Index('ix_module_book_book', 'book_id'),
+    )
+    module_code = db.Column(db.String(16), primary_key=True)
+    book_id = db.Column(db.Integer, db.ForeignKey('book.book_id'), primary_key=True)
+    added_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class BookCover(db.Model):
+    __tablename__ = 'book_cover'
+    book_id    = db.Column(db.Integer, db.ForeignKey('book.book_id'), primary_key=True)
+    sha256     = db.Column(db.String(64), nullable=False)
+    mime_type  = db.Column(db.String(64), nullable=False, default='application/octet-stream')
+    size_bytes = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+# Resized, metadata-free renditions of a cover (see cover_pipeline.VARIANT_SIZES)
+class BookCoverVariant(db.Model):
+    __tablename__ = 'book_cover_variant'
+    book_id    = db.Column(db.Integer, db.ForeignKey('book.book_id'), primary_key=True)
+    variant    = db.Column(db.String(16), primary_key=True)
+    mime_type  = db.Column(db.String(64), nullable=False)
+    sha256     = db.Column(db.String(64), nullable=False)
+    width      = db.Column(db.Integer)
+    height     = db.Column(db.Integer)
+    size_bytes = db.Column(db.Integer, nullable=False)
+    data       = deferred(db.Column(db.LargeBinary().with_variant(LONGBLOB, 'mysql'), nullable=False))
+
+class Reservation(db.Model):
+    __tablename__ = 'reservation'
+    __table_args__ = (
+        db.Index('ix_reservation_status_until', 'status', 'reserved_until'),
+        db.Index('ix_reservation_user_status', 'user_id', 'status'),
+        db.Index('ix_reservation_from', 'reserved_from'),
+        db.Index('ix_reservation_library_from', 'library_id', 'reserved_from'),
+    )
+    reservation_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.user_id'), nullable=False)
+    book_id = db.Column(db.Integer, db.ForeignKey('book.book_id'), nullable=False)
+    library_id = db.Column(db.Integer, db.ForeignKey('library.library_id'), nullable=False)
+    reserved_from = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    reserved_until = db.Column(db.DateTime, nullable=False)
+    status = db.Column(db.Enum('active', 'cancelled', 'fulfilled'), default='active')
+
+# FIFO waitlist for a book with no copy left; served in hold_id order. A hold
+# becomes 'allocated' when a returned copy is turned into a reservation for it.
+class BookHold(db.Model):
+    __tablename__ = 'book_hold'
+    __table_args__ = (
+        db.Index('ix_book_hold_book_status', 'book_id', 'status', 'hold_id'),
+        db.Index('ix_book_hold_user_status', 'user_id', 'status'),
+    )
+    hold_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    book_id = db.Column(db.Integer, db.ForeignKey('book.book_id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.user_id'), nullable=False)
+    library_id = db.Column(db.Integer, db.ForeignKey('library.library_id'), nullable=False)
+    requested_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    status = db.Column(db.Enum('waiting', 'allocated', 'cancelled', name='hold_status_enum'),
+                       nullable=False, default='waiting')
+    allocated_at = db.Column(db.DateTime)
+
+class Loan(db.Model):
+    __tablename__ = 'loan'
+    __table_args__ = (
+        db.Index('ix_loan_user_returned', 'user_id', 'returned_date'),
+        db.Index('ix_loan_checkout', 'checkout_date'),
+        db.Index('ix_loan_library_checkout', 'library_id', 'checkout_date'),
+    )
+    loan_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.user_id'), nullable=False)
+    book_id = db.Column(db.Integer, db.ForeignKey('book.book_id'), nullable=False)
+    # library the book was collected from (NULL for loans made before it was recorded)
+    library_id = db.Column(db.Integer, db.ForeignKey('library.library_id'))
+    checkout_date = db.Column(db.Date, nullable=False, default=date.today)
+    due_date = db.Column(db.Date, nullable=False)
+    returned_date = db.Column(db.Date)
+
+class FeeFine(db.Model):
+    __tablename__ = 'feefine'
+    __table_args__ = (
+        db.Index('ix_feefine_loan', 'loan_id'),
+        db.Index('uq_feefine_running_loan', 'running_loan_id', unique=True),
+        db.Index('ix_feefine_user_status', 'user_id', 'status'),
+        db.Index('ix_feefine_created', 'created_at'),
+    )
+    feefine_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.user_id'), nullable=False)
+    amount = db.Column(db.Numeric(8,2), nullable=False)
+    description = db.Column(db.Text)
+    status = db.Column(db.Enum('unpaid', 'paid'), default='unpaid')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # overdue fine of one loan (NULL for other fees); a paid fine of a loan that
+    # stays overdue is followed by a new segment from its accrued_through date
+    loan_id = db.Column(db.Integer, db.ForeignKey('loan.loan_id'))
+    accrued_through = db.Column(db.Date)
+    # loan_id while this is the loan's unpaid, still-accruing segment, else NULL
+    running_loan_id = db.Column(db.Integer)
+
+# Materialised circulation counters behind /users/<id>/summary. Kept current in
+# the same transaction as the reservation/loan/fee change; reconciled periodically.
+class UserSummary(db.Model):
+    __tablename__ = 'user_summary'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.user_id'), primary_key=True)
+    active_reservations = db.Column(db.Integer, nullable=False, default=0)
+    open_loans = db.Column(db.Integer, nullable=False, default=0)
+    unpaid_fees = db.Column(db.Numeric(10,2), nullable=False, default=0)
+    reconciled_at = db.Column(db.DateTime)
+
+# Usage rollups per library (usage_rollup.py): one row per library and hour /
+# day, built incrementally from new loan, reservation and feefine rows plus
+# periodic seat-occupancy samples. library_id 0 collects rows with no library.
+class UsageHourly(db.Model):
+    __tablename__ = 'usage_hourly'
+    __table_args__ = (
+        db.Index('ix_usage_hourly_hour', 'hour'),
+    )
+    library_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    hour = db.Column(db.DateTime, primary_key=True)
+    loans = db.Column(db.Integer, nullable=False, default=0)
+    reservations = db.Column(db.Integer, nullable=False, default=0)
+    reservations_fulfilled = db.Column(db.Integer, nullable=False, default=0)
+    fines = db.Column(db.Integer, nullable=False, default=0)
+    fines_amount = db.Column(db.Numeric(12,2), nullable=False, default=0)
+    seats_peak = db.Column(db.Integer, nullable=False, default=0)
+    seats_active = db.Column(db.Integer, nullable=False, default=0)
+
+class UsageDaily(db.Model):
+    __tablename__ = 'usage_daily'
+    __table_args__ = (
+        db.Index('ix_usage_daily_day', 'day'),
+    )
+    library_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    day = db.Column(db.Date, primary_key=True)
+    loans = db.Column(db.Integer, nullable=False, default=0)
+    reservations = db.Column(db.Integer, nullable=False, default=0)
+    reservations_fulfilled = db.Column(db.Integer, nullable=False, default=0)
+    fines = db.Column(db.Integer, nullable=False, default=0)
+    fines_amount = db.Column(db.Numeric(12,2), nullable=False, default=0)
+    seats_peak = db.Column(db.Integer, nullable=False, default=0)
+    seats_active = db.Column(db.Integer, nullable=False, default=0)
+
+# Highest row id of each source table already counted into the rollups
+class RollupWatermark(db.Model):
+    __tablename__ = 'rollup_watermark'
+    source = db.Column(db.String(32), primary_key=True)
+    last_id = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime)
+
+# Rows the rollups must look at again: counted rows whose outcome is still open
+# (active reservations, running fines), and ids the watermark passed before
+# they were committed (counted False), looked for once more on the next run.
+class RollupPending(db.Model):
+    __tablename__ = 'rollup_pending'
+    source = db.Column(db.String(32), primary_key=True)
+    row_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    counted = db.Column(db.Boolean, nullable=False, default=True)
+
+# Totals and last run of each database background job, written by the
+# `flask run-jobs` process so every worker's /metrics can report them
+class JobRun(db.Model):
+    __tablename__ = 'job_run'
+    name = db.Column(db.String(64), primary_key=True)
+    runs = db.Column(db.Integer, nullable=False, default=0)
+    errors = db.Column(db.Integer, nullable=False, default=0)
+    rows = db.Column(db.BigInteger, nullable=False, default=0)
+    last_rows = db.Column(db.Integer, nullable=False, default=0)
+    last_duration_ms = db.Column(db.Float, nullable=False, default=0)
+    last_run_at = db.Column(db.DateTime)
+
+class Announcement(db.Model):
+    __tablename__ = 'announcement'
+    announcement_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    title = db.Column(db.String(256), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    posted_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    is_active = db.Column(db.Boolean, default=True)
+
+class OperatingTime(db.Model):
+    __tablename__ = 'operatingtime'
+    __table_args__ = (
+        db.Index('uq_operatingtime_library_weekday', 'library_id', 'weekday', unique=True),
+    )
+    operating_time_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    library_id = db.Column(db.Integer, db.ForeignKey('library.library_id'), nullable=False)
+    weekday = db.Column(db.Enum('Mon','Tue','Wed','Thu','Fri','Sat','Sun',name='weekday_enum'), nullable=False)
+    open_time = db.Column(db.Time, nullable=False)
+    close_time = db.Column(db.Time, nullable=False)
+
+class Appointment(db.Model):
+    __tablename__ = 'appointment'
+    __table_args__ = (
+        db.Index('ix_appointment_librarian_start', 'librarian_user_id', 'start_datetime'),
+    )
+    appointment_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.user_id'), nullable=False)
+    librarian_user_id = db.Column(db.Integer, db.ForeignKey('user.user_id'), nullable=False)
+    library_id = db.Column(db.Integer, db.ForeignKey('library.library_id'), nullable=False)
+    start_datetime = db.Column(db.DateTime, nullable=False)
+    end_datetime = db.Column(db.DateTime, nullable=False)
+    status = db.Column(db.Enum('pending','confirmed','cancelled','completed', name='appointment_status_enum'), default='pending')
+    notes = db.Column(db.Text)
+
+    # Relationships
+    librarian = db.relationship('User', foreign_keys=[librarian_user_id])
+
+class ImportJob(db.Model):
+    __tablename__ = 'import_job'
+    job_id      = db.Column(db.String(36), primary_key=True)
+    status      = db.Column(db.Enum('queued','running','completed','failed', name='import_status_enum'), default='queued')
+    source      = db.Column(db.String(256))
+    processed   = db.Column(db.Integer, default=0)
+    inserted    = db.Column(db.Integer, default=0)
+    updated     = db.Column(db.Integer, default=0)
+    failed      = db.Column(db.Integer, default=0)
+    covers      = db.Column(db.Integer, default=0)
+    errors      = db.Column(db.JSON)
+    message     = db.Column(db.Text)
+    created_at  = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+class PurchaseRequest(db.Model):
+    __tablename__ = 'purchaserequest'
+    request_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.user_id'), nullable=False)
+    title = db.Column(db.String(512), nullable=False)
+    author = db.Column(db.String(256), nullable=False)
+    isbn = db.Column(db.String(32))
+    justification = db.Column(db.Text)
+    status = db.Column(db.Enum('open','ordered','declined','received', name='purchase_status_enum'), default='open')
+    requested_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class Recommendation(db.Model):
+    __tablename__ = 'recommendation'
+    rec_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.user_id'), nullable=False)
+    category = db.Column(db.String(128), nullable=False)
+    content = db.Column(db.Text, nullable=False)
+    submitted_at = db.Column(db.DateTime, default=datetime.utcnow)
+    status = db.Column(db.Enum('new','reviewed','implemented','rejected', name='recommendation_status_enum'), default='new')
+
+class StudyRoom(db.Model):
+    __tablename__ = 'study_room'
+    room_id        = db.Column(db.Integer, primary_key=True)
+    name           = db.Column(db.String(255), nullable=False)
+    description    = db.Column(db.Text)
+    subject        = db.Column(db.String(100))
+    capacity       = db.Column(db.Integer, default=10)
+    created_by     = db.Column(db.Integer, db.ForeignKey('user.user_id'))
+    created_at     = db.Column(db.DateTime, default=datetime.utcnow)
+    is_active      = db.Column(db.Boolean, default=True)
+
+class StudyRoomMember(db.Model):
+    __tablename__ = 'study_room_member'
+    __table_args__ = (
+        db.Index('ix_study_room_member_room_user_status', 'room_id', 'user_id', 'status'),
+    )
+    member_id      = db.Column(db.Integer, primary_key=True)
+    room_id        = db.Column(db.Integer, db.ForeignKey('study_room.room_id'))
+    user_id        = db.Column(db.Integer, db.ForeignKey('user.user_id'))
+    student_number = db.Column(db.String(50))
+    student_email  = db.Column(db.String(255))
+    status         = db.Column(db.Enum('pending','approved','rejected',name='membership_status_enum'), default='pending')
+    joined_at      = db.Column(db.DateTime)
+
+    # ← ADD THIS:
+    user = db.relationship(
+        'User',
+        backref=db.backref('study_memberships', lazy='dynamic'),
+        lazy='joined'
+    )
+
+
+class StudyRoomMedia(db.Model):
+    __tablename__ = 'study_room_media'
+    media_id       = db.Column(db.Integer, primary_key=True)
+    room_id        = db.Column(db.Integer, db.ForeignKey('study_room.room_id'))
+    user_id        = db.Column(db.Integer, db.ForeignKey('user.user_id'))
+    file_name      = db.Column(db.String(255))
+    file_type      = db.Column(db.String(50))
+    file_path      = db.Column(db.String(512))
+    uploaded_at    = db.Column(db.DateTime, default=datetime.utcnow)
+
+    user = db.relationship(
+        'User',
+        backref=db.backref('media_uploads', lazy='dynamic'),
+        lazy='joined'
+    )
+
+class StudyRoomMindMap(db.Model):
+    __tablename__ = 'study_room_mindmap'
+    id = db.Column(db.Integer, primary_key=True)
+    room_id = db.Column(db.Integer, db.ForeignKey('study_room.room_id'), unique=True)
+    data = db.Column(db.JSON)  # Stores nodes and connections
@@ -0,0 +1,101 @@
+import base64
+import json
+from datetime import date, datetime
+
+from sqlalchemy import and_, or_
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT     = 100
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return {'$dt': value.isoformat()}
+    if isinstance(value, date):
+        return {'$d': value.isoformat()}
+    raise TypeError(f'Cannot encode {type(value).__name__} in a cursor')
+
+
+def _object_hook(obj):
+    if '$dt' in obj:
+        return datetime.fromisoformat(obj['$dt'])
+    if '$d' in obj:
+        return date.fromisoformat(obj['$d'])
+    return obj
+
+
+def encode_cursor(values):
+    raw = json.dumps(list(values), default=_default, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor. Raises ValueError on anything malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw, object_hook=_object_hook)
+    except Exception as e:
+        raise ValueError(f'Invalid cursor: {e}')
+    if not isinstance(values, list):
+        raise ValueError('Invalid cursor')
+    return values
+
+
+def cursor_requested(args):
+    """Cursor mode is opt-in: `?after=` and/or `?limit=` switch it on."""
+    return 'after' in args or 'limit' in args
+
+
+def cursor_args(args):
+    """Return (after_values or None, limit) from the request args."""
+    limit = args.get('limit', DEFAULT_LIMIT, type=int) or DEFAULT_LIMIT
+    limit = max(1, min(limit, MAX_LIMIT))
+    after = args.get('after') or None
+    return (decode_cursor(after) if after else None), limit
+
+
+def _fits(column, value):
+    """Whether a decoded cursor value can be compared with `column`."""
+    try:
+        expected = column.type.python_type
+    except NotImplementedError:
+        return value is not None
+    if expected is float:
+        expected = (int, float)
+    return isinstance(value, expected) and (expected is bool or not isinstance(value, bool))
+
+
+def seek_condition(keys, values):
+    """
+    WHERE clause that skips everything up to and including the row whose sort
+    key is `values`. `keys` is a list of (column, descending) pairs and must
+    end with a unique column so the ordering is total.
+    """
+    clauses = []
+    for i, (column, descending) in enumerate(keys):
+        equal_prefix = [keys[j][0] == values[j] for j in range(i)]
+        step = column < values[i] if descending else column > values[i]
+        clauses.append(and_(*equal_prefix, step))
+    return or_(*clauses)
+
+
+def order_by_keys(keys):
+    return [column.desc() if descending else column.asc() for column, descending in keys]
+
+
+def keyset_page(query, keys, after, limit, key_of):
+    """
+    Run one page of `query` ordered by `keys`, seeking past `after`.
+    `key_of(row)` returns the sort-key values of a result row.
+    Returns (rows, next_cursor) where next_cursor is None on the last page.
+    Raises ValueError when `after` does not match `keys` in length or types.
+    """
+    if after is not None:
+        if len(after) != len(keys) or not all(_fits(column, value) for (column, _), value in zip(keys, after)):
+            raise ValueError('Invalid cursor')
+        query = query.filter(seek_condition(keys, after))
+    query = query.order_by(*order_by_keys(keys))
+    rows = query.limit(limit + 1).all()
+
+    next_cursor = encode_cursor(key_of(rows[limit - 1])) if len(rows) > limit else None
+    return rows[:limit], next_cursor
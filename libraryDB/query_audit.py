@@ -0,0 +1,68 @@
+import json
+import re
+
+from sqlalchemy import text
+
+# SQLite prints "SCAN <table>" for a full table scan and "SCAN <table> USING
+# [COVERING] INDEX ..." when it walks an index instead. An AUTOMATIC index is
+# one it builds per query because no declared index fits, i.e. a scan too.
+_SQLITE_FULL_SCAN = re.compile(r'^(?:SCAN (?!CONSTANT ROW)(\w+)\b(?! USING)|SEARCH (\w+) USING AUTOMATIC)')
+
+
+def _compile(conn, stmt):
+    return str(stmt.compile(dialect=conn.dialect, compile_kwargs={'literal_binds': True}))
+
+
+def explain(conn, stmt):
+    """
+    Return (plan_lines, full_scans) for a SELECT: the database's plan as text
+    and the tables it reads with a full table scan.
+    """
+    dialect = conn.dialect.name
+    sql = _compile(conn, stmt)
+
+    if dialect == 'sqlite':
+        rows = conn.execute(text(f'EXPLAIN QUERY PLAN {sql}')).all()
+        lines = [row[-1] for row in rows]
+        scans = [m.group(1) or m.group(2) for m in (_SQLITE_FULL_SCAN.match(line) for line in lines) if m]
+        return lines, scans
+
+    if dialect == 'mysql':
+        rows = conn.execute(text(f'EXPLAIN {sql}')).mappings().all()
+        lines = [f"{r['table']}: type={r['type']} key={r['key']} rows={r['rows']}" for r in rows]
+        scans = [r['table'] for r in rows if r['type'] == 'ALL']
+        return lines, scans
+
+    if dialect == 'postgresql':
+        # with sequential scans priced out the planner only picks one when no index applies
+        conn.execute(text('SET LOCAL enable_seqscan = off'))
+        plan = conn.execute(text(f'EXPLAIN (FORMAT JSON) {sql}')).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        lines, scans = [], []
+
+        def walk(node, depth=0):
+            relation = node.get('Relation Name')
+            lines.append('  ' * depth + node['Node Type'] + (f' on {relation}' if relation else ''))
+            if node['Node Type'] == 'Seq Scan':
+                scans.append(relation)
+            for child in node.get('Plans', []):
+                walk(child, depth + 1)
+
+        walk(plan[0]['Plan'])
+        return lines, scans
+
+    raise NotImplementedError(f'EXPLAIN audit is not supported on {dialect}')
+
+
+def audit(conn, queries):
+    """
+    EXPLAIN every (name, statement) in `queries`. Returns a list of
+    {'name', 'plan', 'full_scans'} reports; the caller fails the run when
+    any report has full_scans.
+    """
+    reports = []
+    for name, stmt in queries:
+        plan, scans = explain(conn, stmt)
+        reports.append({'name': name, 'plan': plan, 'full_scans': scans})
+    return reports
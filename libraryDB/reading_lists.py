@@ -0,0 +1,143 @@
+import re
+import threading
+import time
+
+from book_search import isbn_key
+
+MODULE_CODE_RE = re.compile(r'^[A-Z]{2,6}[0-9]{3,5}[A-Z]?$')
+
+
+def normalize_module_code(value):
+    """'inf 1511' -> 'INF1511'; None if it does not look like a module code."""
+    code = re.sub(r'\s+', '', (value or '')).upper()
+    return code if MODULE_CODE_RE.match(code) else None
+
+
+class AvailabilityCache:
+    """
+    Compact availability rows ({'book_id', 'isbn', 'title', 'copies_available',
+    'copies_total'}) by book id, plus the book ids of each module's reading
+    list, for the batch availability endpoint.
+
+    load_books(book_ids, isbns) returns the rows of the books matching either
+    list in one query; load_module(code) returns a module's book ids;
+    load_modules(codes) returns (code, row) for every book of those reading
+    lists, for warm().
+
+    Rows expire after `ttl` seconds (copy counts move with every reservation);
+    reading lists after `module_ttl` or invalidate_module(). warm(), run
+    periodically, refreshes the books of the modules asked for in the last
+    `warm_window` seconds in one query, so a spike of reading-list lookups is
+    served from memory without a miss and a quiet process loads nothing.
+    """
+
+    def __init__(self, load_books, load_module, load_modules, ttl=10, module_ttl=300, warm_window=600):
+        self.load_books = load_books
+        self.load_module = load_module
+        self.load_modules = load_modules
+        self.ttl = ttl
+        self.module_ttl = module_ttl
+        self.warm_window = warm_window
+        self._lock = threading.Lock()
+        self._rows = {}         # book_id -> (row, loaded_at)
+        self._isbns = {}        # isbn_key(isbn) -> book_id (an isbn never moves to another book)
+        self._modules = {}      # code -> (book ids, loaded_at)
+        self._requested = {}    # code -> last asked for, drives warm()
+        self.hits = 0
+        self.misses = 0
+
+    def _fresh(self, entry, ttl, now):
+        return entry is not None and now - entry[1] <= ttl
+
+    def module_books(self, code):
+        now = time.monotonic()
+        self._requested[code] = now
+        entry = self._modules.get(code)
+        if self._fresh(entry, self.module_ttl, now):
+            return entry[0]
+        ids = tuple(self.load_module(code))
+        with self._lock:
+            self._modules[code] = (ids, now)
+        return ids
+
+    def invalidate_module(self, *codes):
+        with self._lock:
+            for code in codes:
+                self._modules.pop(code, None)
+
+    def lookup(self, book_ids=(), isbns=()):
+        """
+        Rows for the given book ids and ISBNs in request order (duplicates
+        dropped), and the ids/ISBNs that match no book. At most one query.
+        """
+        now = time.monotonic()
+        wanted_ids = list(dict.fromkeys(book_ids))
+        wanted_isbns = list(dict.fromkeys(isbns))
+
+        rows, need_ids, need_isbns = {}, [], []
+        for book_id in wanted_ids:
+            entry = self._rows.get(book_id)
+            if self._fresh(entry, self.ttl, now):
+                rows[book_id] = entry[0]
+            else:
+                need_ids.append(book_id)
+        for isbn in wanted_isbns:
+            entry = self._rows.get(self._isbns.get(isbn_key(isbn)))
+            if self._fresh(entry, self.ttl, now):
+                rows[entry[0]['book_id']] = entry[0]
+            else:
+                need_isbns.append(isbn)
+
+        self.hits += len(wanted_ids) + len(wanted_isbns) - len(need_ids) - len(need_isbns)
+        self.misses += len(need_ids) + len(need_isbns)
+        if need_ids or need_isbns:
+            loaded = self.load_books(need_ids, need_isbns)
+            self._store(loaded, now)
+            rows.update((row['book_id'], row) for row in loaded)
+
+        ordered, seen = [], set()
+        for book_id in wanted_ids + [self._isbns.get(isbn_key(isbn)) for isbn in wanted_isbns]:
+            if book_id in rows and book_id not in seen:
+                seen.add(book_id)
+                ordered.append(rows[book_id])
+        missing = {
+            'book_ids': [b for b in wanted_ids if b not in rows],
+            'isbns':    [i for i in wanted_isbns if self._isbns.get(isbn_key(i)) not in rows],
+        }
+        return ordered, missing
+
+    def _store(self, rows, now):
+        with self._lock:
+            for row in rows:
+                self._rows[row['book_id']] = (row, now)
+                self._isbns[isbn_key(row['isbn'])] = row['book_id']
+
+    def warm(self):
+        """Reload the recently requested reading lists and their books; returns the rows loaded."""
+        now = time.monotonic()
+        with self._lock:
+            for code, asked in list(self._requested.items()):
+                if now - asked > self.warm_window:
+                    del self._requested[code]
+            codes = sorted(self._requested)
+        if not codes:
+            return 0
+        modules = {code: [] for code in codes}
+        rows = {}
+        for code, row in self.load_modules(codes):
+            modules[code].append(row['book_id'])
+            rows[row['book_id']] = row
+        self._store(rows.values(), now)
+        with self._lock:
+            for code, ids in modules.items():
+                self._modules[code] = (tuple(ids), now)
+        return len(rows)
+
+    def stats(self):
+        return {
+            'books':   len(self._rows),
+            'modules': len(self._modules),
+            'warming': len(self._requested),
+            'hits':    self.hits,
+            'misses':  self.misses,
+        }
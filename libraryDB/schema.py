@@ -0,0 +1,80 @@
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select, text
+
+# version: int, strictly increasing per component; upgrade: fn(connection)
+Migration = namedtuple('Migration', 'version description upgrade')
+
+schema_version = Table(
+    'schema_version', MetaData(),
+    Column('component',   String(64), primary_key=True),
+    Column('version',     Integer, primary_key=True),
+    Column('description', String(256), nullable=False),
+    Column('applied_at',  DateTime, nullable=False),
+)
+
+
+def migrate(engine, component, migrations):
+    """
+    Apply the `migrations` of `component` that this database has not recorded
+    yet, in version order, each in its own transaction. Several services can
+    share one database; each keeps its own version sequence. Steps are written
+    to be idempotent so a database that already has a change (e.g. created by
+    `create_all`) just records the version. Returns the versions applied.
+    """
+    schema_version.create(engine, checkfirst=True)
+    with engine.connect() as conn:
+        done = set(conn.execute(
+            select(schema_version.c.version).where(schema_version.c.component == component)
+        ).scalars())
+
+    applied = []
+    for migration in sorted(migrations, key=lambda m: m.version):
+        if migration.version in done:
+            continue
+        with engine.begin() as conn:
+            migration.upgrade(conn)
+            conn.execute(schema_version.insert().values(
+                component=component, version=migration.version,
+                description=migration.description, applied_at=datetime.utcnow()
+            ))
+        applied.append(migration.version)
+    return applied
+
+
+def add_columns(conn, table, *names):
+    """ALTER TABLE ... ADD COLUMN for the named (nullable) columns `table` lacks."""
+    existing = {c['name'] for c in inspect(conn).get_columns(table.name)}
+    preparer = conn.dialect.identifier_preparer
+    for name in names:
+        if name in existing:
+            continue
+        column = table.c[name]
+        if not column.nullable:
+            raise RuntimeError(f'{table.name}.{name} is NOT NULL; add it with a default in its own step')
+        conn.execute(text(
+            f'ALTER TABLE {preparer.format_table(table)} ADD COLUMN '
+            f'{preparer.format_column(column)} {column.type.compile(dialect=conn.dialect)}'
+        ))
+
+
+def create_indexes(conn, table, *names):
+    """Create the named indexes declared on `table` (all of them if no names) that are missing."""
+    inspector = inspect(conn)
+    existing = {ix['name'] for ix in inspector.get_indexes(table.name)}
+    existing |= {uc['name'] for uc in inspector.get_unique_constraints(table.name)}
+    for index in table.indexes:
+        if (not names or index.name in names) and index.name not in existing:
+            index.create(conn)
+
+
+def drop_indexes(conn, table, *names):
+    """DROP the named indexes of `table` that still exist (replaced by a new declaration)."""
+    existing = {ix['name'] for ix in inspect(conn).get_indexes(table.name)}
+    preparer = conn.dialect.identifier_preparer
+    for name in names:
+        if name not in existing:
+            continue
+        on = f' ON {preparer.format_table(table)}' if conn.dialect.name == 'mysql' else ''
+        conn.execute(text(f'DROP INDEX {preparer.quote(name)}{on}'))
@@ -0,0 +1,207 @@
+import json
+import queue
+import threading
+import time
+
+SEAT_FIELDS = ('seat_id', 'room_id', 'identifier', 'is_computer', 'is_active', 'is_occupied', 'specs')
+
+
+class RoomBitmap:
+    """
+    Seats of one room in seat_id order. Bit i of each bitmap describes
+    seat_ids[i]; the per-seat details that rarely change sit in `info`.
+    """
+
+    def __init__(self, room_id):
+        self.room_id   = room_id
+        self.seat_ids  = []
+        self.positions = {}
+        self.info      = {}     # seat_id -> {'identifier', 'specs'}
+        self.occupied  = 0
+        self.active    = 0
+        self.computer  = 0
+
+    def _bit(self, seat_id):
+        return 1 << self.positions[seat_id]
+
+    def has(self, seat_id):
+        return seat_id in self.positions
+
+    def put(self, seat):
+        seat_id = seat['seat_id']
+        if seat_id not in self.positions:
+            self._insert(seat_id)
+        bit = self._bit(seat_id)
+        for name, flag in (('occupied', 'is_occupied'), ('active', 'is_active'), ('computer', 'is_computer')):
+            value = getattr(self, name)
+            setattr(self, name, value | bit if seat[flag] else value & ~bit)
+        self.info[seat_id] = {'identifier': seat['identifier'], 'specs': seat['specs']}
+
+    def _insert(self, seat_id):
+        # keep seat_id order; shift the bits of every later seat up by one
+        pos = 0
+        while pos < len(self.seat_ids) and self.seat_ids[pos] < seat_id:
+            pos += 1
+        low = (1 << pos) - 1
+        for name in ('occupied', 'active', 'computer'):
+            value = getattr(self, name)
+            setattr(self, name, (value & low) | ((value & ~low) << 1))
+        self.seat_ids.insert(pos, seat_id)
+        self.positions = {sid: i for i, sid in enumerate(self.seat_ids)}
+
+    def remove(self, seat_id):
+        pos = self.positions.get(seat_id)
+        if pos is None:
+            return
+        low = (1 << pos) - 1
+        for name in ('occupied', 'active', 'computer'):
+            value = getattr(self, name)
+            setattr(self, name, (value & low) | ((value >> (pos + 1)) << pos))
+        self.seat_ids.pop(pos)
+        self.positions = {sid: i for i, sid in enumerate(self.seat_ids)}
+        self.info.pop(seat_id, None)
+
+    def seat(self, seat_id):
+        bit = self._bit(seat_id)
+        return {
+            'seat_id':     seat_id,
+            'room_id':     self.room_id,
+            'identifier':  self.info[seat_id]['identifier'],
+            'specs':       self.info[seat_id]['specs'],
+            'is_computer': bool(self.computer & bit),
+            'is_active':   bool(self.active & bit),
+            'is_occupied': bool(self.occupied & bit),
+        }
+
+    def counts(self):
+        mask = (1 << len(self.seat_ids)) - 1
+        usable = self.active & mask
+        return {
+            'room_id':            self.room_id,
+            'seats':              len(self.seat_ids),
+            'active':             usable.bit_count(),
+            'occupied':           (self.occupied & usable).bit_count(),
+            'free':               (usable & ~self.occupied).bit_count(),
+            'computers_free':     (usable & self.computer & ~self.occupied).bit_count(),
+        }
+
+
+class OccupancyStore:
+    """
+    Per-library, per-room seat bitmaps kept current by the seat write endpoints,
+    plus fan-out of occupancy deltas to Server-Sent Events subscribers.
+
+    Each worker process holds its own copy; libraries are reloaded from the
+    database every `ttl` seconds so changes made by other workers show up
+    (and are published as deltas) within that window.
+    """
+
+    def __init__(self, ttl=30, max_queue=256):
+        self.ttl       = ttl
+        self.max_queue = max_queue
+        self._lock     = threading.RLock()
+        self._rooms    = {}     # library_id -> {room_id: RoomBitmap}
+        self._loaded   = {}     # library_id -> monotonic load time
+        self._subscribers = {}  # library_id -> set(queue.Queue)
+
+    def needs_load(self, library_id):
+        loaded = self._loaded.get(library_id)
+        return loaded is None or time.monotonic() - loaded > self.ttl
+
+    def load(self, library_id, rows):
+        """Replace a library's state with `rows` (tuples in SEAT_FIELDS order), publishing any differences."""
+        seats = [dict(zip(SEAT_FIELDS, row)) for row in rows]
+        with self._lock:
+            first_load = library_id not in self._loaded
+            seen = set()
+            for seat in seats:
+                seen.add(seat['seat_id'])
+                self._put(library_id, seat, publish=not first_load)
+            for room in list(self._rooms.get(library_id, {}).values()):
+                for seat_id in [sid for sid in room.seat_ids if sid not in seen]:
+                    room.remove(seat_id)
+                    self._publish(library_id, {'type': 'removed', 'seat_id': seat_id, 'room_id': room.room_id})
+            self._loaded[library_id] = time.monotonic()
+
+    def expire(self, library_id):
+        """Force a reload (with deltas published) on the next read."""
+        with self._lock:
+            if library_id in self._loaded:
+                self._loaded[library_id] = float('-inf')
+
+    def put(self, library_id, seat):
+        """Record one seat's current state (dict with SEAT_FIELDS keys) after a write."""
+        with self._lock:
+            if library_id not in self._loaded:
+                return      # not warmed yet; the first read will load it from the DB
+            self._put(library_id, seat, publish=True)
+
+    def _put(self, library_id, seat, publish):
+        rooms = self._rooms.setdefault(library_id, {})
+        previous = None
+        for room in rooms.values():
+            if room.has(seat['seat_id']):
+                previous = room.seat(seat['seat_id'])
+                if room.room_id != seat['room_id']:
+                    room.remove(seat['seat_id'])
+                break
+        rooms.setdefault(seat['room_id'], RoomBitmap(seat['room_id'])).put(seat)
+        current = rooms[seat['room_id']].seat(seat['seat_id'])
+        if publish and current != previous:
+            self._publish(library_id, {'type': 'seat', **current})
+
+    def seats(self, library_id, room_id=None, is_computer=None, active_only=False):
+        with self._lock:
+            rooms = self._rooms.get(library_id, {})
+            result = []
+            for rid in sorted(rooms):
+                if room_id and rid != room_id:
+                    continue
+                room = rooms[rid]
+                for seat_id in room.seat_ids:
+                    seat = room.seat(seat_id)
+                    if is_computer is not None and seat['is_computer'] != is_computer:
+                        continue
+                    if active_only and not seat['is_active']:
+                        continue
+                    result.append(seat)
+            return result
+
+    def summary(self, library_id):
+        with self._lock:
+            rooms = self._rooms.get(library_id, {})
+            return [rooms[rid].counts() for rid in sorted(rooms)]
+
+    # --- change stream ---
+
+    def subscribe(self, library_id):
+        q = queue.Queue(maxsize=self.max_queue)
+        with self._lock:
+            self._subscribers.setdefault(library_id, set()).add(q)
+        return q
+
+    def unsubscribe(self, library_id, q):
+        with self._lock:
+            self._subscribers.get(library_id, set()).discard(q)
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subs) for subs in self._subscribers.values())
+
+    def _publish(self, library_id, event):
+        for q in list(self._subscribers.get(library_id, ())):
+            try:
+                q.put_nowait(event)
+            except queue.Full:
+                # slow consumer: tell it to resync from a fresh snapshot
+                with q.mutex:
+                    q.queue.clear()
+                q.put_nowait({'type': 'resync'})
+
+
+def sse_event(event, name=None):
+    lines = []
+    if name:
+        lines.append(f'event: {name}')
+    lines.append(f'data: {json.dumps(event, separators=(",", ":"))}')
+    return '\n'.join(lines) + '\n\n'
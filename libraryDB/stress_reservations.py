@@ -0,0 +1,78 @@
+"""
+Concurrency stress test for POST /books/<id>/reserve against a running library
+service (e.g. `python librarydb.py` on a local database).
+
+Fires many parallel reservations at one book, then checks the inventory
+invariant: successes never exceed the copies that were available, and
+copies_available dropped by exactly the number of successful reservations.
+
+    LIBRARY_TOKEN=<firebase id token> python stress_reservations.py \
+        --base-url http://localhost:5003 --book-id 1 --requests 500 --workers 64 --cleanup
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+def copies_available(base_url, book_id, headers):
+    resp = requests.get(f"{base_url}/books/{book_id}", headers=headers, timeout=10)
+    resp.raise_for_status()
+    return resp.json()['copies_available']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', default='http://localhost:5003')
+    parser.add_argument('--book-id', type=int, required=True)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--workers', type=int, default=64)
+    parser.add_argument('--cleanup', action='store_true', help='cancel the reservations afterwards')
+    args = parser.parse_args()
+
+    token = os.environ.get('LIBRARY_TOKEN')
+    if not token:
+        sys.exit('LIBRARY_TOKEN env var is required')
+    headers = {'Authorization': f'Bearer {token}'}
+    url = f"{args.base_url}/books/{args.book_id}/reserve"
+
+    before = copies_available(args.base_url, args.book_id, headers)
+    session = requests.Session()
+
+    def reserve(_):
+        resp = session.post(url, json={}, headers=headers, timeout=30)
+        return resp.status_code, (resp.json().get('reservation_id') if resp.status_code == 201 else None)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        results = list(pool.map(reserve, range(args.requests)))
+    elapsed = time.perf_counter() - start
+
+    after = copies_available(args.base_url, args.book_id, headers)
+    created = [rid for status, rid in results if status == 201]
+    statuses = {}
+    for status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+
+    print(f"{args.requests} requests, {args.workers} workers in {elapsed:.2f}s "
+          f"({args.requests / elapsed:.0f} req/s)")
+    print(f"status codes: {statuses}")
+    print(f"copies_available: {before} -> {after}, reservations created: {len(created)}")
+
+    ok = len(created) <= before and after == before - len(created) and after >= 0
+    print("invariant", "OK" if ok else "VIOLATED")
+
+    if args.cleanup:
+        for rid in created:
+            session.delete(f"{args.base_url}/reservations/{rid}", headers=headers, timeout=30)
+        print(f"cancelled {len(created)} reservations, copies_available now "
+              f"{copies_available(args.base_url, args.book_id, headers)}")
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
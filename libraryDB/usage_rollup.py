@@ -0,0 +1,294 @@
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import case, delete, func, select, update
+
+from bulk import chunked, upsert
+from models import (FeeFine, Loan, Reservation, Room, RollupPending, RollupWatermark, Seat,
+                    UsageDaily, UsageHourly)
+
+# additive metrics of usage_hourly / usage_daily; the seat columns are maxima
+METRICS = ('loans', 'reservations', 'reservations_fulfilled', 'fines', 'fines_amount')
+UNKNOWN_LIBRARY = 0     # loans from before loan.library_id, fees without a loan
+
+
+class Buckets:
+    """Metric increments per (library_id, hour) and (library_id, day)."""
+
+    def __init__(self):
+        self.hourly = {}
+        self.daily = {}
+
+    def add(self, library_id, when, metric, amount=1):
+        # a date (loan checkout) only has a day bucket
+        if when is None:
+            return
+        periods = [(self.daily, when.date() if isinstance(when, datetime) else when)]
+        if isinstance(when, datetime):
+            periods.append((self.hourly, when.replace(minute=0, second=0, microsecond=0)))
+        for buckets, period in periods:
+            row = buckets.setdefault((library_id or UNKNOWN_LIBRARY, period), dict.fromkeys(METRICS, 0))
+            row[metric] += amount
+
+
+# Each source: its id column, the columns counted, and count(buckets, row,
+# first_seen) which adds the row's increments and returns True while the row's
+# outcome is still open. Open rows go to rollup_pending and are counted again
+# (first_seen=False) once settled; their first sighting is never repeated.
+
+def _loan_rows():
+    return select(Loan.loan_id.label('row_id'), Loan.library_id, Loan.checkout_date)
+
+def _count_loan(buckets, row, first_seen):
+    buckets.add(row.library_id, row.checkout_date, 'loans')
+    return False
+
+def _reservation_rows():
+    return select(Reservation.reservation_id.label('row_id'), Reservation.library_id,
+                  Reservation.reserved_from, Reservation.status)
+
+def _count_reservation(buckets, row, first_seen):
+    # conversion is credited to the hour the reservation was made
+    if first_seen:
+        buckets.add(row.library_id, row.reserved_from, 'reservations')
+    if row.status == 'fulfilled':
+        buckets.add(row.library_id, row.reserved_from, 'reservations_fulfilled')
+    return row.status == 'active'
+
+def _fine_rows():
+    return (
+        select(FeeFine.feefine_id.label('row_id'), Loan.library_id, FeeFine.created_at, FeeFine.amount,
+               FeeFine.status, FeeFine.loan_id, Loan.returned_date)
+        .outerjoin(Loan, Loan.loan_id == FeeFine.loan_id)
+    )
+
+def _count_fine(buckets, row, first_seen):
+    # a running overdue fine grows until its loan is returned or it is paid
+    if first_seen:
+        buckets.add(row.library_id, row.created_at, 'fines')
+    settled = row.loan_id is None or row.returned_date is not None or row.status == 'paid'
+    if settled:
+        buckets.add(row.library_id, row.created_at, 'fines_amount', Decimal(row.amount))
+    return not settled
+
+SOURCES = {
+    'loan':        (Loan.loan_id, _loan_rows, _count_loan),
+    'reservation': (Reservation.reservation_id, _reservation_rows, _count_reservation),
+    'feefine':     (FeeFine.feefine_id, _fine_rows, _count_fine),
+}
+
+
+def _lock_watermarks(session):
+    upsert(session, RollupWatermark, [{'source': source, 'last_id': 0} for source in SOURCES], ('source',))
+    # one rollup run at a time across workers: a second run waits here, then
+    # starts from the watermarks the first one committed
+    return dict(session.execute(
+        select(RollupWatermark.source, RollupWatermark.last_id)
+        .order_by(RollupWatermark.source)
+        .with_for_update()
+    ).all())
+
+
+def _settle_pending(session, buckets, batch_size):
+    settled = 0
+    for source, (id_col, rows, count) in SOURCES.items():
+        pending = session.execute(
+            select(RollupPending.row_id, RollupPending.counted)
+            .where(RollupPending.source == source).order_by(RollupPending.row_id)
+        ).all()
+        for chunk in chunked(pending, batch_size):
+            found = {row.row_id: row for row in session.execute(rows().where(id_col.in_([p.row_id for p in chunk])))}
+            done, seen = [], []
+            for row_id, counted in chunk:
+                row = found.get(row_id)
+                # a row that is gone (a cancelled reservation is deleted, an insert
+                # rolled back) has nothing left to count
+                if row is None or not count(buckets, row, not counted):
+                    done.append(row_id)
+                elif not counted:
+                    seen.append(row_id)
+            if done:
+                session.execute(delete(RollupPending).where(RollupPending.source == source,
+                                                            RollupPending.row_id.in_(done)))
+            if seen:
+                session.execute(update(RollupPending).where(RollupPending.source == source,
+                                                            RollupPending.row_id.in_(seen))
+                                .values(counted=True).execution_options(synchronize_session=False))
+            settled += len(done) + len(seen)
+    return settled
+
+
+def _write(session, buckets):
+    for model, period, rows in ((UsageHourly, 'hour', buckets.hourly), (UsageDaily, 'day', buckets.daily)):
+        table = model.__table__
+        upsert(session, table, [
+            {'library_id': library_id, period: when, **metrics}
+            for (library_id, when), metrics in sorted(rows.items())
+        ], ('library_id', period), lambda new, table=table: {c: table.c[c] + new[c] for c in METRICS})
+
+
+def sample_seats(session, now):
+    """Fold the current occupied / active seat count of each library into this hour's and day's peaks."""
+    counts = session.execute(
+        select(Room.library_id,
+               func.sum(case((Seat.is_occupied == True, 1), else_=0)),
+               func.count(Seat.seat_id))
+        .join(Room, Room.room_id == Seat.room_id)
+        .where(Seat.is_active == True)
+        .group_by(Room.library_id)
+    ).all()
+    for model, period, when in ((UsageHourly, 'hour', now.replace(minute=0, second=0, microsecond=0)),
+                                (UsageDaily, 'day', now.date())):
+        table = model.__table__
+        upsert(session, table, [
+            {'library_id': library_id, period: when, 'seats_peak': int(occupied or 0), 'seats_active': active}
+            for library_id, occupied, active in counts
+        ], ('library_id', period), lambda new, table=table: {
+            c: case((new[c] > table.c[c], new[c]), else_=table.c[c]) for c in ('seats_peak', 'seats_active')
+        })
+    return len(counts)
+
+
+def roll_up(session, now=None, batch_size=5000):
+    """
+    Count the loan, reservation and feefine rows added since the last run
+    into usage_hourly / usage_daily, settle pending rows whose outcome is now
+    known, and sample seat occupancy. Each batch of up to `batch_size` new
+    rows per source is one transaction that also advances the watermarks, so
+    every row is counted exactly once; ids the watermark passes before their
+    insert commits are looked for again on the next run. Returns the number
+    of rows counted or settled.
+    """
+    now = now or datetime.utcnow()
+    counted = 0
+    first = True
+    while True:
+        marks = _lock_watermarks(session)
+        buckets = Buckets()
+        if first:
+            counted += _settle_pending(session, buckets, batch_size)
+            sample_seats(session, now)
+            session.execute(update(RollupWatermark).values(updated_at=now)
+                            .execution_options(synchronize_session=False))
+
+        full = False
+        for source, (id_col, rows, count) in SOURCES.items():
+            new = session.execute(
+                rows().where(id_col > marks[source]).order_by(id_col).limit(batch_size)
+            ).all()
+            if not new:
+                continue
+            pending = []
+            expected = marks[source] + 1
+            for row in new:
+                # ids skipped here may belong to inserts not committed yet; a
+                # jump longer than a batch is a sequence gap, not in-flight rows
+                if row.row_id - expected <= batch_size:
+                    pending += [{'source': source, 'row_id': i, 'counted': False}
+                                for i in range(expected, row.row_id)]
+                expected = row.row_id + 1
+                if count(buckets, row, True):
+                    pending.append({'source': source, 'row_id': row.row_id, 'counted': True})
+            if pending:
+                session.execute(RollupPending.__table__.insert(), pending)
+            session.execute(
+                update(RollupWatermark).where(RollupWatermark.source == source)
+                .values(last_id=new[-1].row_id)
+                .execution_options(synchronize_session=False)
+            )
+            counted += len(new)
+            full = full or len(new) == batch_size
+
+        _write(session, buckets)
+        session.commit()
+        first = False
+        if not full:
+            return counted
+
+
+if __name__ == '__main__':
+    # Benchmark: a year-long daily dashboard for one library read from the
+    # rollups, against the ad-hoc GROUP BY over the raw tables it replaces.
+    #   python usage_rollup.py [loans]
+    import sys
+    import tempfile
+    import time
+    from datetime import timedelta
+
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+
+    from extensions import db
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    engine = create_engine(f'sqlite:///{tempfile.mkdtemp()}/rollup.db')
+    db.metadata.create_all(engine)
+    now = datetime(2026, 3, 1, 12)
+    first = now - timedelta(days=365)
+
+    with engine.begin() as conn:
+        conn.execute(Room.__table__.insert(), [{'room_id': 1, 'library_id': 1, 'name': 'Main', 'room_type': 'study'}])
+        conn.execute(Seat.__table__.insert(), [{'room_id': 1, 'identifier': f'S{i}', 'is_active': True,
+                                                'is_occupied': i % 3 == 0} for i in range(60)])
+        for start in range(0, n, 50_000):
+            ids = range(start + 1, min(start + 50_000, n) + 1)
+            conn.execute(Loan.__table__.insert(), [{
+                'loan_id': i, 'user_id': i % 997 + 1, 'book_id': i % 4999 + 1, 'library_id': i % 3 + 1,
+                'checkout_date': (first + timedelta(minutes=i * 525_600 // n)).date(),
+                'due_date': (first + timedelta(minutes=i * 525_600 // n, days=5)).date(),
+                'returned_date': (first + timedelta(minutes=i * 525_600 // n, days=3)).date() if i % 50 else None,
+            } for i in ids])
+            conn.execute(Reservation.__table__.insert(), [{
+                'reservation_id': i, 'user_id': i % 997 + 1, 'book_id': i % 4999 + 1, 'library_id': i % 3 + 1,
+                'reserved_from': first + timedelta(minutes=i * 525_600 // n),
+                'reserved_until': first + timedelta(minutes=i * 525_600 // n, hours=24),
+                'status': ('fulfilled', 'cancelled', 'active')[i % 3] if i > n - 100 else ('fulfilled', 'cancelled')[i % 2],
+            } for i in ids])
+            conn.execute(FeeFine.__table__.insert(), [{
+                'feefine_id': i // 5, 'user_id': i % 997 + 1, 'loan_id': i, 'amount': 5 * (i % 7 + 1),
+                'status': 'unpaid', 'created_at': first + timedelta(minutes=i * 525_600 // n, days=6),
+                'accrued_through': None,
+            } for i in ids if i % 5 == 0])
+
+    with Session(engine) as session:
+        start = time.perf_counter()
+        counted = roll_up(session, now)
+        print(f"initial rollup: {counted:,} rows in {time.perf_counter() - start:.2f}s")
+        session.execute(Loan.__table__.insert(), [{'user_id': 1, 'book_id': 1, 'library_id': 1,
+                                                   'checkout_date': now.date(), 'due_date': now.date()}] * 100)
+        session.commit()
+        start = time.perf_counter()
+        counted = roll_up(session, now)
+        print(f"incremental rollup: {counted:,} rows in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+        def from_rollups():
+            return session.execute(
+                select(UsageDaily.day, UsageDaily.loans, UsageDaily.reservations,
+                       UsageDaily.reservations_fulfilled, UsageDaily.fines, UsageDaily.fines_amount)
+                .where(UsageDaily.library_id == 1, UsageDaily.day >= first.date())
+                .order_by(UsageDaily.day)
+            ).all()
+
+        def from_raw():
+            loans = session.execute(
+                select(Loan.checkout_date, func.count()).where(Loan.library_id == 1, Loan.checkout_date >= first.date())
+                .group_by(Loan.checkout_date)).all()
+            reservations = session.execute(
+                select(func.date(Reservation.reserved_from), func.count(),
+                       func.sum(case((Reservation.status == 'fulfilled', 1), else_=0)))
+                .where(Reservation.library_id == 1, Reservation.reserved_from >= first)
+                .group_by(func.date(Reservation.reserved_from))).all()
+            fines = session.execute(
+                select(func.date(FeeFine.created_at), func.count(), func.sum(FeeFine.amount))
+                .join(Loan, Loan.loan_id == FeeFine.loan_id)
+                .where(Loan.library_id == 1, FeeFine.created_at >= first)
+                .group_by(func.date(FeeFine.created_at))).all()
+            return loans, reservations, fines
+
+        for label, fn in (('rollups', from_rollups), ('raw tables', from_raw)):
+            start = time.perf_counter()
+            for _ in range(5):
+                fn()
+            print(f"365-day dashboard from {label}: {(time.perf_counter() - start) / 5 * 1000:8.1f} ms")
+        total = session.execute(select(func.sum(UsageDaily.loans))).scalar()
+        print(f"loans rolled up {total:,} of {session.execute(select(func.count(Loan.loan_id))).scalar():,}")
@@ -0,0 +1,159 @@
+import threading
+import time
+from array import array
+from datetime import timedelta
+
+from appointment_slots import WEEKDAYS
+
+MINUTES_PER_DAY  = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+
+def _minute(t):
+    return t.hour * 60 + t.minute
+
+
+class WeeklySchedule:
+    """
+    One library's OperatingTime rows compiled for constant-time lookups.
+
+    Every minute of the week (Monday 00:00 = 0) has an open flag and the number
+    of minutes until that flag next flips, wrapping around Sunday night, so
+    "open now, and until when?" is two array reads. As in opening_windows, a
+    day whose close time is not after its open time counts as closed.
+    """
+
+    def __init__(self, hours):
+        # hours: {weekday: (open_time, close_time)}
+        self.hours = dict(hours)
+        is_open = bytearray(MINUTES_PER_WEEK)
+        self._days = []
+        for day, weekday in enumerate(WEEKDAYS):
+            times = self.hours.get(weekday)
+            if times and times[1] > times[0]:
+                start = day * MINUTES_PER_DAY + _minute(times[0])
+                end   = day * MINUTES_PER_DAY + _minute(times[1])
+                is_open[start:end] = b'\x01' * (end - start)
+                self._days.append((weekday, times[0].strftime('%H:%M'), times[1].strftime('%H:%M')))
+            else:
+                self._days.append((weekday, None, None))
+        self._open = bytes(is_open)
+
+        # minutes until the next flip, filled walking backwards around the week
+        # twice so minutes after the last flip of the week see next week's first
+        self._until = None
+        if 0 < sum(self._open) < MINUTES_PER_WEEK:
+            until = array('H', bytes(2 * MINUTES_PER_WEEK))
+            flip = None
+            for m in range(2 * MINUTES_PER_WEEK - 1, -1, -1):
+                i = m % MINUTES_PER_WEEK
+                if self._open[i] != self._open[(i + 1) % MINUTES_PER_WEEK]:
+                    flip = m + 1
+                if m < MINUTES_PER_WEEK:
+                    until[i] = flip - m
+            self._until = until
+
+    def status(self, when):
+        """(is_open, next_change) at datetime `when`; next_change is None if the state never changes."""
+        m = when.weekday() * MINUTES_PER_DAY + when.hour * 60 + when.minute
+        is_open = bool(self._open[m])
+        if self._until is None:
+            return is_open, None
+        return is_open, when.replace(second=0, microsecond=0) + timedelta(minutes=self._until[m])
+
+    def week(self, first_day):
+        """Hours of the 7 days starting at date `first_day`."""
+        offset = first_day.weekday()
+        return [{
+            'date':       (first_day + timedelta(days=i)).isoformat(),
+            'weekday':    weekday,
+            'open':       open_time is not None,
+            'open_time':  open_time,
+            'close_time': close_time,
+        } for i, (weekday, open_time, close_time) in enumerate(self._days[offset:] + self._days[:offset])]
+
+
+class ScheduleCache:
+    """
+    WeeklySchedule per library, built on first use and rebuilt only after
+    invalidate() (called by the hours write endpoints) or once `ttl` seconds
+    have passed, which picks up changes made through other worker processes.
+
+    loader(library_id) returns {weekday: (open_time, close_time)}, or None
+    for a library that does not exist (not cached).
+    """
+
+    def __init__(self, loader, ttl=60):
+        self.loader = loader
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._schedules = {}    # library_id -> (schedule, built_at)
+        self.hits = 0
+        self.builds = 0
+
+    def get(self, library_id):
+        entry = self._schedules.get(library_id)
+        if entry is not None and time.monotonic() - entry[1] <= self.ttl:
+            self.hits += 1
+            return entry[0]
+        hours = self.loader(library_id)
+        if hours is None:
+            return None
+        schedule = WeeklySchedule(hours)
+        with self._lock:
+            self._schedules[library_id] = (schedule, time.monotonic())
+            self.builds += 1
+        return schedule
+
+    def invalidate(self, *library_ids):
+        with self._lock:
+            for library_id in library_ids:
+                self._schedules.pop(library_id, None)
+
+    def stats(self):
+        return {'libraries': len(self._schedules), 'hits': self.hits, 'builds': self.builds}
+
+
+if __name__ == '__main__':
+    # Benchmark: "is it open now, and until when?" from the compiled schedule
+    # against scanning the weekday rows for every request.
+    #   python weekly_schedule.py [lookups]
+    import sys
+    from datetime import datetime, time as dtime
+
+    lookups = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    hours = {day: (dtime(8), dtime(20)) for day in WEEKDAYS[:5]}
+    hours['Sat'] = (dtime(9), dtime(13))
+
+    start = time.perf_counter()
+    schedule = WeeklySchedule(hours)
+    print(f"compile: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    base = datetime(2026, 3, 2)
+    moments = [base + timedelta(minutes=(i * 7919) % MINUTES_PER_WEEK) for i in range(lookups)]
+
+    def scan(when):
+        # what every client did with the raw rows
+        for offset in range(8):
+            day = when.date() + timedelta(days=offset)
+            times = hours.get(WEEKDAYS[day.weekday()])
+            if not times:
+                continue
+            opens, closes = datetime.combine(day, times[0]), datetime.combine(day, times[1])
+            if when < opens:
+                return False, opens
+            if when < closes:
+                return True, closes
+        return False, None
+
+    start = time.perf_counter()
+    for when in moments:
+        schedule.status(when)
+    compiled = time.perf_counter() - start
+    start = time.perf_counter()
+    for when in moments:
+        scan(when)
+    scanned = time.perf_counter() - start
+    assert all(schedule.status(w) == scan(w) for w in moments[:10_000])
+    print(f"{lookups:,} lookups: compiled {compiled / lookups * 1e6:.2f} us each, "
+          f"row scan {scanned / lookups * 1e6:.2f} us each")
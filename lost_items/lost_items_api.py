@@ -8,8 +8,15 @@ import json
 import firebase_admin
 from firebase_admin import credentials, auth
 import re
-from sqlalchemy import or_
+import base64
+from sqlalchemy import or_, and_, inspect
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.pool import QueuePool
 from flask import send_from_directory
+from bisect import bisect_left
+import threading
+import time
 
 
 
@@ -31,6 +38,54 @@ if not DATABASE_URL:
 
 app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL
 
+# Connection pool from LOST_ITEMS_<NAME> (or DB_<NAME>) env vars, with
+# checkout telemetry served at /api/pool-stats
+POOL_DEFAULTS = {'POOL_SIZE': 5, 'MAX_OVERFLOW': 10, 'POOL_TIMEOUT': 30, 'POOL_RECYCLE': 1800, 'POOL_PRE_PING': 1}
+WAIT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+def pool_setting(name):
+    for key in (f'LOST_ITEMS_{name}', f'DB_{name}'):
+        if key in os.environ:
+            return int(os.environ[key])
+    return POOL_DEFAULTS[name]
+
+pool_stats_lock = threading.Lock()
+pool_stats = {'pool': None, 'checkouts': 0, 'timeouts': 0, 'wait_ms_total': 0.0, 'wait_ms_max': 0.0,
+              'buckets': [0] * (len(WAIT_BUCKETS_MS) + 1)}
+
+class TimedQueuePool(QueuePool):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        pool_stats['pool'] = self
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeout:
+            with pool_stats_lock:
+                pool_stats['timeouts'] += 1
+            raise
+        finally:
+            wait_ms = (time.perf_counter() - start) * 1000
+            with pool_stats_lock:
+                pool_stats['checkouts'] += 1
+                pool_stats['wait_ms_total'] += wait_ms
+                pool_stats['wait_ms_max'] = max(pool_stats['wait_ms_max'], wait_ms)
+                pool_stats['buckets'][bisect_left(WAIT_BUCKETS_MS, wait_ms)] += 1
+
+engine_options = {'pool_pre_ping': bool(pool_setting('POOL_PRE_PING')), 'pool_recycle': pool_setting('POOL_RECYCLE')}
+db_url = make_url(DATABASE_URL)
+# in-memory SQLite keeps SQLAlchemy's single-connection pool
+if not (db_url.get_backend_name() == 'sqlite' and db_url.database in (None, '', ':memory:')):
+    engine_options.update({
+        'poolclass':    TimedQueuePool,
+        'pool_size':    pool_setting('POOL_SIZE'),
+        'max_overflow': pool_setting('MAX_OVERFLOW'),
+        'pool_timeout': pool_setting('POOL_TIMEOUT'),
+    })
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options
+
 
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['UPLOAD_FOLDER'] = 'uploads'
@@ -49,6 +104,10 @@ os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
 # Database Model
 class LostItem(db.Model):
+    __table_args__ = (
+        # serves the newest-first listing and its keyset cursor
+        db.Index('ix_lost_item_created_id', 'created_at', 'id'),
+    )
     id = db.Column(db.String(36), primary_key=True)
     user_id = db.Column(db.String(128), nullable=False)
     item_name = db.Column(db.String(255), nullable=False)
@@ -75,6 +134,43 @@ class LostItem(db.Model):
             'created_at': self.created_at.isoformat()
         }
 
+# Versioned schema changes for tables that already exist; recorded in the
+# schema_version table shared with the library service (component 'lost_items').
+def _add_lost_item_indexes(conn):
+    existing = {ix['name'] for ix in inspect(conn).get_indexes(LostItem.__table__.name)}
+    for index in LostItem.__table__.indexes:
+        if index.name not in existing:
+            index.create(conn)
+
+MIGRATIONS = [
+    (1, 'lost_item created_at index', _add_lost_item_indexes),
+]
+
+schema_version = db.Table(
+    'schema_version',
+    db.Column('component',   db.String(64), primary_key=True),
+    db.Column('version',     db.Integer, primary_key=True),
+    db.Column('description', db.String(256), nullable=False),
+    db.Column('applied_at',  db.DateTime, nullable=False),
+)
+
+def migrate():
+    schema_version.create(db.engine, checkfirst=True)
+    with db.engine.connect() as conn:
+        done = set(conn.execute(
+            db.select(schema_version.c.version).where(schema_version.c.component == 'lost_items')
+        ).scalars())
+    for version, description, upgrade in MIGRATIONS:
+        if version in done:
+            continue
+        with db.engine.begin() as conn:
+            upgrade(conn)
+            conn.execute(schema_version.insert().values(
+                component='lost_items', version=version,
+                description=description, applied_at=datetime.utcnow()
+            ))
+
+
 @app.route('/api/report-item', methods=['POST'])
 def report_item():
     # Verify Firebase token
@@ -165,11 +261,52 @@ def fetch_items():
         return jsonify({'error': str(e)}), 500
 
 
+# Opaque keyset cursor over (created_at, id), newest first
+def encode_cursor(item):
+    raw = json.dumps([item.created_at.isoformat(), item.id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, item_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), item_id
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
 @app.route('/api/fetch-all-items', methods=['GET'])
 def fetch_all_items():
+    query = LostItem.query.order_by(LostItem.created_at.desc(), LostItem.id.desc())
+
+    # Legacy behaviour: everything as a bare list. `?after=` / `?limit=` opt into pages.
+    if 'after' not in request.args and 'limit' not in request.args:
+        try:
+            items = query.all()
+            return jsonify([item.serialize() for item in items]), 200
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+    limit = max(1, min(request.args.get('limit', 20, type=int) or 20, 100))
+    after = request.args.get('after')
+    if after:
+        try:
+            created_at, item_id = decode_cursor(after)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        query = query.filter(or_(
+            LostItem.created_at < created_at,
+            and_(LostItem.created_at == created_at, LostItem.id < item_id)
+        ))
+
     try:
-        items = LostItem.query.order_by(LostItem.created_at.desc()).all()
-        return jsonify([item.serialize() for item in items]), 200
+        items = query.limit(limit + 1).all()
+        next_cursor = encode_cursor(items[limit - 1]) if len(items) > limit else None
+        return jsonify({
+            'items':       [item.serialize() for item in items[:limit]],
+            'next_cursor': next_cursor,
+            'limit':       limit
+        }), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -183,7 +320,29 @@ def serve_image(filename):
 def healthcheck():
     return jsonify({"status": "ok", "database": "connected"})
 
+@app.route('/api/pool-stats')
+def get_pool_stats():
+    with pool_stats_lock:
+        checkouts = pool_stats['checkouts']
+        data = {
+            'checkouts':       checkouts,
+            'timeouts':        pool_stats['timeouts'],
+            'wait_ms_avg':     round(pool_stats['wait_ms_total'] / checkouts, 3) if checkouts else 0,
+            'wait_ms_max':     round(pool_stats['wait_ms_max'], 3),
+            'wait_ms_buckets': [{'le_ms': b, 'count': n} for b, n in zip(WAIT_BUCKETS_MS + (None,), pool_stats['buckets'])],
+        }
+    pool = pool_stats['pool']
+    if pool is not None:
+        data.update({
+            'size':        pool.size(),
+            'checked_out': pool.checkedout(),
+            'checked_in':  pool.checkedin(),
+            'overflow':    max(pool.overflow(), 0),
+        })
+    return jsonify(data)
+
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
+        migrate()
     app.run(debug=True, port=5000)